@@ -0,0 +1,18 @@
+"""
+Blender shot lab: virtual test conditions for the shot tracking cameras and their calibration.
+
+Submodules are imported on first access (shot_lab.projection ...), so importing the package costs nothing and
+only the Blender jobs and scene_builder need bpy, and only when they run.
+"""
+import importlib
+
+__all__ = ["bench", "bpy_standin", "calib_pics", "calib_poses", "calibration", "camera_rig", "cli", "frame_stack",
+           "instrument", "keyframes", "lens_remap", "projection", "recons", "render_cache", "render_farm",
+           "render_profiles", "roi_render", "sample_pics", "scene_builder", "shot_video", "soft_render",
+           "sphere_tracker", "stub_render", "sweep", "traj_bin", "traj_io", "trajectories", "triangulation"]
+
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module("." + name, __name__)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
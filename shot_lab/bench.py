@@ -0,0 +1,343 @@
+"""
+End-to-end benchmark suite: the synthetic shot goes through the whole chain (trajectory, keyframing, rendering by the
+two cameras of make_shot_video.py, tracking, chessboard calibration, triangulation) and is compared to its ground
+truth. Each stage is timed and its peak memory measured, the accuracy of the loop is measured in pixels and in
+Blender units, and the run is appended to a JSON lines history file then checked against a stored baseline.
+
+    shot-lab bench                                  (small problem, NumPy renderer on the bpy stand-in)
+    shot-lab bench --size medium --save_baseline    (store the reference run of this configuration)
+    shot-lab bench --size medium                    (exit code 1 when a stage got slower or the loop less accurate)
+    blender -b --python-expr "from shot_lab import bench; bench.main(['--renderer', 'blender'])"
+
+Without Blender the scene is built on bpy_standin and rendered by soft_render.py. The calibration pictures are
+rendered analytically (calibration.render_chessboard) whatever the renderer.
+"""
+import argparse
+import contextlib
+import datetime
+import hashlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+from . import calib_poses
+from . import calibration
+from . import projection
+from . import sphere_tracker
+from . import traj_io
+from . import trajectories
+from . import triangulation
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HISTORY = os.path.join(ROOT, ".bench", "history.jsonl")
+BASELINE = os.path.join(ROOT, ".bench", "baseline.json")
+
+SIZES = {"small": {"frames": 48, "res": 250, "calib_images": 8},
+         "medium": {"frames": 240, "res": 500, "calib_images": 20},
+         "large": {"frames": 1200, "res": 1000, "calib_images": 40}}
+DEFAULTS = {"traj": "double_sine", "traj_path": os.path.join(ROOT, "Trajectory.txt"), "fps": 24.,
+            "dist_param": 0.05, "renderer": "numpy", "samples": 2, "radius": 0.1, "inner": [6, 6]}
+STAGES = ("trajectory", "keyframes", "render", "track", "calib_render", "corners", "calibrate", "reconstruct")
+# accuracy metrics where a larger value is better, the others are errors
+HIGHER_IS_BETTER = ("tracked", "calib_images_used")
+# regression when value > baseline * (1 + relative) + absolute
+TOLERANCES = {"seconds": (0.25, 0.01), "peak_mb": (0.2, 1.), "accuracy": (0.1, 1e-6)}
+
+
+def make_config(size="small", **overrides):
+    """
+    :param size: SIZES name
+    :param overrides: settings replacing the size and DEFAULTS values (None values ignored)
+    :return: configuration dict
+    """
+    config = dict(DEFAULTS, size=size, **SIZES[size])
+    config.update({name: value for name, value in overrides.items() if value is not None})
+    return config
+
+
+def config_key(config):
+    """:return: digest of the configuration, runs are only compared to a baseline of the same configuration"""
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()[:16]
+
+
+class Stages:
+    """
+    Times the stages of a run, and measures the peak memory they allocate (tracemalloc) when memory is set.
+    A stage entered several times (once per camera) sums its times and keeps its largest peak.
+
+    :param memory: trace the allocations, slows the stages down
+    """
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.seconds = {}
+        self.peak_mb = {}
+
+    @contextlib.contextmanager
+    def __call__(self, name):
+        if self.memory:
+            # traces restarted: the peak is the one of the stage's own allocations
+            tracemalloc.stop()
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.) + time.perf_counter() - start
+            if self.memory:
+                self.peak_mb[name] = max(self.peak_mb.get(name, 0.), tracemalloc.get_traced_memory()[1] / 1e6)
+                tracemalloc.stop()
+
+
+def _builder(renderer):
+    from . import scene_builder
+    if renderer == "blender":
+        return scene_builder.SceneBuilder()
+    from . import bpy_standin
+    bpy = bpy_standin.BpyStandin()
+    return scene_builder.SceneBuilder(bpy=bpy, mathutils=bpy.mathutils)
+
+
+def _render(builder, config, camPos, rot_euler, frames):
+    """:return: (N, H, W) float32 frames of a camera"""
+    from . import soft_render
+    builder.camera(camPos, (0., 0., 0.), rot_euler=rot_euler)
+    builder.sun(camPos, (0., 0., 0.))
+    builder.lens_dist(config["dist_param"])
+    builder.render_settings(config["res"], config["res"], "", 'JPEG', 'BW')
+    if config["renderer"] == "blender":
+        from . import frame_stack
+        from . import render_profiles
+        builder.render_profile(render_profiles.DEFAULT)
+        return np.stack(list(frame_stack.viewer_frames(builder.scene, frames)))
+    return soft_render.Backend(builder, config["samples"]).frames(frames)
+
+
+def run(config, memory=False):
+    """
+    Run the chain once
+
+    :param config: make_config output
+    :param memory: measure the peak memory of the stages (slower, the timings of such a run are not kept)
+    :return: Stages, dict of accuracy metrics
+    """
+    from . import shot_video
+    stages = Stages(memory)
+    res = config["res"]
+    with stages("trajectory"):
+        if config["traj"] == "file":
+            traj = traj_io.load_traj(config["traj_path"])
+            traj_t, xyz = traj[:, 0], traj[:, 1:]
+            # filmed at the trajectory rate, like shot_recons.py
+            fps = 1. / np.median(np.diff(traj_t))
+        else:
+            fps = config["fps"]
+            traj_t = np.arange(config["frames"]) / fps
+            xyz = shot_video.make_doublesin_traj(config["frames"], config["traj"])
+    with stages("keyframes"):
+        builder = _builder(config["renderer"])
+        frames = builder.shot_film(traj_t, xyz, fps, config["radius"])
+    _, times = trajectories.frame_times(traj_t[0], traj_t[-1], fps)
+    truth = trajectories.interpolate(traj_t, xyz, times)
+    tracks = []
+    for name, (camPos, rot_euler) in shot_video.CAMERAS.items():
+        with stages("render"):
+            images = _render(builder, config, camPos, rot_euler, frames)
+        with stages("track"):
+            tracks.append(np.array(list(sphere_tracker.track(images)))[:, :2])
+        del images
+    inner = tuple(config["inner"])
+    square = 2. / (inner[0] + 3)
+    calib_cam = projection.Camera.look_at((0., 0., 5.), (0., 0., 0.), res, res, dist_param=config["dist_param"])
+    with stages("calib_render"):
+        boards = [calibration.render_chessboard(calib_cam, rotation, square, inner)
+                  for rotation in calib_poses.sobol_poses(config["calib_images"], max_tilt=np.pi / 5)]
+    with stages("corners"):
+        corners = calibration.find_corners_all(boards, inner, 1)
+    del boards
+    with stages("calibrate"):
+        calib = calibration.calibrate(corners, inner, square, res, res)
+    calib_err = calibration.compare(calib, calib_cam)
+    with stages("reconstruct"):
+        # the calibrated lens on the known camera poses
+        K = calib["K"]
+        lens = 0.5 * (K[0, 0] + K[1, 1]) * calib_cam.sensor_width / res
+        cameras = [projection.Camera.from_euler(camPos, rot_euler, res, res, lens=lens,
+                                                dist_param=calib["dist_param"])
+                   for camPos, rot_euler in shot_video.CAMERAS.values()]
+        X, reproj = triangulation.triangulate(np.stack(tracks), cameras)
+    valid = np.isfinite(X).all(axis=1)
+    err = np.linalg.norm(X[valid] - truth[valid], axis=1)
+    nan = float("nan")
+    accuracy = {"tracked": float(valid.mean()) if len(valid) else 0.,
+                "calib_images_used": int(calib["used"].sum()),
+                "calib_rms_px": float(calib["rms"]),
+                "focal_rel_err": abs(float(calib_err["focal_rel"])),
+                "center_err_px": float(calib_err["center_px"]),
+                "dist_param_err": abs(float(calib_err["dist_param"])),
+                "reproj_rms_px": float(np.sqrt(np.mean(reproj[:, valid] ** 2))) if valid.any() else nan,
+                "error_3d_rms": float(np.sqrt(np.mean(err ** 2))) if valid.any() else nan,
+                "error_3d_max": float(err.max()) if valid.any() else nan}
+    return stages, accuracy
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, check=True).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark(config, repeat=1, memory=True):
+    """
+    Run the chain: the fastest of repeat runs gives the stage timings, one more run traced by tracemalloc the peak
+    memory of each stage
+
+    :param config: make_config output
+    :param repeat: timed runs
+    :param memory: measure the peak memory
+    :return: history record (JSON serializable dict)
+    """
+    seconds = {}
+    for _ in range(repeat):
+        stages, accuracy = run(config)
+        for name, value in stages.seconds.items():
+            seconds[name] = min(seconds.get(name, value), value)
+    peak_mb = run(config, memory=True)[0].peak_mb if memory else {}
+    return {"date": datetime.datetime.now().isoformat(timespec="seconds"), "commit": _commit(),
+            "host": {"python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine(),
+                     "cpus": os.cpu_count()},
+            "key": config_key(config), "config": config,
+            "stages": {name: {"seconds": seconds[name], "peak_mb": peak_mb.get(name)} for name in STAGES},
+            "total_seconds": sum(seconds.values()), "accuracy": accuracy}
+
+
+def append_history(record, path=HISTORY):
+    """Append a run to the JSON lines history file"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a") as file:
+        file.write(json.dumps(record, sort_keys=True) + "\n")
+
+
+def load_history(path=HISTORY, key=None):
+    """
+    :param path: history file
+    :param key: only the runs of this configuration key
+    :return: list of records, oldest first
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path) as file:
+        records = [json.loads(line) for line in file if line.strip()]
+    return [record for record in records if key is None or record["key"] == key]
+
+
+def load_baseline(path=BASELINE):
+    """:return: dict configuration key -> baseline record"""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_baseline(record, path=BASELINE):
+    """Store a run as the baseline of its configuration, the baselines of the other configurations are kept"""
+    baselines = load_baseline(path)
+    baselines[record["key"]] = record
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as file:
+        json.dump(baselines, file, indent=1, sort_keys=True)
+
+
+def _worse(value, base, tolerance, higher_is_better=False):
+    if value is None or base is None or not np.isfinite(base):
+        return False
+    relative, absolute = tolerance
+    if not np.isfinite(value):
+        return True
+    if higher_is_better:
+        return value < base * (1. - relative) - absolute
+    return value > base * (1. + relative) + absolute
+
+
+def regressions(record, baseline, tolerances=TOLERANCES):
+    """
+    :param record: benchmark output
+    :param baseline: record of the same configuration
+    :param tolerances: TOLERANCES like dict of (relative, absolute) tolerances
+    :return: list of (metric, value, baseline value) that got worse
+    """
+    worse = []
+    for name, stage in record["stages"].items():
+        base = baseline["stages"].get(name, {})
+        for metric in ("seconds", "peak_mb"):
+            if _worse(stage[metric], base.get(metric), tolerances[metric]):
+                worse.append(("%s.%s" % (name, metric), stage[metric], base[metric]))
+    for metric, value in record["accuracy"].items():
+        base = baseline["accuracy"].get(metric)
+        if _worse(value, base, tolerances["accuracy"], metric in HIGHER_IS_BETTER):
+            worse.append((metric, value, base))
+    return worse
+
+
+def report(record, baseline=None):
+    """:return: text table of a run, next to its baseline"""
+    lines = ["%s (%s), %d frames %dx%d, %s renderer, commit %s"
+             % (record["config"]["size"], record["key"], record["config"]["frames"], record["config"]["res"],
+                record["config"]["res"], record["config"]["renderer"], record["commit"])]
+    for name, stage in record["stages"].items():
+        base = (baseline or {}).get("stages", {}).get(name)
+        lines.append("  %-13s %8.3f s %s %s"
+                     % (name, stage["seconds"], "" if stage["peak_mb"] is None else "%8.1f MB" % stage["peak_mb"],
+                        "" if base is None else "(baseline %.3f s)" % base["seconds"]))
+    lines.append("  %-13s %8.3f s" % ("total", record["total_seconds"]))
+    for metric, value in record["accuracy"].items():
+        base = (baseline or {}).get("accuracy", {}).get(metric)
+        lines.append("  %-17s %.4g %s" % (metric, value, "" if base is None else "(baseline %.4g)" % base))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="shot-lab bench", description="End-to-end speed and accuracy benchmark")
+    parser.add_argument("--size", default="small", choices=sorted(SIZES))
+    parser.add_argument("--frames", type=int, default=None, help="trajectory samples, one per camera frame")
+    parser.add_argument("--res", type=int, default=None, help="image resolution (square)")
+    parser.add_argument("--calib_images", type=int, default=None, help="calibration pictures")
+    parser.add_argument("--traj", default=None, choices=("line", "double_sine", "file"),
+                        help="make_doublesin_traj kind, or 'file' for --traj_path")
+    parser.add_argument("--traj_path", default=None, help="trajectory file (t, X, Y, Z), Trajectory.txt by default")
+    parser.add_argument("--dist_param", type=float, default=None, help="Lensdist distortion parameter")
+    parser.add_argument("--renderer", default=None, choices=("numpy", "blender"),
+                        help="soft_render.py on the bpy stand-in, or Blender (run inside blender -b)")
+    parser.add_argument("--repeat", type=int, default=1, help="timed runs, the fastest is kept")
+    parser.add_argument("--no_memory", action="store_true", help="skip the traced run measuring the peak memory")
+    parser.add_argument("--history", default=HISTORY, help="JSON lines history file, '' to not record the run")
+    parser.add_argument("--baseline", default=BASELINE, help="baseline file")
+    parser.add_argument("--save_baseline", action="store_true", help="store this run as the baseline")
+    args = parser.parse_args(argv)
+    config = make_config(args.size, frames=args.frames, res=args.res, calib_images=args.calib_images,
+                         traj=args.traj, traj_path=args.traj_path, dist_param=args.dist_param, renderer=args.renderer)
+    record = benchmark(config, args.repeat, not args.no_memory)
+    baseline = load_baseline(args.baseline).get(record["key"])
+    print(report(record, baseline))
+    if args.history:
+        append_history(record, args.history)
+    if args.save_baseline:
+        save_baseline(record, args.baseline)
+        print("baseline saved to %s" % args.baseline)
+        return 0
+    if baseline is None:
+        print("no baseline for this configuration, store one with --save_baseline")
+        return 0
+    worse = regressions(record, baseline)
+    for metric, value, base in worse:
+        print("REGRESSION %s: %.4g (baseline %.4g)" % (metric, value, base))
+    return 1 if worse else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,556 @@
+"""
+Lightweight pure-Python stand-in for the parts of the bpy API used by the lab scripts.
+Only meant to exercise and time the scripting logic without Blender: nothing is rendered.
+
+Data blocks count their users like Blender does (objects using a mesh, meshes using a material, fake users...),
+so that the data left behind by the scripts can be checked.
+"""
+import bisect
+from types import SimpleNamespace
+
+
+class Collection(list):
+    """
+    bpy_prop_collection stand-in: a list that can also be indexed by name
+    """
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            for elem in self:
+                if elem.name == key:
+                    return elem
+            raise KeyError(key)
+        return list.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        for elem in self:
+            if elem.name == key:
+                return elem
+        return default
+
+    def keys(self):
+        return [elem.name for elem in self]
+
+
+# handle types by raw (DNA) value, as foreach_get/foreach_set see them
+HANDLE_TYPES = ('FREE', 'AUTO', 'VECTOR', 'ALIGNED', 'AUTO_CLAMPED')
+
+
+class Keyframe:
+    def __init__(self, frame=0., value=0.):
+        self.co = [frame, value]
+        self.handle_left = [frame, value]
+        self.handle_right = [frame, value]
+        self.handle_left_type = 'AUTO_CLAMPED'
+        self.handle_right_type = 'AUTO_CLAMPED'
+
+
+class KeyframePoints(Collection):
+    def add(self, count):
+        self.extend(Keyframe() for _ in range(count))
+
+    def insert(self, frame, value):
+        keyframe = Keyframe(frame, value)
+        frames = [elem.co[0] for elem in self]
+        pos = bisect.bisect_left(frames, frame)
+        if pos < len(self) and frames[pos] == frame:
+            self[pos] = keyframe
+        else:
+            list.insert(self, pos, keyframe)
+        return keyframe
+
+    def foreach_set(self, attr, seq):
+        if attr in ("handle_left_type", "handle_right_type"):
+            for i, elem in enumerate(self):
+                setattr(elem, attr, HANDLE_TYPES[seq[i]])
+            return
+        if attr not in ("co", "handle_left", "handle_right"):
+            raise AttributeError(attr)
+        for i, elem in enumerate(self):
+            setattr(elem, attr, [seq[2 * i], seq[2 * i + 1]])
+
+    def foreach_get(self, attr, seq):
+        if attr in ("handle_left_type", "handle_right_type"):
+            for i, elem in enumerate(self):
+                seq[i] = HANDLE_TYPES.index(getattr(elem, attr))
+            return
+        if attr not in ("co", "handle_left", "handle_right"):
+            raise AttributeError(attr)
+        for i, elem in enumerate(self):
+            seq[2 * i], seq[2 * i + 1] = getattr(elem, attr)
+
+
+class FCurve:
+    def __init__(self, data_path, index):
+        self.data_path = data_path
+        self.array_index = index
+        self.keyframe_points = KeyframePoints()
+        self._frames = []
+
+    def update(self):
+        self.keyframe_points.sort(key=lambda elem: elem.co[0])
+        self._frames = [elem.co[0] for elem in self.keyframe_points]
+
+    def evaluate(self, frame):
+        """
+        Bezier interpolation of the keyframes with 'FREE' handles, taking the curve parameter linear in frame
+        (exact for handles a third of the way to the neighbour keys), linear interpolation otherwise
+        (Blender would use the automatic handles)
+        """
+        points = self.keyframe_points
+        if not points:
+            return 0.
+        pos = bisect.bisect_right(self._frames, frame)
+        if pos == 0:
+            return points[0].co[1]
+        if pos == len(points):
+            return points[-1].co[1]
+        p0, p1 = points[pos - 1], points[pos]
+        (f0, v0), (f1, v1) = p0.co, p1.co
+        s = (frame - f0) / (f1 - f0)
+        if p0.handle_right_type == 'FREE' and p1.handle_left_type == 'FREE':
+            return ((1 - s) ** 3 * v0 + 3 * (1 - s) ** 2 * s * p0.handle_right[1]
+                    + 3 * (1 - s) * s ** 2 * p1.handle_left[1] + s ** 3 * v1)
+        return v0 + (v1 - v0) * s
+
+
+class FCurves(Collection):
+    def new(self, data_path, index=0, action_group=""):
+        if self.find(data_path, index=index) is not None:
+            raise RuntimeError("F-Curve '%s[%d]' already exists" % (data_path, index))
+        fcurve = FCurve(data_path, index)
+        self.append(fcurve)
+        return fcurve
+
+    def find(self, data_path, index=0):
+        for fcurve in self:
+            if fcurve.data_path == data_path and fcurve.array_index == index:
+                return fcurve
+        return None
+
+
+class ID:
+    """Data block with a user count"""
+    def __init__(self, name):
+        self.name = name
+        self._users = 0
+        self.use_fake_user = False
+
+    @property
+    def users(self):
+        return self._users + int(self.use_fake_user)
+
+
+def _retarget(old, new):
+    """Move a user from the old data block to the new one"""
+    if old is not None:
+        old._users -= 1
+    if new is not None:
+        new._users += 1
+    return new
+
+
+class Action(ID):
+    def __init__(self, name):
+        ID.__init__(self, name)
+        self.fcurves = FCurves()
+
+
+class IDCollection(Collection):
+    """bpy.data.<type> stand-in"""
+    def __init__(self, factory):
+        Collection.__init__(self)
+        self._factory = factory
+
+    def new(self, name, *args, **kwargs):
+        block = self._factory(name, *args, **kwargs)
+        self.append(block)
+        return block
+
+    def remove(self, block, do_unlink=True):
+        list.remove(self, block)
+        # the data blocks it used lose a user
+        if hasattr(block, "_release"):
+            block._release()
+
+
+class Images(IDCollection):
+    def load(self, filepath, check_existing=False):
+        if check_existing:
+            for image in self:
+                if image.filepath == filepath:
+                    return image
+        image = self.new(filepath.replace("\\", "/").split("/")[-1])
+        image.filepath = filepath
+        return image
+
+
+class Image(ID):
+    def __init__(self, name):
+        ID.__init__(self, name)
+        self.filepath = ""
+
+    @property
+    def filepath_raw(self):
+        return self.filepath
+
+
+class MaterialSlots(Collection):
+    """Material list of a mesh, counting its users"""
+    def append(self, material):
+        _retarget(None, material)
+        list.append(self, material)
+
+    def __setitem__(self, index, material):
+        _retarget(self[index], material)
+        list.__setitem__(self, index, material)
+
+    def clear(self):
+        for material in self:
+            _retarget(material, None)
+        del self[:]
+
+
+class Mesh(ID):
+    def __init__(self, name):
+        ID.__init__(self, name)
+        self.materials = MaterialSlots()
+        self.vertices = Collection()
+        self.polygons = Collection()
+
+    def _release(self):
+        self.materials.clear()
+
+
+class Socket:
+    def __init__(self, name, default_value=0.):
+        self.name = name
+        self.default_value = default_value
+
+
+class Node:
+    def __init__(self, node_type, name, inputs=(), outputs=()):
+        self.bl_idname = node_type
+        self.name = name
+        self.inputs = Collection(Socket(name) for name in inputs)
+        self.outputs = Collection(Socket(name) for name in outputs)
+        self.texture_mapping = SimpleNamespace(scale=(1., 1., 1.), translation=(0., 0., 0.))
+        self.use_projector = False
+        self._image = None
+
+    @property
+    def image(self):
+        return self._image
+
+    @image.setter
+    def image(self, image):
+        self._image = _retarget(self._image, image)
+
+
+# default name, inputs and outputs of the node types used by the scripts
+NODE_TYPES = {"CompositorNodeRLayers": ("Render Layers", (), ("Image", "Alpha")),
+              "CompositorNodeComposite": ("Composite", ("Image", "Alpha"), ()),
+              "CompositorNodeLensdist": ("Lens Distortion", ("Image", "Distort", "Dispersion"), ("Image",)),
+              "ShaderNodeBsdfPrincipled": ("Principled BSDF", ("Base Color", "Subsurface", "Subsurface Radius",
+                                                               "Subsurface Color", "Metallic", "Specular"), ("BSDF",)),
+              "ShaderNodeOutputMaterial": ("Material Output", ("Surface",), ()),
+              "ShaderNodeTexImage": ("Image Texture", ("Vector",), ("Color", "Alpha"))}
+
+
+class Nodes(Collection):
+    def new(self, node_type):
+        name, inputs, outputs = NODE_TYPES[node_type]
+        taken = set(self.keys())
+        base, count = name, 0
+        while name in taken:
+            count += 1
+            name = "%s.%03d" % (base, count)
+        node = Node(node_type, name, inputs, outputs)
+        self.append(node)
+        return node
+
+    def remove(self, node):
+        node.image = None
+        list.remove(self, node)
+
+
+class NodeTree:
+    def __init__(self, node_types=()):
+        self.nodes = Nodes()
+        self.links = SimpleNamespace(new=lambda *sockets: sockets)
+        for node_type in node_types:
+            self.nodes.new(node_type)
+
+
+class Material(ID):
+    def __init__(self, name):
+        ID.__init__(self, name)
+        self.diffuse_color = [0.8, 0.8, 0.8, 1.]
+        self.node_tree = None
+        self._use_nodes = False
+
+    @property
+    def use_nodes(self):
+        return self._use_nodes
+
+    @use_nodes.setter
+    def use_nodes(self, value):
+        self._use_nodes = value
+        if value and self.node_tree is None:
+            self.node_tree = NodeTree(("ShaderNodeBsdfPrincipled", "ShaderNodeOutputMaterial"))
+
+    def _release(self):
+        if self.node_tree is not None:
+            for node in self.node_tree.nodes:
+                node.image = None
+
+
+class Camera(ID):
+    def __init__(self, name):
+        ID.__init__(self, name)
+        self.type = 'PERSP'
+        self.lens = 50.
+        self.sensor_width = 36.
+        self.sensor_fit = 'AUTO'
+        self.shift_x = 0.
+        self.shift_y = 0.
+
+
+class Light(ID):
+    def __init__(self, name, type='POINT'):
+        ID.__init__(self, name)
+        self.type = type
+        self.shadow_soft_size = 0.25
+        # bpy.data.lights.new defaults, whatever the type
+        self.energy = 10.
+
+
+class AnimData:
+    def __init__(self):
+        self._action = None
+
+    @property
+    def action(self):
+        return self._action
+
+    @action.setter
+    def action(self, action):
+        self._action = _retarget(self._action, action)
+
+
+class Object(ID):
+    def __init__(self, name, data=None, location=(0., 0., 0.)):
+        ID.__init__(self, name)
+        self.location = list(location)
+        self.scale = [1., 1., 1.]
+        self.matrix_world = [[float(i == j) for j in range(4)] for i in range(4)]
+        self.hide_render = False
+        self.hide_viewport = False
+        self.animation_data = None
+        self._object_data = _retarget(None, data)
+        self._data = None
+
+    @property
+    def type(self):
+        return {Mesh: 'MESH', Camera: 'CAMERA', Light: 'LIGHT'}.get(type(self._object_data), 'EMPTY')
+
+    @property
+    def data(self):
+        return self._object_data
+
+    @data.setter
+    def data(self, data):
+        self._object_data = _retarget(self._object_data, data)
+
+    def _release(self):
+        self.data = None
+        if self.animation_data is not None:
+            self.animation_data.action = None
+
+    def animation_data_create(self):
+        if self.animation_data is None:
+            self.animation_data = AnimData()
+        return self.animation_data
+
+    def keyframe_insert(self, data_path, frame=None):
+        if frame is None:
+            frame = self._data.scene.frame_current
+        anim = self.animation_data_create()
+        if anim.action is None:
+            anim.action = self._data.actions.new(self.name + "Action")
+        for index, value in enumerate(getattr(self, data_path)):
+            fcurve = anim.action.fcurves.find(data_path, index=index)
+            if fcurve is None:
+                fcurve = anim.action.fcurves.new(data_path, index=index)
+            fcurve.keyframe_points.insert(frame, value)
+            fcurve.update()
+        return True
+
+
+class SceneObjects(Collection):
+    """Objects linked to the scene collection, each link is a user"""
+    def link(self, obj):
+        _retarget(None, obj)
+        self.append(obj)
+
+    def unlink(self, obj):
+        _retarget(obj, None)
+        list.remove(self, obj)
+
+
+class Render(SimpleNamespace):
+    EXTENSIONS = {'PNG': ".png", 'JPEG': ".jpg", 'OPEN_EXR': ".exr"}
+
+    @property
+    def file_extension(self):
+        return self.EXTENSIONS[self.image_settings.file_format]
+
+    def frame_path(self, frame):
+        """output path of a frame, the number appended on 4 digits when the path has no '#'"""
+        path = self.filepath
+        if "#" in path:
+            count = path.count("#")
+            return path.replace("#" * count, "%0*d" % (count, frame)) + self.file_extension
+        return path + "%04d" % frame + self.file_extension
+
+
+class Scene:
+    def __init__(self, data, name="Scene"):
+        self.name = name
+        self.objects = SceneObjects()
+        self.collection = SimpleNamespace(objects=self.objects)
+        self.frame_start = 1
+        self.frame_end = 250
+        self.frame_current = 1
+        self.camera = None
+        self.node_tree = None
+        self._use_nodes = False
+        self.frame_step = 1
+        self.world = SimpleNamespace(color=(0.05, 0.05, 0.05))
+        self.view_settings = SimpleNamespace(view_transform='AgX', look='None', exposure=0., gamma=1.)
+        self.render = Render(resolution_x=1920, resolution_y=1080, resolution_percentage=100, filepath="",
+                             fps=24, fps_base=1., use_motion_blur=False, motion_blur_shutter=0.5,
+                             engine='BLENDER_EEVEE', threads_mode='AUTO', threads=1, use_persistent_data=False,
+                             use_file_extension=True, use_border=False, use_crop_to_border=False, border_min_x=0.,
+                             border_max_x=1., border_min_y=0., border_max_y=1.,
+                             image_settings=SimpleNamespace(file_format='PNG', color_mode='RGBA', quality=90))
+        self._data = data
+
+    @property
+    def use_nodes(self):
+        return self._use_nodes
+
+    @use_nodes.setter
+    def use_nodes(self, value):
+        self._use_nodes = value
+        if value and self.node_tree is None:
+            self.node_tree = NodeTree(("CompositorNodeRLayers", "CompositorNodeComposite"))
+
+    def frame_set(self, frame):
+        """Evaluates the animation of every object like the depsgraph update does"""
+        self.frame_current = frame
+        for obj in self.objects:
+            if obj.animation_data is None or obj.animation_data.action is None:
+                continue
+            for fcurve in obj.animation_data.action.fcurves:
+                getattr(obj, fcurve.data_path)[fcurve.array_index] = fcurve.evaluate(frame)
+
+
+class Objects(IDCollection):
+    def new(self, name, data=None, location=(0., 0., 0.)):
+        obj = IDCollection.new(self, name, data, location)
+        obj._data = self._bpy_data
+        return obj
+
+    def remove(self, obj, do_unlink=True):
+        if do_unlink:
+            for scene in self._scenes:
+                if obj in scene.objects:
+                    scene.objects.unlink(obj)
+        IDCollection.remove(self, obj)
+
+
+class Scenes(Collection):
+    """bpy.data.scenes stand-in, the scenes sharing the objects linked to them"""
+    def new(self, name):
+        scene = Scene(self._bpy_data, name)
+        self.append(scene)
+        return scene
+
+    def remove(self, scene):
+        for obj in list(scene.objects):
+            scene.objects.unlink(obj)
+        list.remove(self, scene)
+
+
+class Data:
+    def __init__(self):
+        self.actions = IDCollection(Action)
+        self.objects = Objects(Object)
+        self.meshes = IDCollection(Mesh)
+        self.materials = IDCollection(Material)
+        self.images = Images(Image)
+        self.cameras = IDCollection(Camera)
+        self.lights = IDCollection(Light)
+        self.scenes = Scenes()
+        self.scenes._bpy_data = self
+        self.scene = self.scenes.new("Scene")
+        self.objects._scenes = self.scenes
+        self.objects._bpy_data = self
+
+
+class Context:
+    def __init__(self, data):
+        self.scene = data.scene
+        self.object = None
+
+
+class Ops:
+    """bpy.ops.mesh primitives"""
+    def __init__(self, standin):
+        self.mesh = SimpleNamespace(primitive_uv_sphere_add=lambda radius=1., location=(0., 0., 0.), **kw:
+                                    standin._add_primitive("Sphere", location),
+                                    primitive_cube_add=lambda size=2., location=(0., 0., 0.), **kw:
+                                    standin._add_primitive("Cube", location))
+
+
+class Matrix(list):
+    """mathutils.Matrix stand-in"""
+    def __init__(self, rows):
+        list.__init__(self, [list(row) for row in rows])
+
+
+class BpyStandin:
+    """
+    Holds the bpy.data, bpy.context and bpy.ops stand-ins, and a mathutils stand-in
+    """
+    def __init__(self):
+        self.data = Data()
+        self.context = Context(self.data)
+        self.ops = Ops(self)
+        self.mathutils = SimpleNamespace(Matrix=Matrix)
+        self.path = SimpleNamespace(abspath=lambda path: path)
+
+    def add_object(self, name, location=(0., 0., 0.), data=None):
+        """
+        Link a new object to the scene
+
+        :param name: object name
+        :param location: object location triplet
+        :param data: object data (mesh, camera, light)
+        :return: Object
+        """
+        obj = self.data.objects.new(name, data, location)
+        self.data.scene.objects.link(obj)
+        return obj
+
+    def _add_primitive(self, name, location):
+        obj = self.add_object(name, location, self.data.meshes.new(name))
+        self.context.object = obj
+        return {'FINISHED'}
+
+    def count(self):
+        """
+        :return: dict of the number of data blocks per bpy.data collection
+        """
+        return {name: len(getattr(self.data, name)) for name in ("objects", "meshes", "materials", "images",
+                                                                   "cameras", "lights", "actions")}
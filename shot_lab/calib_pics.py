@@ -0,0 +1,79 @@
+"""
+Generate calibration pictures for camera intrisinc parameters calibration: moves a 7x7 chessboard in front of a camera
+with different angle.
+
+    blender -b -P make_calib_pic.py -- --dist_param 0.05 --pose_set sobol --out lens_dist_calib
+"""
+import argparse
+import os
+import numpy as np
+from . import calib_poses
+from . import cli
+from . import instrument
+from . import projection
+from . import render_cache
+from . import render_profiles
+from . import scene_builder
+from . import soft_render
+
+
+def parse_args(argv=None):
+    """
+    :param argv: command line, the options follow '--'
+    :return: settings namespace
+    """
+    rep = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(prog="make_calib_pic.py", description="Render the chessboard calibration pictures")
+    parser.add_argument("--L", type=float, default=2., help="plate size (bu)")
+    parser.add_argument("--h", type=float, default=0.1, help="plate height (bu)")
+    parser.add_argument("--resx", type=int, default=500)
+    parser.add_argument("--resy", type=int, default=500)
+    parser.add_argument("--dist_param", type=float, default=0., help="Lensdist distortion parameter")
+    render_profiles.add_argument(parser)
+    parser.add_argument("--cam_pos", type=cli.triplet, default=(0., 0., 5.), help="camera position 'x,y,z'")
+    parser.add_argument("--pose_set", default="legacy", choices=("legacy", "random", "sobol", "coverage"),
+                        help="see calib_poses.py")
+    parser.add_argument("--num_poses", type=int, default=20)
+    parser.add_argument("--chess_path", default=rep + "/../sources/chessboard.png")
+    parser.add_argument("--out", default=rep + "/../lens_dist_calib", help="output directory")
+    return cli.parse_job_args(parser, argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    L = args.L
+    f = args.h/L
+    dist_param = args.dist_param
+    camPos = tuple(args.cam_pos)
+    render_path = args.out
+    shard = args.shard
+    if shard is not None:
+        # render_farm.py worker: only the poses of the shard
+        render_path = shard['out_dir']
+
+    builder = scene_builder.SceneBuilder()
+    builder.sun((0., 0., 5.), (0., 10., 0.), radius=None)
+    builder.camera(camPos, (0., 0., 0.))
+    builder.lens_dist(dist_param)
+    builder.render_profile(args.render_profile, args.render_threads)
+    backend = soft_render.backend(args.render_backend, builder)
+
+    view = projection.Camera.look_at(camPos, (0., 0., 0.), args.resx, args.resy, dist_param=dist_param)
+    rotations = calib_poses.make_poses(args.pose_set, args.num_poses, view, L=L, h=f)
+    if shard is None:
+        # the same pose set in every shard: reported by the unsharded run only
+        report = calib_poses.coverage_report(rotations, view, L=L, h=f)
+        print("%-8s %5d poses: coverage %.2f, fully visible %.2f, tilt %.1f-%.1f deg, spread %.3f"
+              % (args.pose_set, len(rotations), report["image_coverage"], report["fully_visible"],
+                 report["tilt_min"], report["tilt_max"], report["normal_spread"]))
+    poses = calib_poses.pose_matrices(rotations, np.eye(4))
+
+    for i, pose in enumerate(poses):
+        if shard is None or i in shard['poses']:
+            with instrument.span("calib_pics.pose", pose=i):
+                builder.plate(L, f, args.chess_path, matrix_world=pose, specular=0.)
+                builder.render_settings(args.resx, args.resy, render_path+"/ang_"+str(i)+".png", 'PNG', 'BW')
+                render_cache.render_still(backend=backend)
+    print(builder.report())
+    if render_cache.default_cache() is not None:
+        print(render_cache.default_cache().stats_line())
@@ -0,0 +1,255 @@
+"""
+Calibration pose planning: all the chessboard plate orientations of a calibration set are computed at once as a
+(n, 3, 3) batch of rotation matrices, then assigned to the plate matrix_world, instead of rotating and un-rotating
+the plate with bpy.ops.transform.rotate for every picture.
+
+A pose is a tilt of the plate normal away from the camera axis (tilt angle, tilt direction azimuth) followed by
+a yaw about the plate normal.
+"""
+import sys
+import time
+import numpy as np
+from . import projection
+
+
+def axis_angle(axes, angles):
+    """
+    Batched Rodrigues formula
+
+    :param axes: (n, 3) unit rotation axes
+    :param angles: (n,) angles in radians
+    :return: (n, 3, 3) rotation matrices
+    """
+    axes = np.asarray(axes, dtype=float)
+    c, s = np.cos(angles)[:, None, None], np.sin(angles)[:, None, None]
+    cross = np.zeros((len(axes), 3, 3))
+    cross[:, 0, 1], cross[:, 0, 2], cross[:, 1, 2] = -axes[:, 2], axes[:, 1], -axes[:, 0]
+    cross -= cross.transpose(0, 2, 1)
+    outer = axes[:, :, None] * axes[:, None, :]
+    return c * np.eye(3) + s * cross + (1. - c) * outer
+
+
+def tilt_rotations(tilt, azimuth, yaw):
+    """
+    :param tilt: (n,) angle between the plate normal and the Z axis
+    :param azimuth: (n,) direction of the tilt in the XY plane
+    :param yaw: (n,) rotation about the Z axis applied before tilting
+    :return: (n, 3, 3) rotation matrices
+    """
+    tilt, azimuth, yaw = np.broadcast_arrays(*(np.asarray(v, dtype=float).ravel() for v in (tilt, azimuth, yaw)))
+    # tilting toward the azimuth direction is a rotation about the horizontal axis orthogonal to it
+    axes = np.column_stack((-np.sin(azimuth), np.cos(azimuth), np.zeros(len(tilt))))
+    return axis_angle(axes, tilt) @ axis_angle(np.tile([0., 0., 1.], (len(yaw), 1)), yaw)
+
+
+def legacy_poses(n=20):
+    """
+    The poses of the former make_calib_pic.py loop: bpy.ops.transform.rotate about the global Y, X then Z axes
+    (projection.ops_rotate)
+
+    :param n: number of poses
+    :return: (n, 3, 3) rotation matrices
+    """
+    angles = np.linspace(-np.pi/4, np.pi/4, n)
+    ang_pert = np.linspace(-np.pi/12, np.pi/12, n)
+    ang2 = (-1.)**np.arange(n) * ang_pert
+    return np.array([projection.ops_rotate(a, 'Z') @ projection.ops_rotate(b, 'X') @ projection.ops_rotate(c, 'Y')
+                     for a, b, c in zip(angles, ang2, ang_pert)])
+
+
+def _from_unit(samples, max_tilt, max_yaw):
+    """Map (n, 3) samples of the unit cube to poses with an area-uniform tilt direction"""
+    cos_tilt = 1. - samples[:, 0] * (1. - np.cos(max_tilt))
+    return tilt_rotations(np.arccos(cos_tilt), 2 * np.pi * samples[:, 1], max_yaw * (2 * samples[:, 2] - 1.))
+
+
+def random_poses(n, max_tilt=np.pi/4, max_yaw=np.pi/4, seed=0):
+    """
+    Uniformly random poses
+
+    :param n: number of poses
+    :param max_tilt: largest angle between the plate normal and the camera axis
+    :param max_yaw: largest rotation about the plate normal
+    :param seed: random seed
+    :return: (n, 3, 3) rotation matrices
+    """
+    return _from_unit(np.random.default_rng(seed).random((n, 3)), max_tilt, max_yaw)
+
+
+def sobol(n, skip=1):
+    """
+    First points of the 3D Sobol sequence (Joe and Kuo direction numbers)
+
+    :param n: number of points
+    :param skip: number of leading points dropped (the first one is the origin)
+    :return: (n, 3) points of the unit cube
+    """
+    bits = 32
+    v = np.zeros((3, bits), dtype=np.uint64)
+    k = np.arange(bits, dtype=np.uint64)
+    v[0] = np.uint64(1) << (np.uint64(bits - 1) - k)
+    # dimension 2: x + 1 (s=1, m=1), dimension 3: x^2 + x + 1 (s=2, a=1, m=1,3)
+    v[1, 0] = 1 << (bits - 1)
+    for i in range(1, bits):
+        v[1, i] = v[1, i - 1] ^ (v[1, i - 1] >> np.uint64(1))
+    v[2, 0], v[2, 1] = 1 << (bits - 1), 3 << (bits - 2)
+    for i in range(2, bits):
+        v[2, i] = v[2, i - 1] ^ v[2, i - 2] ^ (v[2, i - 2] >> np.uint64(2))
+    idx = np.arange(skip, skip + n, dtype=np.uint64)
+    gray = idx ^ (idx >> np.uint64(1))
+    x = np.zeros((n, 3), dtype=np.uint64)
+    for bit in range(bits):
+        mask = ((gray >> np.uint64(bit)) & np.uint64(1)).astype(bool)
+        x[mask] ^= v[:, bit]
+    return x / float(1 << bits)
+
+
+def sobol_poses(n, max_tilt=np.pi/4, max_yaw=np.pi/4, skip=1):
+    """
+    Low discrepancy poses
+
+    :param n: number of poses
+    :param max_tilt: largest angle between the plate normal and the camera axis
+    :param max_yaw: largest rotation about the plate normal
+    :param skip: number of leading Sobol points dropped
+    :return: (n, 3, 3) rotation matrices
+    """
+    return _from_unit(sobol(n, skip), max_tilt, max_yaw)
+
+
+def square_size(L=2., inner=(6, 6)):
+    """
+    :param L: plate size (bu)
+    :param inner: number of inner corners, the chessboard has inner + 1 squares across the plate face
+    :return: chessboard square size (bu)
+    """
+    return L / (inner[0] + 1)
+
+
+def project_corners(rotations, cam, L=2., h=0.05, inner=(6, 6)):
+    """
+    Image position of the chessboard inner corners for every pose, in one batched projection
+
+    :param rotations: (n, 3, 3) plate orientations
+    :param cam: projection.Camera
+    :param L: plate size (bu)
+    :param h: plate height to length ratio
+    :param inner: number of inner corners, a 7x7 squares chessboard covering the plate face by default
+    :return: (n, inner[1], inner[0], 2) pixel coordinates, (n, inner[1], inner[0]) visibility mask
+    """
+    corners = projection.chessboard_corners(square_size(L, inner), inner, z=L * h / 2.)
+    world = np.einsum("nij,yxj->nyxi", rotations, corners)
+    uv, depth = cam.project(world)
+    # the corners of a plate seen from behind are not visible
+    facing = np.einsum("ni,ni->n", rotations[:, :, 2], cam.location[None] - world[:, 0, 0]) > 0
+    return uv, cam.in_view(uv, depth) & facing[:, None, None]
+
+
+def _cells(uv, visible, cam, grid):
+    """(n, grid*grid) occupancy of the image cells by the visible corners of each pose"""
+    n = len(uv)
+    col = np.clip((uv[..., 0] / cam.resx * grid).astype(int), 0, grid - 1)
+    row = np.clip((uv[..., 1] / cam.resy * grid).astype(int), 0, grid - 1)
+    cells = np.zeros((n, grid * grid), dtype=bool)
+    pose = np.broadcast_to(np.arange(n)[:, None, None], visible.shape)
+    cells[pose[visible], (row * grid + col)[visible]] = True
+    return cells
+
+
+def coverage_poses(n, cam, max_tilt=np.pi/4, max_yaw=np.pi/4, candidates=4096, grid=10, **plate):
+    """
+    Greedy coverage-optimized set: among Sobol candidates, repeatedly pick the pose whose corners fill the most
+    image cells not covered yet, ties broken by the distance to the already chosen plate normals
+
+    :param n: number of poses
+    :param cam: projection.Camera
+    :param max_tilt: largest angle between the plate normal and the camera axis
+    :param max_yaw: largest rotation about the plate normal
+    :param candidates: number of candidate poses
+    :param grid: image split in grid x grid cells
+    :param plate: plate geometry given to project_corners
+    :return: (n, 3, 3) rotation matrices
+    """
+    pool = sobol_poses(candidates, max_tilt, max_yaw)
+    uv, visible = project_corners(pool, cam, **plate)
+    cells = _cells(uv, visible, cam, grid)
+    usable = visible.all(axis=(1, 2))
+    normals = pool[:, :, 2]
+    covered = np.zeros(grid * grid, dtype=bool)
+    dist = np.full(candidates, 2.)
+    chosen = []
+    for _ in range(n):
+        gain = (cells & ~covered).sum(axis=1) + dist / 2.
+        gain[~usable] = -1.
+        gain[chosen] = -1.
+        best = int(np.argmax(gain))
+        chosen.append(best)
+        covered |= cells[best]
+        dist = np.minimum(dist, np.linalg.norm(normals - normals[best], axis=1))
+    return pool[chosen]
+
+
+def coverage_report(rotations, cam, grid=10, **plate):
+    """
+    How well a pose set covers the view space
+
+    :param rotations: (n, 3, 3) plate orientations
+    :param cam: projection.Camera
+    :param grid: image split in grid x grid cells
+    :param plate: plate geometry given to project_corners
+    :return: dict with the fraction of image cells reached by a corner, the fraction of fully visible poses,
+             the tilt angle range (deg) and the spread of the plate normals (1 - mean resultant length)
+    """
+    uv, visible = project_corners(rotations, cam, **plate)
+    cells = _cells(uv, visible, cam, grid)
+    axis = cam.location / np.linalg.norm(cam.location)
+    tilt = np.degrees(np.arccos(np.clip(rotations[:, :, 2] @ axis, -1., 1.)))
+    return {"poses": len(rotations), "image_coverage": cells.any(axis=0).mean(),
+            "fully_visible": visible.all(axis=(1, 2)).mean(), "tilt_min": tilt.min(), "tilt_max": tilt.max(),
+            "normal_spread": 1. - np.linalg.norm(rotations[:, :, 2].mean(axis=0))}
+
+
+def pose_matrices(rotations, base):
+    """
+    Plate matrix_world of every pose
+
+    :param rotations: (n, 3, 3) orientations
+    :param base: 4x4 rest matrix_world of the plate (holds its scale)
+    :return: (n, 4, 4) matrices
+    """
+    mats = np.tile(np.eye(4), (len(rotations), 1, 1))
+    mats[:, :3, :3] = rotations
+    return mats @ np.asarray(base, dtype=float)
+
+
+def make_poses(kind, n, cam=None, L=2., h=0.05, **kwargs):
+    """
+    :param kind: 'legacy', 'random', 'sobol' or 'coverage'
+    :param n: number of poses
+    :param cam: projection.Camera, required by 'coverage'
+    :param L: plate size (bu), used by 'coverage'
+    :param h: plate height to length ratio, used by 'coverage'
+    :return: (n, 3, 3) rotation matrices
+    """
+    if kind == "legacy":
+        return legacy_poses(n)
+    if kind == "random":
+        return random_poses(n, **kwargs)
+    if kind == "sobol":
+        return sobol_poses(n, **kwargs)
+    if kind == "coverage":
+        return coverage_poses(n, cam, L=L, h=h, **kwargs)
+    raise ValueError("unknown pose set '%s'" % kind)
+
+
+if __name__ == "__main__":
+    cam = projection.Camera.look_at((0., 0., 5.), (0., 0., 0.), 500, 500)
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    for kind in ("legacy", "random", "sobol", "coverage"):
+        start = time.perf_counter()
+        rotations = make_poses(kind, n, cam)
+        duration = time.perf_counter() - start
+        report = coverage_report(rotations, cam)
+        print("%-8s %5d poses in %.4f s: coverage %.2f, fully visible %.2f, tilt %.1f-%.1f deg, spread %.3f"
+              % (kind, n, duration, report["image_coverage"], report["fully_visible"], report["tilt_min"],
+                 report["tilt_max"], report["normal_spread"]))
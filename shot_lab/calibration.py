@@ -0,0 +1,494 @@
+"""
+Intrinsic calibration from the chessboard pictures written by make_calib_pic.py (lens_dist_calib/ang_*.png):
+saddle-point chessboard corner extraction run over the image set with a process pool, then a Zhang-style
+closed-form solve refined by Levenberg-Marquardt, in NumPy.
+
+The distortion is modelled as the CompositorNodeLensdist node (see projection.py), so the solve directly
+returns the dist_param given to add_lens_dist and can be checked against the injected value.
+"""
+import argparse
+import glob
+import itertools
+import os
+import sys
+import time
+import numpy as np
+from . import calib_poses
+from . import projection
+
+
+def _blur(img, sigma):
+    """Separable Gaussian blur"""
+    r = max(int(3 * sigma + 0.5), 1)
+    k = np.exp(-np.arange(-r, r + 1)**2 / (2. * sigma**2))
+    k /= k.sum()
+    pad = np.pad(img, r, mode="edge")
+    h, w = img.shape
+    tmp = sum(k[i] * pad[:, i:i + w] for i in range(2 * r + 1))
+    return sum(k[i] * tmp[i:i + h] for i in range(2 * r + 1))
+
+
+# least squares fit of I = a x^2 + b xy + c y^2 + d x + e y + f over a 5x5 window
+_OFF = np.arange(-2, 3)
+_DX, _DY = np.meshgrid(_OFF, _OFF)
+_FIT = np.linalg.pinv(np.column_stack((_DX.ravel()**2, _DX.ravel() * _DY.ravel(), _DY.ravel()**2,
+                                       _DX.ravel(), _DY.ravel(), np.ones(25))))
+
+
+def saddle_points(img, sigma=1.5, nms=5, rel_threshold=0.1):
+    """
+    Sub-pixel saddle points (chessboard X-junctions) of an image
+
+    :param img: 2D grayscale array
+    :param sigma: smoothing scale (px)
+    :param nms: non-maximum suppression radius (px)
+    :param rel_threshold: minimum response relative to the strongest one
+    :return: (n, 2) pixel coordinates (pixel centers at half integers), (n,) responses, strongest first
+    """
+    smooth = _blur(np.asarray(img, dtype=np.float64), sigma)
+    gy, gx = np.gradient(smooth)
+    gxy = np.gradient(gx, axis=0)
+    # negative Hessian determinant: positive at saddles, negative at L-corners and blobs
+    response = gxy**2 - np.gradient(gx, axis=1) * np.gradient(gy, axis=0)
+    pad = np.pad(response, nms, mode="constant", constant_values=-np.inf)
+    # separable maximum filter
+    local_max = np.lib.stride_tricks.sliding_window_view(pad, 2 * nms + 1, axis=1).max(axis=2)
+    local_max = np.lib.stride_tricks.sliding_window_view(local_max, 2 * nms + 1, axis=0).max(axis=2)
+    peak = (response == local_max) & (response > rel_threshold * response.max())
+    peak[:2], peak[-2:], peak[:, :2], peak[:, -2:] = False, False, False, False
+    rows, cols = np.nonzero(peak)
+    order = np.argsort(-response[rows, cols])
+    rows, cols = rows[order], cols[order]
+    patches = np.lib.stride_tricks.sliding_window_view(smooth, (5, 5))[rows - 2, cols - 2].reshape(len(rows), 25)
+    a, b, c, d, e, _ = (patches @ _FIT.T).T
+    det = 4 * a * c - b * b
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dx = (b * e - 2 * c * d) / det
+        dy = (b * d - 2 * a * e) / det
+    ok = np.isfinite(dx) & (np.abs(dx) < 1.5) & np.isfinite(dy) & (np.abs(dy) < 1.5)
+    dx, dy = np.where(ok, dx, 0.), np.where(ok, dy, 0.)
+    return np.column_stack((cols + 0.5 + dx, rows + 0.5 + dy)), response[rows, cols]
+
+
+def homography(src, dst):
+    """
+    Normalized DLT homography
+
+    :param src, dst: (n, 2) point correspondences
+    :return: 3x3 matrix mapping src to dst
+    """
+    def normalize(pts):
+        mean = pts.mean(axis=0)
+        scale = np.sqrt(2.) / max(np.mean(np.linalg.norm(pts - mean, axis=1)), 1e-12)
+        return np.array([[scale, 0., -scale * mean[0]], [0., scale, -scale * mean[1]], [0., 0., 1.]])
+    Ts, Td = normalize(src), normalize(dst)
+    s = src @ Ts[:2, :2].T + Ts[:2, 2]
+    d = dst @ Td[:2, :2].T + Td[:2, 2]
+    n = len(src)
+    A = np.zeros((2 * n, 9))
+    A[0::2, 0:2], A[0::2, 2], A[0::2, 6:8], A[0::2, 8] = s, 1., -d[:, :1] * s, -d[:, 0]
+    A[1::2, 3:5], A[1::2, 5], A[1::2, 6:8], A[1::2, 8] = s, 1., -d[:, 1:] * s, -d[:, 1]
+    H = np.linalg.svd(A)[2][-1].reshape(3, 3)
+    H = np.linalg.inv(Td) @ H @ Ts
+    return H / H[2, 2]
+
+
+def apply_homography(H, pts):
+    h = pts @ H[:, :2].T + H[:, 2]
+    return h[:, :2] / h[:, 2:]
+
+
+def _hull(pts):
+    """Convex hull (Andrew's monotone chain), counter-clockwise indices"""
+    order = np.lexsort((pts[:, 1], pts[:, 0]))
+
+    def half(idx):
+        chain = []
+        for i in idx:
+            while len(chain) >= 2:
+                o, a = pts[chain[-2]], pts[chain[-1]]
+                if (a[0] - o[0]) * (pts[i][1] - o[1]) - (a[1] - o[1]) * (pts[i][0] - o[0]) > 0:
+                    break
+                chain.pop()
+            chain.append(i)
+        return chain
+    lower, upper = half(order), half(order[::-1])
+    return np.array(lower[:-1] + upper[:-1])
+
+
+def order_grid(corners, inner, max_dist=0.3):
+    """
+    Label detected corners with their chessboard grid index
+
+    :param corners: (n, 2) candidate corners, strongest first
+    :param inner: number of inner corners along x and y
+    :param max_dist: largest distance between a corner and its predicted grid position, in squares
+    :return: (inner[0] * inner[1], 2) corners in grid order (row-major), or None
+    """
+    nx, ny = inner
+    if len(corners) < nx * ny:
+        return None
+    pts = corners[:nx * ny]
+    hull = _hull(pts)
+    if len(hull) < 4:
+        return None
+    # largest area quadrilateral on the hull approximates the outer corners of the grid
+    combos = np.array(list(itertools.combinations(range(len(hull)), 4)))
+    quads = pts[hull[combos]]
+    x, y = quads[..., 0], quads[..., 1]
+    area = 0.5 * np.abs(np.sum(x * np.roll(y, -1, axis=1) - np.roll(x, -1, axis=1) * y, axis=1))
+    quad = quads[np.argmax(area)]
+    gx, gy = np.meshgrid(np.arange(nx), np.arange(ny))
+    grid = np.column_stack((gx.ravel(), gy.ravel())).astype(float)
+    outer = np.array([[0., 0.], [nx - 1., 0.], [nx - 1., ny - 1.], [0., ny - 1.]])
+    best = None
+    for shift in range(4):
+        H = homography(outer, np.roll(quad, shift, axis=0))
+        for _ in range(2):
+            pred = apply_homography(H, grid)
+            dist = np.linalg.norm(pred[:, None] - pts[None], axis=2)
+            match = np.argmin(dist, axis=1)
+            if len(np.unique(match)) != len(match):
+                break
+            H = homography(grid, pts[match])
+        else:
+            # residual measured in grid squares
+            back = apply_homography(np.linalg.inv(H), pts[match])
+            err = np.max(np.linalg.norm(back - grid, axis=1))
+            if err < max_dist and (best is None or err < best[0]):
+                best = (err, pts[match])
+    return None if best is None else best[1]
+
+
+def load_gray(path):
+    """
+    :param path: image path
+    :return: 2D float array
+    """
+    from . import sphere_tracker
+    return next(sphere_tracker.read_frames([path]))
+
+
+def find_corners(img, inner=(6, 6), sigma=1.5):
+    """
+    Chessboard inner corners of one image
+
+    :param img: 2D array or image path
+    :param inner: number of inner corners along x and y
+    :param sigma: smoothing scale (px)
+    :return: (inner[0] * inner[1], 2) corners in grid order, or None if the board is not found
+    """
+    if isinstance(img, str):
+        img = load_gray(img)
+    corners, _ = saddle_points(img, sigma)
+    return order_grid(corners, inner)
+
+
+def find_corners_all(images, inner=(6, 6), processes=None):
+    """
+    Corner extraction over an image set with a process pool. The workers are given the image paths and read the
+    images themselves: arrays are processed in process, pickling them to the workers costs more than the extraction.
+
+    :param images: image paths or 2D arrays
+    :param inner: number of inner corners along x and y
+    :param processes: number of worker processes, all cores by default, 1 to run in process
+    :return: list of corner arrays (None for the images where the board is not found)
+    """
+    processes = processes or os.cpu_count() or 1
+    if processes == 1 or len(images) < 2 or not all(isinstance(img, str) for img in images):
+        return [find_corners(img, inner) for img in images]
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(find_corners, images, itertools.repeat(inner)))
+
+
+def object_points(inner, square):
+    """
+    :return: (inner[0] * inner[1], 2) grid coordinates on the board plane, row-major like find_corners
+    """
+    gx, gy = np.meshgrid(np.arange(inner[0]), np.arange(inner[1]))
+    return np.column_stack((gx.ravel(), gy.ravel())) * float(square)
+
+
+def zhang_intrinsics(Hs):
+    """
+    Closed-form intrinsic matrix from the board to image homographies (Zhang 2000)
+
+    :param Hs: list of 3x3 homographies, at least 3
+    :return: 3x3 intrinsic matrix
+    """
+    def v(H, i, j):
+        hi, hj = H[:, i], H[:, j]
+        return np.array([hi[0] * hj[0], hi[0] * hj[1] + hi[1] * hj[0], hi[1] * hj[1],
+                         hi[2] * hj[0] + hi[0] * hj[2], hi[2] * hj[1] + hi[1] * hj[2], hi[2] * hj[2]])
+    V = np.array([row for H in Hs for row in (v(H, 0, 1), v(H, 0, 0) - v(H, 1, 1))])
+    B11, B12, B22, B13, B23, B33 = np.linalg.svd(V)[2][-1]
+    if B11 < 0:
+        B11, B12, B22, B13, B23, B33 = -B11, -B12, -B22, -B13, -B23, -B33
+    v0 = (B12 * B13 - B11 * B23) / (B11 * B22 - B12**2)
+    lam = B33 - (B13**2 + v0 * (B12 * B13 - B11 * B23)) / B11
+    alpha = np.sqrt(lam / B11)
+    beta = np.sqrt(lam * B11 / (B11 * B22 - B12**2))
+    gamma = -B12 * alpha**2 * beta / lam
+    u0 = gamma * v0 / beta - B13 * alpha**2 / lam
+    return np.array([[alpha, gamma, u0], [0., beta, v0], [0., 0., 1.]])
+
+
+def extrinsics(K, H):
+    """
+    Board pose from its homography
+
+    :return: 3x3 rotation, translation (camera frame: x right, y down, z forward)
+    """
+    M = np.linalg.inv(K) @ H
+    scale = 1. / np.linalg.norm(M[:, 0])
+    if M[2, 2] * scale < 0:
+        scale = -scale
+    r1, r2, t = M[:, 0] * scale, M[:, 1] * scale, M[:, 2] * scale
+    U, _, Vt = np.linalg.svd(np.column_stack((r1, r2, np.cross(r1, r2))))
+    return U @ Vt, t
+
+
+def _rodrigues(rvecs):
+    angles = np.linalg.norm(rvecs, axis=1)
+    axes = rvecs / np.where(angles > 0, angles, 1.)[:, None]
+    axes[angles == 0] = (0., 0., 1.)
+    return calib_poses.axis_angle(axes, angles)
+
+
+def _log_rotation(R):
+    angle = np.arccos(np.clip((np.trace(R) - 1.) / 2., -1., 1.))
+    if angle < 1e-12:
+        return np.zeros(3)
+    axis = np.array([R[2, 1] - R[1, 2], R[0, 2] - R[2, 0], R[1, 0] - R[0, 1]]) / (2 * np.sin(angle))
+    return axis * angle
+
+
+def _residuals(params, obj, uv, resx, resy):
+    n = len(uv)
+    fx, fy, cx, cy, k = params[:5]
+    ext = params[5:].reshape(n, 6)
+    R = _rodrigues(ext[:, :3])
+    cam = np.einsum("nij,mj->nmi", R[:, :, :2], obj) + ext[:, None, 3:]
+    pix = np.stack((fx * cam[..., 0] / cam[..., 2] + cx, fy * cam[..., 1] / cam[..., 2] + cy), axis=-1)
+    return (projection.distort_points(pix, k, resx, resy) - uv).ravel()
+
+
+def refine(params, obj, uv, resx, resy, iterations=20):
+    """
+    Levenberg-Marquardt refinement of the intrinsics, distortion and board poses.
+    The Jacobian is computed by finite differences, exploiting that each pose only moves its own image.
+
+    :param params: [fx, fy, cx, cy, dist_param] + 6 pose parameters (rotation vector, translation) per image
+    :return: refined parameters
+    """
+    n = len(uv)
+    lam = 1e-3
+    res = _residuals(params, obj, uv, resx, resy)
+    for _ in range(iterations):
+        J = np.zeros((len(res), len(params)))
+        for j in range(5):
+            step = 1e-6 * max(abs(params[j]), 1.)
+            p = params.copy()
+            p[j] += step
+            J[:, j] = (_residuals(p, obj, uv, resx, resy) - res) / step
+        for j in range(6):
+            p = params.copy()
+            p[5 + j::6] += 1e-7
+            diff = ((_residuals(p, obj, uv, resx, resy) - res) / 1e-7).reshape(n, -1)
+            for i in range(n):
+                J[i * diff.shape[1]:(i + 1) * diff.shape[1], 5 + 6 * i + j] = diff[i]
+        JtJ, Jtr = J.T @ J, J.T @ res
+        while lam < 1e10:
+            delta = np.linalg.solve(JtJ + lam * np.diag(np.diag(JtJ) + 1e-12), -Jtr)
+            new = _residuals(params + delta, obj, uv, resx, resy)
+            if new @ new < res @ res:
+                params, res, lam = params + delta, new, lam / 10.
+                break
+            lam *= 10.
+        else:
+            break
+        if np.max(np.abs(delta)) < 1e-10:
+            break
+    return params
+
+
+def _golden(fun, lo, hi, tol=1e-5):
+    ratio = (np.sqrt(5.) - 1.) / 2.
+    a, b = lo + (1 - ratio) * (hi - lo), lo + ratio * (hi - lo)
+    fa, fb = fun(a), fun(b)
+    while hi - lo > tol:
+        if fa < fb:
+            hi, b, fb = b, a, fa
+            a = lo + (1 - ratio) * (hi - lo)
+            fa = fun(a)
+        else:
+            lo, a, fa = a, b, fb
+            b = lo + ratio * (hi - lo)
+            fb = fun(b)
+    return (lo + hi) / 2.
+
+
+def calibrate(corners, inner, square, resx, resy, dist_bounds=(-0.5, 0.5), iterations=20):
+    """
+    Intrinsic and Lensdist distortion solve
+
+    :param corners: list of (inner[0] * inner[1], 2) corner arrays from find_corners_all (None entries skipped)
+    :param inner: number of inner corners along x and y
+    :param square: chessboard square size (bu), only scales the poses
+    :param resx, resy: image resolution
+    :param dist_bounds: search interval of the distortion parameter
+    :param iterations: Levenberg-Marquardt iterations, 0 for the closed form only
+    :return: dict with K, dist_param, rms (px), per-image rms, rotations, translations and the used image mask
+    """
+    used = np.array([c is not None for c in corners])
+    if used.sum() < 3:
+        raise ValueError("need the board in at least 3 images, found in %d" % used.sum())
+    uv = np.array([c for c in corners if c is not None])
+    obj = object_points(inner, square)
+
+    def homography_error(k):
+        # the right distortion makes every view an exact homography of the board
+        err = 0.
+        for pts in uv:
+            raw = projection.undistort_points(pts, k, resx, resy)
+            if not np.all(np.isfinite(raw)):
+                return np.inf
+            err += np.sum((apply_homography(homography(obj, raw), obj) - raw)**2)
+        return err
+    k = _golden(homography_error, *dist_bounds)
+    raw = [projection.undistort_points(pts, k, resx, resy) for pts in uv]
+    Hs = [homography(obj, pts) for pts in raw]
+    K = zhang_intrinsics(Hs)
+    poses = [extrinsics(K, H) for H in Hs]
+    params = np.concatenate([[K[0, 0], K[1, 1], K[0, 2], K[1, 2], k]]
+                            + [np.concatenate((_log_rotation(R), t)) for R, t in poses])
+    if iterations:
+        params = refine(params, obj, uv, resx, resy, iterations)
+    res = _residuals(params, obj, uv, resx, resy).reshape(len(uv), -1, 2)
+    ext = params[5:].reshape(len(uv), 6)
+    return {"K": np.array([[params[0], 0., params[2]], [0., params[1], params[3]], [0., 0., 1.]]),
+            "dist_param": params[4], "rms": np.sqrt(np.mean(np.sum(res**2, axis=2))),
+            "image_rms": np.sqrt(np.mean(np.sum(res**2, axis=2), axis=1)),
+            "rotations": _rodrigues(ext[:, :3]), "translations": ext[:, 3:], "used": used}
+
+
+def compare(result, cam):
+    """
+    Calibration error against the camera that rendered the pictures
+
+    :param result: calibrate output
+    :param cam: projection.Camera (lens, sensor width, resolution and injected dist_param)
+    :return: dict of focal length (relative), principal point (px) and distortion parameter errors
+    """
+    K = result["K"]
+    return {"focal_rel": (0.5 * (K[0, 0] + K[1, 1]) - cam.focal_px) / cam.focal_px,
+            "center_px": float(np.hypot(K[0, 2] - cam.resx / 2., K[1, 2] - cam.resy / 2.)),
+            "dist_param": result["dist_param"] - cam.dist_param}
+
+
+def render_chessboard(cam, rotation, square, inner=(6, 6), margin=1., background=0.05):
+    """
+    Chessboard picture rendered analytically without Blender (anti-aliased, Lensdist distortion applied)
+
+    :param cam: projection.Camera
+    :param rotation: 3x3 board orientation, board centered on the origin
+    :param square: square size (bu)
+    :param inner: number of inner corners, the board has inner + 1 squares per side
+    :param margin: white border around the squares, in squares
+    :param background: intensity outside of the board
+    :return: 2D float array
+    """
+    v, u = np.mgrid[0:cam.resy, 0:cam.resx] + 0.5
+    raw = projection.undistort_points(np.stack((u, v), axis=-1), cam.dist_param, cam.resx, cam.resy)
+    f = cam.focal_px
+    # camera rays in world coordinates
+    d_cam = np.stack(((raw[..., 0] - cam.resx / 2.) / f, -(raw[..., 1] - cam.resy / 2.) / f,
+                      -np.ones(raw.shape[:2])), axis=-1)
+    d = d_cam @ cam.rotation.T
+    normal = rotation[:, 2]
+    t = -(cam.location @ normal) / (d @ normal)
+    hit = cam.location + t[..., None] * d
+    local = hit @ rotation
+    x, y = local[..., 0] / square, local[..., 1] / square
+    # board units per pixel, for the anti-aliasing of the square edges
+    foot = t * np.linalg.norm(d, axis=-1) / f / square / max(abs(normal @ cam.rotation[:, 2]), 0.2)
+    sx = np.clip(np.cos(np.pi * x) / (np.pi * foot), -1., 1.)
+    sy = np.clip(np.cos(np.pi * y) / (np.pi * foot), -1., 1.)
+    half = (inner[0] + 1) / 2., (inner[1] + 1) / 2.
+    squares = (np.abs(x) < half[0]) & (np.abs(y) < half[1])
+    board = (np.abs(x) < half[0] + margin) & (np.abs(y) < half[1] + margin) & (t > 0)
+    # square edges at half integers: the inner corners sit on the centered half integer grid
+    img = np.where(squares, 0.5 + 0.5 * sx * sy, 1.)
+    return np.where(board, img, background).astype(np.float32)
+
+
+def calibrate_dir(directory, inner=(6, 6), square=None, processes=None, pattern="ang_*.png", iterations=20):
+    """
+    Calibrate from an image directory, e.g. lens_dist_calib/
+
+    :param square: square size (bu), the chessboard of make_calib_pic.py (calib_poses.square_size) by default
+    :param iterations: Levenberg-Marquardt iterations
+    :return: calibrate output
+    """
+    paths = sorted(glob.glob(os.path.join(directory, pattern)))
+    if not paths:
+        raise ValueError("no %s images in %s" % (pattern, directory))
+    if square is None:
+        square = calib_poses.square_size(inner=inner)
+    img = load_gray(paths[0])
+    corners = find_corners_all(paths, inner, processes)
+    return calibrate(corners, inner, square, img.shape[1], img.shape[0], iterations=iterations)
+
+
+def benchmark(dist_param=0.05, num=20, resx=500, processes=None):
+    """
+    Time the corner extraction and the solve on a synthetic image set, and check the injected distortion is recovered
+
+    :return:
+    """
+    import tempfile
+    from . import sphere_tracker
+    inner = (6, 6)
+    square = calib_poses.square_size(inner=inner)
+    cam = projection.Camera.look_at((0., 0., 5.), (0., 0., 0.), resx, resx, dist_param=dist_param)
+    rotations = calib_poses.sobol_poses(num, max_tilt=np.pi/5)
+    start = time.perf_counter()
+    images = [render_chessboard(cam, rot, square, inner) for rot in rotations]
+    print("render %d images: %.2f s" % (num, time.perf_counter() - start))
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = [os.path.join(tmp, "ang_%d.png" % i) for i in range(num)]
+        for path, img in zip(paths, images):
+            sphere_tracker.write_frame(path, img)
+        for procs in sorted({1, processes or os.cpu_count() or 1}):
+            start = time.perf_counter()
+            corners = find_corners_all(paths, inner, procs)
+            print("corners (%s processes): %.2f s, board found in %d/%d images"
+                  % (procs, time.perf_counter() - start, sum(c is not None for c in corners), num))
+    start = time.perf_counter()
+    result = calibrate(corners, inner, square, resx, resx)
+    print("solve: %.2f s, rms %.3f px" % (time.perf_counter() - start, result["rms"]))
+    err = compare(result, cam)
+    print("focal error %.2e, principal point error %.3f px, dist_param %.4f (injected %.4f)"
+          % (err["focal_rel"], err["center_px"], result["dist_param"], dist_param))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="calibrate", description="Calibrate the camera from the chessboard pictures")
+    parser.add_argument("directory", nargs="?", default=None, help="picture directory, the benchmark runs without it")
+    parser.add_argument("--inner", type=int, nargs=2, default=(6, 6), help="inner corners along x and y")
+    parser.add_argument("--square", type=float, default=None, help="square size (bu), L / (inner + 1) by default")
+    parser.add_argument("--pattern", default="ang_*.png")
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args(argv)
+    if args.directory is None:
+        benchmark(processes=args.processes)
+        return 0
+    res = calibrate_dir(args.directory, tuple(args.inner), args.square, args.processes, args.pattern)
+    print("K =\n%s\ndist_param = %.5f\nrms = %.3f px (%d images)"
+          % (res["K"], res["dist_param"], res["rms"], res["used"].sum()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
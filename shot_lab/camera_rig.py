@@ -0,0 +1,387 @@
+"""
+Camera rig: N cameras (pose, resolution, Lensdist distortion) filming a shot that is built and keyed once.
+
+make_anim films each camera in turn on the same scene: camera, sun and render settings are set again and the shot
+film is recomputed (trajectory resampled and hashed) for every camera. The rig keys the shot once in the main scene
+and gives each camera a view scene linking the shot object: the view scene holds the camera, its sun, its Lensdist
+compositor and its render settings, so the views keep their own resolution and distortion (Blender render views
+share those of their scene).
+
+    Blender: each view scene is rendered as one animation job (bpy.ops.render.render(scene=...)), through the
+             render cache
+    NumPy:   a single pass, the shot animation is evaluated once per frame and every view rendered from it
+
+    rig = camera_rig.CameraRig(builder, camera_rig.make_cameras(shot_video.CAMERAS, 500, 500, 0.05))
+    rig.film(traj_t, traj, fps)
+    rig.setup("3Drecons/")
+    rig.render("npy")
+    rig.close()
+
+    python -m shot_lab.camera_rig [frames]      (setup cost against the number of cameras, on the bpy stand-in)
+"""
+import os
+import sys
+import time
+import numpy as np
+from . import frame_stack
+from . import instrument
+from . import projection
+from . import render_cache
+from . import render_profiles
+from . import scene_builder
+from . import soft_render
+from . import trajectories
+
+
+class RigCamera:
+    """
+    :param name: camera name, also its output directory and file prefix
+    :param location: camera position triplet
+    :param rot_euler: euler angles, None to look at target
+    :param target: looked at position triplet
+    :param resx, resy: resolution
+    :param dist_param: Lensdist distortion parameter
+    """
+    def __init__(self, name, location, rot_euler=None, target=(0., 0., 0.), resx=500, resy=500, dist_param=0.):
+        self.name = name
+        self.location = tuple(float(v) for v in location)
+        self.rot_euler = None if rot_euler is None else tuple(float(v) for v in rot_euler)
+        self.target = tuple(float(v) for v in target)
+        self.resx = int(resx)
+        self.resy = int(resy)
+        self.dist_param = float(dist_param)
+
+    @classmethod
+    def parse(cls, name, spec, resx=500, resy=500, dist_param=0.):
+        """
+        :param name: camera name
+        :param spec: [position, euler angles] (shot_video.CAMERAS) or dict of the RigCamera parameters
+            (location, rot_euler, target, resx, resy, dist_param)
+        :param resx, resy, dist_param: defaults of the settings spec leaves out
+        :return: RigCamera
+        """
+        if isinstance(spec, dict):
+            spec = dict({"resx": resx, "resy": resy, "dist_param": dist_param}, **spec)
+            return cls(name, **spec)
+        location, rot_euler = spec
+        return cls(name, location, rot_euler, resx=resx, resy=resy, dist_param=dist_param)
+
+    def projection(self):
+        """:return: projection.Camera of the rig camera"""
+        if self.rot_euler is None:
+            return projection.Camera.look_at(self.location, self.target, self.resx, self.resy,
+                                             dist_param=self.dist_param)
+        return projection.Camera.from_euler(self.location, self.rot_euler, self.resx, self.resy,
+                                            dist_param=self.dist_param)
+
+    def __repr__(self):
+        return "RigCamera(%r, %s, %dx%d, dist_param=%g)" % (self.name, self.location, self.resx, self.resy,
+                                                           self.dist_param)
+
+
+def make_cameras(cameras, resx=500, resy=500, dist_param=0.):
+    """
+    :param cameras: dict name -> spec, see RigCamera.parse
+    :param resx, resy, dist_param: default settings
+    :return: list of RigCamera
+    """
+    return [RigCamera.parse(name, spec, resx, resy, dist_param) for name, spec in cameras.items()]
+
+
+class CameraRig:
+    """
+    Cameras filming the shot of a main scene, each through a view scene linking the shot
+
+    :param builder: scene_builder.SceneBuilder of the main scene, holding the shot
+    :param cameras: RigCamera list
+    """
+    def __init__(self, builder, cameras):
+        self.builder = builder
+        self.cameras = list(cameras)
+        self.views = {}
+        self.traj = None
+        self.frames = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @instrument.spanned()
+    def film(self, traj_t, xyz, fps, R=0.1, exposure=0., subsamples=1, tolerance=None):
+        """
+        Key the shot once for all the cameras, see SceneBuilder.shot_film
+
+        :param traj_t: (N,) trajectory times (s)
+        :param xyz: (N, 3) trajectory
+        :param fps: camera frame rate (Hz)
+        :param R: sphere radius (bu)
+        :param exposure: exposure time (s), for the motion blur
+        :param subsamples: motion blur sub-samples per frame
+        :param tolerance: optional keyframe decimation tolerance (bu)
+        :return: (n,) rendered frames
+        """
+        self.frames = self.builder.shot_film(traj_t, xyz, fps, R, exposure, subsamples, tolerance)
+        # the stack ground truth is interpolated from the tracked samples only, like the shot keyframes
+        self.traj = trajectories.tracked_rows(traj_t, xyz) + (fps, exposure)
+        for view in self.views.values():
+            self._link(view)
+        return self.frames
+
+    def _view(self, camera):
+        view = self.views.get(camera.name)
+        if view is None:
+            scene = self.builder.bpy.data.scenes.new(camera.name)
+            view = self.views[camera.name] = scene_builder.SceneBuilder(scene, self.builder.bpy,
+                                                                        self.builder.mathutils)
+        return view
+
+    def _link(self, view):
+        """Link the shot of the main scene to a view scene, with the world, frame range, rate and motion blur"""
+        main = self.builder.scene
+        shot = self.builder.objects["shot"]
+        scene = view.scene
+        if view.objects.get("shot") is not shot:
+            scene.collection.objects.link(shot)
+            view.objects["shot"] = shot
+        scene.world = main.world
+        scene.frame_start, scene.frame_end = main.frame_start, main.frame_end
+        scene.render.fps, scene.render.fps_base = main.render.fps, main.render.fps_base
+        scene.render.use_motion_blur = main.render.use_motion_blur
+        scene.render.motion_blur_shutter = main.render.motion_blur_shutter
+
+    def prefix(self, out_dir, camera):
+        """:return: output path prefix of a camera, <out_dir>/<name>/<name>_ like make_anim"""
+        return os.path.join(out_dir, camera.name, camera.name + "_")
+
+    @instrument.spanned()
+    def setup(self, out_dir, profile=render_profiles.DEFAULT, threads=None):
+        """
+        Set the view scene of each camera: camera, sun at the camera (make_anim lighting), Lensdist and render
+        settings. Only what changed since the last setup is updated.
+
+        :param out_dir: output directory, a sub-directory per camera
+        :param profile: render_profiles.PROFILES name
+        :param threads: fixed render thread count
+        :return:
+        """
+        if "shot" not in self.builder.objects:
+            raise ValueError("film the shot before setting the cameras up")
+        for camera in self.cameras:
+            view = self._view(camera)
+            self._link(view)
+            view.camera(camera.location, camera.target, rot_euler=camera.rot_euler)
+            view.sun(camera.location, (0., 0., 0.))
+            view.lens_dist(camera.dist_param)
+            view.render_settings(camera.resx, camera.resy, self.prefix(out_dir, camera), 'JPEG', 'BW')
+            view.render_profile(profile, threads)
+
+    def _stack(self, camera):
+        """:return: frame numbers, times, ground truth positions and attrs of the stack of a camera"""
+        traj_t, xyz, fps, exposure = self.traj
+        scene = self.builder.scene
+        frames, times = trajectories.frame_times(traj_t[0], traj_t[-1], fps)
+        keep = (frames >= scene.frame_start) & (frames <= scene.frame_end)
+        frames, times = frames[keep], times[keep]
+        attrs = frame_stack.camera_attrs(camera.name, camera.location, camera.rot_euler, camera.resx, camera.resy,
+                                         camera.dist_param, fps, exposure)
+        return frames, times, trajectories.interpolate(traj_t, xyz, times), attrs
+
+    def iter_frames(self, backend, numbers=None, chunk=64):
+        """
+        NumPy single pass: the shot centers are evaluated once per frame and every view rendered from them
+
+        :param backend: soft_render.Backend giving the samples and render processes
+        :param numbers: frame numbers, the scene frame range by default
+        :param chunk: frames rendered per view at a time
+        :return: generator of (camera, first index, (n, H, W) float32 frames)
+        """
+        scene = self.builder.scene
+        if numbers is None:
+            numbers = np.arange(scene.frame_start, scene.frame_end + 1)
+        centers, radius, albedo = soft_render.Backend(self.builder).shot(numbers)
+        renderers = [soft_render.Backend(self.views[camera.name], backend.samples).renderer()
+                     for camera in self.cameras]
+        for start in range(0, len(numbers), chunk):
+            for camera, renderer in zip(self.cameras, renderers):
+                yield camera, start, soft_render.render_parallel(renderer, "shot", centers[start:start + chunk],
+                                                                 backend.workers, chunk, radius=radius, albedo=albedo)
+
+    def _render_single_pass(self, output, backend, cache):
+        bpy = self.builder.bpy
+        stacks = {camera.name: self._stack(camera) for camera in self.cameras} if output != "jpeg" else {}
+        numbers = stacks[self.cameras[0].name][0] if stacks else None
+        outputs, descs, paths = [], [], {}
+        for camera in self.cameras:
+            view = self.views[camera.name]
+            desc = render_cache.describe_scene(view.scene)
+            if output == "jpeg":
+                scene = view.scene
+                paths[camera.name] = [bpy.path.abspath(scene.render.frame_path(frame=frame))
+                                      for frame in range(scene.frame_start, scene.frame_end + 1)]
+                outputs += paths[camera.name]
+            else:
+                frames, _, _, attrs = stacks[camera.name]
+                outputs += frame_stack.stack_paths(view.scene.render.filepath + "stack", output)
+                desc["stack"] = [output, np.asarray(frames).tolist(), attrs]
+            descs.append(desc)
+
+        def render():
+            from . import sphere_tracker
+            writers = {}
+            for camera in self.cameras:
+                if output == "jpeg":
+                    for path in paths[camera.name]:
+                        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                else:
+                    writers[camera.name] = frame_stack.StackWriter(
+                        self.views[camera.name].scene.render.filepath + "stack", (camera.resy, camera.resx),
+                        *stacks[camera.name], output)
+            try:
+                for camera, start, imgs in self.iter_frames(backend, numbers):
+                    for i, img in enumerate(imgs, start):
+                        if output == "jpeg":
+                            sphere_tracker.write_frame(paths[camera.name][i], img)
+                        else:
+                            writers[camera.name].write(i, img)
+            finally:
+                for writer in writers.values():
+                    writer.close()
+
+        if cache is None:
+            render()
+            return False
+        return cache.cached_render({"rig": descs, "backend": backend.describe()}, outputs, render)
+
+    @instrument.spanned()
+    def render(self, output="jpeg", backend=None, cache=None):
+        """
+        Render every camera: by view scene with Blender, in a single pass with the NumPy backend
+
+        :param output: 'jpeg' (a file per frame) or a frame_stack.py format, see shot_video.make_anim
+        :param backend: optional soft_render.Backend rendering in place of Blender (its samples and processes)
+        :param cache: render_cache.RenderCache, the shared one by default
+        :return: True if every render was skipped
+        """
+        cache = cache or render_cache.default_cache()
+        if backend is not None:
+            return self._render_single_pass(output, backend, cache)
+        skipped = True
+        for camera in self.cameras:
+            scene = self.views[camera.name].scene
+            if output == "jpeg":
+                skipped &= render_cache.render_animation(cache, scene=scene)
+            else:
+                skipped &= frame_stack.render_stack(scene, scene.render.filepath + "stack", *self._stack(camera),
+                                                    fmt=output, cache=cache)
+        return skipped
+
+    @instrument.spanned()
+    def close(self):
+        """
+        Unlink the shot from the view scenes, then clear and remove them. The main scene is left to its builder.
+
+        :return:
+        """
+        shot = self.builder.objects.get("shot")
+        for view in self.views.values():
+            if shot is not None and view.objects.get("shot") is shot:
+                view.scene.collection.objects.unlink(shot)
+                del view.objects["shot"]
+            view.close()
+            self.builder.bpy.data.scenes.remove(view.scene)
+        self.views = {}
+
+    def report(self):
+        return "\n".join(["main: " + self.builder.report()]
+                         + ["%s: %s" % (name, view.report()) for name, view in self.views.items()])
+
+
+def ring(count, radius=5., height=1.5, resx=500, resy=500, dist_param=0.):
+    """
+    :param count: number of cameras
+    :return: RigCamera list on a ring around the origin, looking at it
+    """
+    angles = 2. * np.pi * np.arange(count) / count
+    return [RigCamera("cam%d" % i, (radius * np.cos(a), radius * np.sin(a), height), resx=resx, resy=resy,
+                      dist_param=dist_param) for i, a in enumerate(angles)]
+
+
+def benchmark(num_frames=2000, counts=(1, 2, 4, 8), res=200, render_frames=200, repeat=3):
+    """
+    Setup time against the number of cameras on the bpy stand-in: the scene rebuilt for each camera (del_all),
+    make_anim filming each camera in turn on one scene, and the rig. Then the NumPy render time of make_anim by
+    camera against the rig single pass over the first render_frames frames. Best of repeat runs.
+
+    :param num_frames: trajectory samples, one per camera frame
+    :param counts: numbers of cameras
+    :param res: camera resolution
+    :param render_frames: frames rendered per camera (0: setup only)
+    :param repeat: runs per measure
+    :return: dict camera count -> dict of seconds
+    """
+    from . import bpy_standin
+    from . import shot_video
+    fps = 24.
+    traj_t = np.arange(num_frames) / fps
+    traj = shot_video.make_doublesin_traj(num_frames, "double_sine")
+    numbers = np.arange(1, min(render_frames, num_frames) + 1)
+
+    def new_builder():
+        bpy = bpy_standin.BpyStandin()
+        return scene_builder.SceneBuilder(bpy=bpy, mathutils=bpy.mathutils)
+
+    def per_camera(cameras, rebuild):
+        builder = new_builder()
+        setup = render = 0.
+        for camera in cameras:
+            start = time.perf_counter()
+            if rebuild:
+                builder.clear()
+            builder.camera(camera.location, camera.target, rot_euler=camera.rot_euler)
+            builder.sun(camera.location, (0., 0., 0.))
+            builder.shot_film(traj_t, traj, fps)
+            builder.lens_dist(camera.dist_param)
+            builder.render_settings(camera.resx, camera.resy, camera.name + "_", 'JPEG', 'BW')
+            builder.render_profile()
+            setup += time.perf_counter() - start
+            if len(numbers) and not rebuild:
+                start = time.perf_counter()
+                soft_render.Backend(builder, samples=1).frames(numbers)
+                render += time.perf_counter() - start
+        return setup, render
+
+    def rig(cameras):
+        builder = new_builder()
+        with CameraRig(builder, cameras) as camera_rig:
+            start = time.perf_counter()
+            camera_rig.film(traj_t, traj, fps)
+            camera_rig.setup("")
+            setup = time.perf_counter() - start
+            start = time.perf_counter()
+            if len(numbers):
+                for _ in camera_rig.iter_frames(soft_render.Backend(builder, samples=1), numbers):
+                    pass
+            return setup, time.perf_counter() - start
+
+    def best(fn, *args):
+        runs = [fn(*args) for _ in range(repeat)]
+        return tuple(min(values) for values in zip(*runs))
+
+    results = {}
+    for count in counts:
+        cameras = ring(count, resx=res, resy=res, dist_param=0.05)
+        rebuild, _ = best(per_camera, cameras, True)
+        anim, anim_render = best(per_camera, cameras, False)
+        setup, rig_render = best(rig, cameras)
+        results[count] = {"rebuild": rebuild, "make_anim": anim, "rig": setup, "make_anim render": anim_render,
+                          "rig render": rig_render}
+        print("%d cameras, setup: rebuild %.4f s, make_anim %.4f s, rig %.4f s (%.1fx faster than rebuild); "
+              "%d frames rendered: make_anim %.3f s, rig %.3f s"
+              % (count, rebuild, anim, setup, rebuild / setup, len(numbers), anim_render, rig_render))
+    return results
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
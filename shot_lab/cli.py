@@ -0,0 +1,139 @@
+"""
+Command line entry points.
+
+The Blender jobs run inside Blender, their options given after the '--' separator:
+
+    blender -b -P make_calib_pic.py -- --dist_param 0.05 --out lens_dist_calib
+    shot-lab calib-pics -- --dist_param 0.05 --out lens_dist_calib      (launches blender -b for you)
+
+The NumPy tools run without Blender:
+
+    shot-lab farm anim --out /tmp/farm --renderer "python -m shot_lab.stub_render"
+    shot-lab sweep sweep.json
+    shot-lab traj-convert Trajectory.txt Trajectory.trj
+    shot-lab traj-gen Trajectory.txt --kind ballistic --params '{"p0": [-4, 0, 0.5], "v0": [80, 0, 3]}'
+    shot-lab calibrate lens_dist_calib
+    shot-lab track 3Drecons/camLeft/camLeft_
+    shot-lab bench --size medium
+    shot-lab bench-import
+"""
+import argparse
+import importlib
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BLENDER_JOBS = {"calib-pics": "make_calib_pic.py", "sample-pics": "make_sample_pic.py",
+                "shot-video": "make_shot_video.py", "shot-recons": "shot_recons.py"}
+TOOLS = {"farm": "render_farm", "sweep": "sweep", "traj-convert": "traj_bin", "traj-gen": "trajectories",
+         "calibrate": "calibration", "track": "sphere_tracker", "bench": "bench"}
+# modules that must import without Blender, timed by benchmark_imports
+PURE_MODULES = ("traj_io", "traj_bin", "trajectories", "projection", "calib_poses", "triangulation", "sphere_tracker",
+                "calibration", "lens_remap", "keyframes", "frame_stack", "render_cache", "render_farm",
+                "render_profiles", "roi_render", "soft_render", "sweep", "scene_builder", "calib_pics", "sample_pics",
+                "shot_video", "recons", "bench", "instrument", "camera_rig")
+
+
+def script_args(argv=None):
+    """
+    Arguments meant for a script: after '--' when given, none under Blender (its own options), else argv[1:]
+
+    :param argv: command line, sys.argv by default
+    :return: argument list
+    """
+    argv = sys.argv if argv is None else argv
+    if "--" in argv:
+        return argv[argv.index("--") + 1:]
+    if "bpy" in sys.modules:
+        return []
+    return argv[1:]
+
+
+def parse_job_args(parser, argv=None):
+    """
+    Parse the options of a Blender job, adding the render_farm.py --shard, the sweep.py --config and the
+    instrument.py --trace, --profile and --trace_memory options, then start the instrumentation they ask for.
+    The --config settings replace the defaults, options given explicitly still win.
+
+    :param parser: argparse parser of the job settings, its dest names are the sweep setting names
+    :param argv: command line, sys.argv by default
+    :return: namespace, with .shard (None when rendering the whole job)
+    """
+    parser.add_argument("--shard", type=json.loads, default=None, help="render_farm.py shard (JSON)")
+    parser.add_argument("--config", type=json.loads, default={}, help="sweep.py settings (JSON)")
+    from . import instrument
+    instrument.add_arguments(parser)
+    args = script_args(argv)
+    config = parser.parse_args(args).config
+    if config:
+        parser.set_defaults(**config)
+    args = parser.parse_args(args)
+    instrument.configure(args.trace, args.profile, args.trace_memory)
+    return args
+
+
+def triplet(text):
+    """argparse type of a position given as 'x,y,z'"""
+    return tuple(float(v) for v in text.split(","))
+
+
+def run_blender_job(name, args, blender="blender"):
+    """
+    :param name: key of BLENDER_JOBS
+    :param args: job options
+    :param blender: Blender executable
+    :return: Blender exit code
+    """
+    import subprocess
+    cmd = [blender, "-b", "-P", os.path.join(ROOT, BLENDER_JOBS[name]), "--"] + list(args)
+    return subprocess.call(cmd)
+
+
+def benchmark_imports(modules=PURE_MODULES, repeat=5):
+    """
+    Cold import time of the package modules, each imported in a fresh interpreter where numpy is already loaded
+    (numpy itself is timed separately)
+
+    :param modules: shot_lab module names
+    :param repeat: number of interpreters per module, the fastest is kept
+    :return: dict module -> seconds
+    """
+    import subprocess
+    code = ("import time, sys%s; t = time.perf_counter(); import %s; "
+            "print(time.perf_counter() - t, 'bpy' in sys.modules, 'mathutils' in sys.modules)")
+    times = {}
+    for name in ("numpy", "shot_lab") + tuple("shot_lab." + mod for mod in modules):
+        best = None
+        for _ in range(repeat):
+            out = subprocess.run([sys.executable, "-c", code % ("" if name == "numpy" else ", numpy", name)], cwd=ROOT,
+                                 stdout=subprocess.PIPE, check=True).stdout.split()
+            best = float(out[0]) if best is None else min(best, float(out[0]))
+            if out[1:] != [b"False", b"False"]:
+                raise RuntimeError("%s imports bpy or mathutils" % name)
+        times[name] = best
+        print("%-25s %7.1f ms" % (name, 1000 * best))
+    return times
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    parser = argparse.ArgumentParser(prog="shot-lab", description="Blender shot lab",
+                                     epilog="Blender jobs: %s. Tools: %s, bench-import."
+                                            % (", ".join(BLENDER_JOBS), ", ".join(TOOLS)))
+    parser.add_argument("--blender", default=os.environ.get("BLENDER", "blender"),
+                        help="Blender executable of the Blender jobs")
+    parser.add_argument("command", choices=sorted(BLENDER_JOBS) + sorted(TOOLS) + ["bench-import"])
+    parser.add_argument("args", nargs=argparse.REMAINDER)
+    args = parser.parse_args(argv)
+    if args.command in BLENDER_JOBS:
+        rest = args.args[1:] if args.args[:1] == ["--"] else args.args
+        return run_blender_job(args.command, rest, args.blender)
+    if args.command == "bench-import":
+        benchmark_imports()
+        return 0
+    return importlib.import_module("shot_lab." + TOOLS[args.command]).main(args.args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,336 @@
+"""
+Frame stacks: the rendered frames of a camera streamed into a single container instead of one JPEG per frame,
+with the ground truth of each frame (frame number, frame time, shot position) and the camera description.
+
+    npy:  <path>.npy (N, H, W) uint8 frames written through np.memmap, <path>.json metadata
+    hdf5: <path>.h5, 'frames' dataset chunked by frame (optionally gzip compressed), metadata datasets and
+          attributes (needs h5py)
+
+    stack = frame_stack.open_stack("3Drecons/camLeft/camLeft_stack.npy")
+    stack.frames[10], stack.time[10], stack.position[10]     (frames memory-mapped, nothing is decoded)
+
+    python -m shot_lab.frame_stack [frames]       (I/O benchmark against a JPEG directory)
+
+The frames are 8 bit like the JPEG renders, but lossless.
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+from . import instrument
+from . import soft_render
+
+FORMATS = ("npy", "hdf5")
+EXTS = {"npy": ".npy", "hdf5": ".h5"}
+VERSION = 1
+
+
+def _h5py():
+    try:
+        import h5py
+    except ImportError:
+        raise ImportError("HDF5 frame stacks need h5py, use the npy format instead")
+    return h5py
+
+
+def stack_paths(path, fmt="npy"):
+    """
+    :param path: stack path, without extension
+    :param fmt: 'npy' or 'hdf5'
+    :return: list of the files of the stack
+    """
+    if fmt == "npy":
+        return [path + ".npy", path + ".json"]
+    if fmt == "hdf5":
+        return [path + ".h5"]
+    raise ValueError("unknown stack format %r" % (fmt,))
+
+
+def _to_uint8(img):
+    img = np.asarray(img)
+    if img.dtype == np.uint8:
+        return img
+    return (np.clip(img, 0., 1.) * 255. + 0.5).astype(np.uint8)
+
+
+class StackWriter:
+    """
+    Writes the frames of a stack whose per frame metadata is known before rendering
+
+    :param path: stack path, without extension
+    :param shape: (H, W) frame shape
+    :param frames: (N,) frame numbers
+    :param times: (N,) frame times (s)
+    :param positions: optional (N, 3) ground truth shot positions
+    :param attrs: JSON serializable camera description (name, pose, resolution, distortion ...)
+    :param fmt: 'npy' or 'hdf5'
+    :param compression: HDF5 compression filter ('gzip', 'lzf') or None
+    """
+    def __init__(self, path, shape, frames, times, positions=None, attrs=None, fmt="npy", compression=None):
+        self.path = path
+        self.fmt = fmt
+        self.frame_numbers = np.asarray(frames, dtype=np.int64)
+        n = len(self.frame_numbers)
+        meta = {"frame": self.frame_numbers, "time": np.asarray(times, dtype=np.float64),
+                "position": np.full((n, 3), np.nan) if positions is None else np.asarray(positions, dtype=np.float64)}
+        attrs = dict(attrs or {}, version=VERSION)
+        self.paths = stack_paths(path, fmt)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if fmt == "npy":
+            self.frames = np.lib.format.open_memmap(self.paths[0], mode="w+", dtype=np.uint8, shape=(n,) + tuple(shape))
+            with open(self.paths[1], "w") as file:
+                json.dump(dict(attrs, **{key: value.tolist() for key, value in meta.items()}), file)
+            self._file = None
+        else:
+            self._file = _h5py().File(self.paths[0], "w")
+            self.frames = self._file.create_dataset("frames", (n,) + tuple(shape), dtype=np.uint8,
+                                                    chunks=(1,) + tuple(shape), compression=compression)
+            for key, value in meta.items():
+                self._file.create_dataset(key, data=value)
+            for key, value in attrs.items():
+                self._file.attrs[key] = json.dumps(value)
+        self.written = 0
+
+    def __len__(self):
+        return len(self.frame_numbers)
+
+    def write(self, index, img):
+        """
+        :param index: frame index in the stack
+        :param img: (H, W) uint8 frame, or float in [0, 1]
+        :return:
+        """
+        self.frames[index] = _to_uint8(img)
+        self.written += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        elif self.frames is not None:
+            self.frames.flush()
+        self.frames = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FrameStack:
+    """
+    Read a frame stack, the frames memory-mapped (npy) or read on access (hdf5)
+
+    :param file_path: .npy or .h5 stack file
+    """
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._file = None
+        if file_path.endswith(EXTS["hdf5"]):
+            self._file = _h5py().File(file_path, "r")
+            self.frames = self._file["frames"]
+            meta = {key: self._file[key][()] for key in ("frame", "time", "position")}
+            self.attrs = {key: json.loads(value) for key, value in self._file.attrs.items()}
+        else:
+            self.frames = np.load(file_path, mmap_mode="r")
+            with open(os.path.splitext(file_path)[0] + ".json") as file:
+                meta = json.load(file)
+            self.attrs = {key: value for key, value in meta.items() if key not in ("frame", "time", "position")}
+        if self.attrs.get("version") != VERSION:
+            raise ValueError("%s: unsupported frame stack version %s" % (file_path, self.attrs.get("version")))
+        self.frame = np.asarray(meta["frame"], dtype=np.int64)
+        self.time = np.asarray(meta["time"], dtype=np.float64)
+        self.position = np.asarray(meta["position"], dtype=np.float64).reshape(-1, 3)
+
+    def __len__(self):
+        return len(self.frame)
+
+    def __getitem__(self, index):
+        return self.frames[index]
+
+    def at(self, frame):
+        """
+        :param frame: frame number
+        :return: (H, W) frame
+        """
+        index = np.searchsorted(self.frame, frame)
+        if index == len(self.frame) or self.frame[index] != frame:
+            raise KeyError("frame %d is not in %s" % (frame, self.file_path))
+        return self.frames[index]
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def camera_attrs(name, location, rot_euler, resx, resy, dist_param, fps, exposure=0.):
+    """
+    :return: stack attrs describing the camera that filmed the frames
+    """
+    return {"camera": name, "location": list(location), "rot_euler": None if rot_euler is None else list(rot_euler),
+            "resolution": [resx, resy], "dist_param": dist_param, "fps": fps, "exposure": exposure}
+
+
+def open_stack(file_path):
+    """
+    :param file_path: .npy or .h5 stack file
+    :return: FrameStack
+    """
+    return FrameStack(file_path)
+
+
+def viewer_frames(scene, frames):
+    """
+    Render frames without writing files: the composited image (after the Lensdist node) is read back through a
+    Viewer node. Its pixels are scene-linear, the sRGB transfer applied here is the Standard view transform
+    SceneBuilder.render_settings sets, so that the frames match the saved files. The compositor is restored once
+    the frames are read (or the generator closed).
+
+    :param scene: bpy scene
+    :param frames: frame numbers
+    :return: generator of (H, W) float32 grayscale frames in [0, 1]
+    """
+    import bpy
+    use_nodes = scene.use_nodes
+    scene.use_nodes = True
+    tree = scene.node_tree
+    viewer = tree.nodes.get("Viewer")
+    created = viewer is None
+    if created:
+        viewer = tree.nodes.new("CompositorNodeViewer")
+    previous = [link.from_socket for link in viewer.inputs[0].links]
+    composite = tree.nodes["Composite"]
+    try:
+        tree.links.new(composite.inputs[0].links[0].from_socket, viewer.inputs[0])
+        buf = None
+        for frame in frames:
+            scene.frame_set(int(frame))
+            with instrument.span("render", frame=int(frame)):
+                bpy.ops.render.render(scene=scene.name)
+            image = bpy.data.images["Viewer Node"]
+            width, height = image.size
+            if buf is None or buf.size != width * height * 4:
+                buf = np.empty(width * height * 4, dtype=np.float32)
+            image.pixels.foreach_get(buf)
+            # Blender rows go upwards, BW is the Rec. 709 luminance
+            rgba = buf.reshape(height, width, 4)[::-1]
+            yield soft_render.srgb(rgba[..., :3] @ soft_render.LUMA.astype(np.float32)).astype(np.float32)
+    finally:
+        if created:
+            tree.nodes.remove(viewer)
+        elif previous:
+            tree.links.new(previous[0], viewer.inputs[0])
+        scene.use_nodes = use_nodes
+
+
+@instrument.spanned()
+def render_stack(scene, path, frames, times, positions=None, attrs=None, fmt="npy", cache=None, backend=None):
+    """
+    Render the frames of the scene animation into a stack, through the render cache
+
+    :param scene: bpy scene (camera, shot and render settings set)
+    :param path: stack path, without extension
+    :param frames: (N,) frame numbers
+    :param times: (N,) frame times (s)
+    :param positions: (N, 3) ground truth shot positions
+    :param attrs: camera description
+    :param fmt: 'npy' or 'hdf5'
+    :param cache: render_cache.RenderCache, the shared one by default
+    :param backend: optional soft_render.Backend rendering in place of Blender
+    :return: True if the render was skipped
+    """
+    from . import render_cache
+    shape = (scene.render.resolution_y * scene.render.resolution_percentage // 100,
+             scene.render.resolution_x * scene.render.resolution_percentage // 100)
+
+    def render():
+        with StackWriter(path, shape, frames, times, positions, attrs, fmt) as writer:
+            for i, img in enumerate(viewer_frames(scene, frames) if backend is None else backend.frames(frames)):
+                writer.write(i, img)
+
+    cache = cache or render_cache.default_cache()
+    if cache is None:
+        render()
+        return False
+    desc = dict(render_cache.describe_scene(scene), stack=[fmt, np.asarray(frames).tolist(), attrs])
+    if backend is not None:
+        desc["backend"] = backend.describe()
+    return cache.cached_render(desc, stack_paths(path, fmt), render)
+
+
+def _dir_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def benchmark(num_frames=500, res=500, radius=0.1):
+    """
+    Write then read back the frames of a shot video as a JPEG directory (imageio or Pillow), an npy stack and
+    an HDF5 stack (when h5py is installed): I/O time and disk footprint
+
+    :param num_frames: number of frames
+    :param res: image resolution
+    :param radius: sphere radius (bu)
+    :return: dict format -> (write s, read s, MB)
+    """
+    from . import projection
+    from . import sphere_tracker
+    from . import trajectories
+    cam = projection.Camera.from_euler((0., -5., 0.), (np.pi / 2, 0., 0.), res, res)
+    t = np.arange(num_frames) / 24.
+    xyz = trajectories.double_sine(t, amplitude=(0.5, 0.5))
+    # rendered outside the timings
+    frames = soft_render.SoftRenderer(cam, sun=(0., -1., 1.)).render_shot(xyz, radius)
+    results = {}
+    tmp = tempfile.mkdtemp()
+    try:
+        jpeg_dir = os.path.join(tmp, "jpeg")
+        os.makedirs(jpeg_dir)
+        try:
+            paths = [os.path.join(jpeg_dir, "cam_%04d.jpg" % i) for i in range(num_frames)]
+            start = time.perf_counter()
+            for path, img in zip(paths, frames):
+                sphere_tracker.write_frame(path, img)
+            write = time.perf_counter() - start
+            start = time.perf_counter()
+            total = sum(float(img.sum()) for img in sphere_tracker.read_frames(paths))
+            results["jpeg"] = (write, time.perf_counter() - start, _dir_size(jpeg_dir) / 1e6, total)
+        except ImportError as err:
+            print("jpeg: skipped (%s)" % err)
+        for fmt in FORMATS:
+            path = os.path.join(tmp, fmt, "cam_stack")
+            try:
+                start = time.perf_counter()
+                with StackWriter(path, (res, res), np.arange(num_frames), t, xyz, {"camera": "cam"}, fmt,
+                                 "lzf" if fmt == "hdf5" else None) as writer:
+                    for i, img in enumerate(frames):
+                        writer.write(i, img)
+                write = time.perf_counter() - start
+            except ImportError as err:
+                print("%s: skipped (%s)" % (fmt, err))
+                continue
+            start = time.perf_counter()
+            with open_stack(path + EXTS[fmt]) as stack:
+                total = sum(float(stack[i].sum()) / 255. for i in range(len(stack)))
+            results[fmt] = (write, time.perf_counter() - start, _dir_size(os.path.dirname(path)) / 1e6, total)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    print("%d frames %dx%d" % (num_frames, res, res))
+    for fmt, (write, read, mb, _) in results.items():
+        print("%-5s write %6.3f s (%7.0f frames/s), read %6.3f s (%7.0f frames/s), %7.1f MB"
+              % (fmt, write, num_frames / write, read, num_frames / read, mb))
+    return {fmt: res[:3] for fmt, res in results.items()}
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
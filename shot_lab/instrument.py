@@ -0,0 +1,271 @@
+"""
+Instrumentation of the Blender jobs: named spans around the scene building and render steps, written as JSON lines
+or as a Chrome trace (chrome://tracing, Perfetto), with an optional cProfile capture of the whole job and the traced
+memory (tracemalloc) of each span.
+
+    blender -b -P make_shot_video.py -- --trace shot_video.json --profile shot_video.prof
+    SHOT_LAB_TRACE=calib.jsonl shot-lab calib-pics -- --dist_param 0.05
+
+    with instrument.span("render", frame=12):
+        ...
+
+    @instrument.spanned()
+    def make_anim(...):
+
+Environment (the job options win):
+    SHOT_LAB_TRACE: trace file, a Chrome trace when it ends with .json, JSON lines otherwise
+    SHOT_LAB_PROFILE: cProfile statistics file (python -m pstats <file>)
+    SHOT_LAB_TRACE_MEMORY: 1 to record the traced memory in the spans (slows the job down)
+
+Disabled (the default), a span is a shared no-op context manager and a decorated function one extra call.
+"""
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+_tracer = None
+_profiler = None
+_profile_path = None
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "args", "start", "mem")
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        tracer = self.tracer
+        tracer.depth += 1
+        if tracer.memory:
+            import tracemalloc
+            self.mem = tracemalloc.get_traced_memory()[0]
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter_ns()
+        tracer = self.tracer
+        tracer.depth -= 1
+        if tracer.memory:
+            import tracemalloc
+            current, peak = tracemalloc.get_traced_memory()
+            self.args["mem_delta_mb"] = round((current - self.mem) / 1e6, 3)
+            self.args["mem_peak_mb"] = round(peak / 1e6, 3)
+        tracer.record(self.name, self.start, end, self.args)
+        return False
+
+
+class Tracer:
+    """
+    Collects the spans and writes them
+
+    :param path: trace file, a Chrome trace (.json) or JSON lines (any other extension)
+    :param memory: record the traced memory in the spans (starts tracemalloc)
+    """
+    def __init__(self, path, memory=False):
+        self.path = path
+        self.chrome = path.endswith(".json")
+        self.memory = memory
+        self.depth = 0
+        self.origin = time.perf_counter_ns()
+        self.pid = os.getpid()
+        self.events = []
+        self.totals = {}
+        self._file = None
+        if memory:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if not self.chrome:
+            self._file = open(path, "w")
+
+    def span(self, name, args):
+        return _Span(self, name, args)
+
+    def record(self, name, start, end, args):
+        """
+        :param name: span name
+        :param start, end: perf_counter_ns bounds
+        :param args: span arguments
+        :return:
+        """
+        count, total = self.totals.get(name, (0, 0))
+        self.totals[name] = (count + 1, total + end - start)
+        ts, dur = (start - self.origin) / 1e3, (end - start) / 1e3
+        if self.chrome:
+            self.events.append({"name": name, "cat": "shot_lab", "ph": "X", "ts": ts, "dur": dur, "pid": self.pid,
+                                "tid": threading.get_ident(), "args": args})
+        else:
+            self._file.write(json.dumps({"name": name, "ts_us": round(ts, 1), "dur_us": round(dur, 1),
+                                         "depth": self.depth, "pid": self.pid, "args": args}) + "\n")
+
+    def summary(self):
+        """:return: text table of the calls and total time per span name, slowest first"""
+        lines = ["%-40s %7s %10s" % ("span", "calls", "total s")]
+        for name, (count, total) in sorted(self.totals.items(), key=lambda item: -item[1][1]):
+            lines.append("%-40s %7d %10.4f" % (name, count, total / 1e9))
+        return "\n".join(lines)
+
+    def close(self):
+        if self.chrome:
+            with open(self.path, "w") as file:
+                json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, file)
+        elif self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def span(name, **args):
+    """
+    :param name: span name
+    :param args: JSON serializable values recorded with the span
+    :return: context manager timing its block, a no-op when tracing is off
+    """
+    tracer = _tracer
+    if tracer is None:
+        return _NULL
+    return tracer.span(name, args)
+
+
+def spanned(name=None):
+    """
+    Decorator wrapping each call of a function in a span
+
+    :param name: span name, the function qualified name by default
+    :return: decorator
+    """
+    def decorate(fn):
+        label = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            tracer = _tracer
+            if tracer is None:
+                return fn(*args, **kwargs)
+            with tracer.span(label, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def enabled():
+    return _tracer is not None
+
+
+def configure(trace=None, profile=None, memory=None):
+    """
+    Start the instrumentation of the job, SHOT_LAB_TRACE, SHOT_LAB_PROFILE and SHOT_LAB_TRACE_MEMORY giving the
+    settings left to None. The files are written at exit (or by close).
+
+    :param trace: trace file
+    :param profile: cProfile statistics file
+    :param memory: record the traced memory in the spans
+    :return: Tracer, None when tracing is off
+    """
+    global _tracer, _profiler, _profile_path
+    trace = trace or os.environ.get("SHOT_LAB_TRACE") or None
+    profile = profile or os.environ.get("SHOT_LAB_PROFILE") or None
+    if memory is None:
+        memory = os.environ.get("SHOT_LAB_TRACE_MEMORY", "0") not in ("", "0")
+    close()
+    if trace:
+        _tracer = Tracer(trace, memory)
+    if profile:
+        import cProfile
+        _profiler = cProfile.Profile()
+        _profile_path = profile
+        _profiler.enable()
+    if trace or profile:
+        atexit.register(close, True)
+    return _tracer
+
+
+def close(summary=False):
+    """
+    Stop the instrumentation and write the trace and profile files
+
+    :param summary: print the time spent per span name
+    :return:
+    """
+    global _tracer, _profiler
+    if _profiler is not None:
+        _profiler.disable()
+        os.makedirs(os.path.dirname(os.path.abspath(_profile_path)), exist_ok=True)
+        _profiler.dump_stats(_profile_path)
+        _profiler = None
+    if _tracer is not None:
+        _tracer.close()
+        if summary:
+            print(_tracer.summary())
+            print("trace written to %s" % _tracer.path)
+        _tracer = None
+
+
+def add_arguments(parser):
+    """Add the --trace, --profile and --trace_memory options of the Blender jobs"""
+    parser.add_argument("--trace", default=None,
+                        help="span trace file, Chrome trace (.json) or JSON lines, see instrument.py")
+    parser.add_argument("--profile", default=None, help="cProfile statistics file of the whole job")
+    parser.add_argument("--trace_memory", action="store_true", default=None,
+                        help="record the traced memory in the spans")
+
+
+def benchmark(calls=200000):
+    """
+    Cost of a span and of a decorated call, tracing off and on
+
+    :param calls: spans per measure
+    :return: dict of ns per call
+    """
+    import tempfile
+
+    @spanned()
+    def decorated():
+        pass
+
+    def bare():
+        pass
+
+    def per_call(fn):
+        start = time.perf_counter_ns()
+        for _ in range(calls):
+            fn()
+        return (time.perf_counter_ns() - start) / calls
+
+    def with_span():
+        with span("block"):
+            pass
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for state, trace in (("off", None), ("jsonl", "trace.jsonl"), ("chrome", "trace.json")):
+            configure(trace and os.path.join(tmp, trace), memory=False)
+            results[state] = {"bare call": per_call(bare), "span": per_call(with_span),
+                              "decorated call": per_call(decorated)}
+            close()
+    for state, res in results.items():
+        print("%-6s %s" % (state, ", ".join("%s %6.0f ns" % item for item in res.items())))
+    return results
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
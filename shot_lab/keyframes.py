@@ -0,0 +1,305 @@
+"""
+Bulk keyframing: fills the location fcurves of an object from a (N, 3) array in one pass,
+instead of one scene.frame_set/keyframe_insert (and depsgraph evaluation) per frame.
+
+Long trajectories (Trajectory.txt captures hold tens of thousands of samples) are first decimated by
+fit_keyframes: the fewest Bezier keyframes whose curve stays within a position tolerance of every sample.
+"""
+import sys
+import time
+import numpy as np
+from . import instrument
+from . import trajectories
+
+
+@instrument.spanned()
+def insert_location_keyframes(obj, frames, coords, actions=None, slopes=None):
+    """
+    Create the location fcurves of obj once and set all their keyframe points in bulk
+
+    :param obj: object to animate
+    :param frames: (N,) frame numbers
+    :param coords: (N, 3) locations
+    :param actions: action collection, bpy.data.actions by default
+    :param slopes: optional (N, 3) location derivatives (per frame) giving free Bezier handles, see fit_keyframes.
+        The automatic handles are used by default.
+    :return: the object action
+    """
+    frames = np.asarray(frames, dtype=np.float32).ravel()
+    coords = np.asarray(coords, dtype=np.float32).reshape(-1, 3)
+    if len(frames) != len(coords):
+        raise ValueError("%d frames for %d locations" % (len(frames), len(coords)))
+    if actions is None:
+        import bpy
+        actions = bpy.data.actions
+    anim = obj.animation_data_create()
+    if anim.action is None:
+        anim.action = actions.new(obj.name + "Action")
+    fcurves = anim.action.fcurves
+    co = np.empty((len(frames), 2), dtype=np.float32)
+    co[:, 0] = frames
+    if slopes is not None:
+        # raw enum value of the 'FREE' handle type
+        free = np.zeros(len(frames), dtype=np.int32)
+        # handles a third of the way to the neighbour keys: the Bezier segments are then the Hermite cubics
+        step = np.diff(frames)
+        if len(step):
+            before, after = np.concatenate((step[:1], step)), np.concatenate((step, step[-1:]))
+        else:
+            # a single key: handles on the key
+            before = after = np.zeros(1, dtype=np.float32)
+        left = np.empty((len(frames), 2), dtype=np.float32)
+        right = np.empty((len(frames), 2), dtype=np.float32)
+        left[:, 0] = frames - before / 3.
+        right[:, 0] = frames + after / 3.
+        slopes = np.asarray(slopes, dtype=np.float32).reshape(-1, 3)
+    for index in range(3):
+        fcurve = fcurves.find("location", index=index)
+        if fcurve is not None:
+            fcurves.remove(fcurve)
+        fcurve = fcurves.new("location", index=index, action_group="Object Transforms")
+        points = fcurve.keyframe_points
+        points.add(len(frames))
+        co[:, 1] = coords[:, index]
+        with instrument.span("keyframes.foreach_set", index=index, count=len(frames)):
+            points.foreach_set("co", co.ravel())
+        if slopes is not None:
+            points.foreach_set("handle_left_type", free)
+            points.foreach_set("handle_right_type", free)
+            left[:, 1] = coords[:, index] + slopes[:, index] * (left[:, 0] - frames)
+            right[:, 1] = coords[:, index] + slopes[:, index] * (right[:, 0] - frames)
+            points.foreach_set("handle_left", left.ravel())
+            points.foreach_set("handle_right", right.ravel())
+        # sorts the points and computes the automatic Bezier handles
+        with instrument.span("keyframes.fcurve_update", index=index):
+            fcurve.update()
+    return anim.action
+
+
+class KeyframeFit:
+    """
+    Keyframes of a decimated trajectory, their Bezier slopes and the fit quality
+
+    :param frames: (K,) keyframe frames
+    :param coords: (K, 3) keyframe locations (trajectory samples)
+    :param slopes: (K, 3) location derivatives at the keyframes
+    :param index: (K,) sample index of each keyframe
+    :param num_samples: number of trajectory samples
+    :param max_error: largest distance between a sample and the keyframed curve
+    """
+    def __init__(self, frames, coords, slopes, index, num_samples, max_error):
+        self.frames = frames
+        self.coords = coords
+        self.slopes = slopes
+        self.index = index
+        self.num_samples = num_samples
+        self.max_error = max_error
+
+    def __len__(self):
+        return len(self.frames)
+
+    @property
+    def ratio(self):
+        """compression ratio, samples per keyframe"""
+        return self.num_samples / float(len(self.frames))
+
+    def evaluate(self, frames):
+        """
+        :param frames: (N,) frames
+        :return: (N, 3) locations of the keyframed curve
+        """
+        return trajectories.hermite(np.clip(frames, self.frames[0], self.frames[-1]), self.frames, self.coords,
+                                    self.slopes)
+
+    def __str__(self):
+        return "%d samples -> %d keyframes (%.1fx), max error %.3g bu" % (self.num_samples, len(self), self.ratio,
+                                                                          self.max_error)
+
+
+def _fd_slopes(frames, coords, index):
+    """Slopes of the sampled trajectory at the keyframes, by finite differences"""
+    if len(frames) < 2:
+        return np.zeros((len(index), 3))
+    return np.gradient(coords, frames, axis=0)[index]
+
+
+def _lsq_slopes(frames, coords, index, prior, weight=1e-3):
+    """
+    Keyframe slopes minimizing the squared distance between the samples and the Hermite curve through the
+    keyframes: a tridiagonal system, each segment depending on the slopes at its two ends.
+    A small pull toward the prior slopes keeps it regular for segments without inner samples.
+    """
+    num = len(index)
+    seg = np.clip(np.searchsorted(index, np.arange(len(frames)), side="right") - 1, 0, num - 2)
+    h = frames[index[seg + 1]] - frames[index[seg]]
+    s = (frames - frames[index[seg]]) / h
+    s2 = s * s
+    s3 = s2 * s
+    b0 = h * (s3 - 2 * s2 + s)
+    b1 = h * (s3 - s2)
+    resid = coords - ((2 * s3 - 3 * s2 + 1)[:, None] * coords[index[seg]]
+                      + (3 * s2 - 2 * s3)[:, None] * coords[index[seg + 1]])
+    diag = np.bincount(seg, b0 * b0, num) + np.bincount(seg + 1, b1 * b1, num)
+    upper = np.bincount(seg, b0 * b1, num - 1)
+    rhs = np.column_stack([np.bincount(seg, b0 * resid[:, i], num) + np.bincount(seg + 1, b1 * resid[:, i], num)
+                           for i in range(3)])
+    reg = weight * np.mean(np.diff(frames[index]) ** 2)
+    diag = diag + reg
+    rhs = rhs + reg * prior
+    return _solve_tridiagonal(upper, diag, upper, rhs)
+
+
+def _solve_tridiagonal(lower, diag, upper, rhs):
+    """
+    Parallel cyclic reduction: log2(n) vectorized elimination passes instead of the sequential Thomas algorithm
+
+    :param lower: (n - 1,) sub-diagonal
+    :param diag: (n,) diagonal
+    :param upper: (n - 1,) super-diagonal
+    :param rhs: (n, m) right-hand sides
+    :return: (n, m) solutions
+    """
+    num = len(diag)
+    a = np.concatenate(([0.], lower))
+    b = np.array(diag, dtype=np.float64)
+    c = np.concatenate((upper, [0.]))
+    d = np.array(rhs, dtype=np.float64)
+    stride = 1
+    while stride < num:
+        # rows i - stride and i + stride, out of range rows being the identity
+        b_lo = np.concatenate((np.ones(stride), b[:-stride]))
+        b_hi = np.concatenate((b[stride:], np.ones(stride)))
+        alpha = -a / b_lo
+        gamma = -c / b_hi
+        a_lo = np.concatenate((np.zeros(stride), a[:-stride]))
+        c_lo = np.concatenate((np.zeros(stride), c[:-stride]))
+        a_hi = np.concatenate((a[stride:], np.zeros(stride)))
+        c_hi = np.concatenate((c[stride:], np.zeros(stride)))
+        d_lo = np.concatenate((np.zeros((stride,) + d.shape[1:]), d[:-stride]))
+        d_hi = np.concatenate((d[stride:], np.zeros((stride,) + d.shape[1:])))
+        b = b + alpha * c_lo + gamma * a_hi
+        d = d + alpha[:, None] * d_lo + gamma[:, None] * d_hi
+        a = alpha * a_lo
+        c = gamma * c_hi
+        stride *= 2
+    return d / b[:, None]
+
+
+def fit_keyframes(frames, coords, tolerance, method="fd", max_iterations=1000):
+    """
+    Decimate a sampled trajectory into Bezier keyframes, Ramer-Douglas-Peucker style: starting from the end
+    samples, every segment of the curve whose farthest sample is beyond the tolerance is split at that sample,
+    all the segments at once, until the whole curve fits.
+
+    :param frames: (N,) sample frames, increasing
+    :param coords: (N, 3) sample locations
+    :param tolerance: largest allowed distance between a sample and the keyframed curve (bu)
+    :param method: keyframe slopes, 'fd' (finite differences) or 'lsq' (least squares fit of the samples).
+        The least squares slopes spread the error of a segment over its neighbours, which the splitting then chases:
+        on smooth samples they need about twice the keyframes of 'fd'. They only pay off on noisy samples, where
+        the finite differences follow the noise (see benchmark_decimation).
+    :param max_iterations: bound on the number of refinement passes
+    :return: KeyframeFit
+    """
+    frames = np.asarray(frames, dtype=np.float64).ravel()
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 3)
+    if len(frames) != len(coords):
+        raise ValueError("%d frames for %d locations" % (len(frames), len(coords)))
+    if method not in ("lsq", "fd"):
+        raise ValueError("unknown slope method %r" % (method,))
+    num = len(frames)
+    if num <= 2:
+        index = np.arange(num)
+        return KeyframeFit(frames, coords, _fd_slopes(frames, coords, index), index, num, 0.)
+    index = np.array([0, num - 1])
+    for iteration in range(max_iterations + 1):
+        slopes = _fd_slopes(frames, coords, index)
+        if method == "lsq":
+            slopes = _lsq_slopes(frames, coords, index, slopes)
+        err = np.linalg.norm(trajectories.hermite(frames, frames[index], coords[index], slopes) - coords, axis=1)
+        seg_max = np.maximum.reduceat(err, index[:-1])
+        bad = seg_max > tolerance
+        if not bad.any() or iteration == max_iterations:
+            break
+        # farthest sample of every segment beyond the tolerance
+        seg = np.repeat(np.arange(len(index) - 1), np.diff(np.append(index[:-1], num)))
+        worst = np.flatnonzero(bad[seg] & (err == seg_max[seg]))
+        _, first = np.unique(seg[worst], return_index=True)
+        index = np.union1d(index, worst[first])
+    return KeyframeFit(frames[index], coords[index], slopes, index, num, float(err.max()))
+
+
+def _insert_per_frame(scene, obj, frames, coords):
+    """Former make_shot_film loop, kept as the timing reference"""
+    for frame, loc in zip(frames, coords):
+        scene.frame_set(frame)
+        obj.location = list(loc)
+        obj.keyframe_insert(data_path="location")
+
+
+def timing(frame_counts=(100, 300, 1000, 3000)):
+    """
+    Time the per-frame and bulk keyframing paths on the bpy stand-in for growing frame counts
+
+    :param frame_counts: numbers of keyframes to insert
+    :return:
+    """
+    from . import bpy_standin
+    print("%8s %14s %14s" % ("frames", "per-frame (s)", "bulk (s)"))
+    for count in frame_counts:
+        coords = np.column_stack((np.linspace(-4., 4., count), np.zeros(count), np.zeros(count)))
+        frames = np.arange(count)
+        bpy = bpy_standin.BpyStandin()
+        shot = bpy.add_object("Shot")
+        start = time.perf_counter()
+        _insert_per_frame(bpy.context.scene, shot, frames, coords)
+        per_frame = time.perf_counter() - start
+        bpy = bpy_standin.BpyStandin()
+        shot = bpy.add_object("Shot")
+        start = time.perf_counter()
+        insert_location_keyframes(shot, frames, coords, bpy.data.actions)
+        bulk = time.perf_counter() - start
+        print("%8d %14.4f %14.4f" % (count, per_frame, bulk))
+
+
+def benchmark_decimation(tolerances=(1e-5, 1e-4, 1e-3), noise=(0., 1e-5), rate=19000.):
+    """
+    Decimate a one second bouncing, spinning ballistic flight sampled like Trajectory.txt, one keyframe per sample
+    (frame = sample index), and check the keyframes on the bpy stand-in
+
+    :param tolerances: decimation tolerances (bu)
+    :param noise: standard deviations of the position noise added to the samples (bu)
+    :param rate: sampling rate (Hz)
+    :return:
+    """
+    from . import bpy_standin
+    rng = np.random.default_rng(0)
+    flight = trajectories.ballistic((-4., 0., 0.5), (20., 0., 3.), 1., 1e-4, spin=(0., 0., 300.), ground=0.)
+    t, xyz = flight.resample(rate)
+    frames = np.arange(len(t))
+    print("%8s %10s %6s %10s %12s %10s %10s" % ("noise", "tolerance", "slopes", "keyframes", "ratio", "max error",
+                                                  "time (s)"))
+    for sigma in noise:
+        samples = xyz + rng.normal(0., sigma, xyz.shape) if sigma else xyz
+        for tolerance in tolerances:
+            for method in ("lsq", "fd"):
+                start = time.perf_counter()
+                fit = fit_keyframes(frames, samples, tolerance, method)
+                duration = time.perf_counter() - start
+                print("%8.0e %10.0e %6s %10d %11.1fx %10.2e %10.3f" % (sigma, tolerance, method, len(fit), fit.ratio,
+                                                                      fit.max_error, duration))
+    bpy = bpy_standin.BpyStandin()
+    shot = bpy.add_object("Shot")
+    insert_location_keyframes(shot, fit.frames, fit.coords, bpy.data.actions, fit.slopes)
+    err = 0.
+    for frame in frames[::97]:
+        bpy.context.scene.frame_set(frame)
+        err = max(err, np.linalg.norm(np.array(shot.location) - samples[frame]))
+    print("stand-in Bezier fcurves, max error %.2e bu (float32 keyframes)" % err)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["decimate"]:
+        benchmark_decimation([float(arg) for arg in sys.argv[2:]] or (1e-5, 1e-4, 1e-3))
+    else:
+        timing([int(arg) for arg in sys.argv[1:]] or (100, 300, 1000, 3000))
@@ -0,0 +1,240 @@
+"""
+Lens distortion remap tables: the pixel mapping of the Lensdist compositor node (see projection.py) is computed
+once per (resolution, distortion parameter, direction) as bilinear gather indices and weights, stored as .npy
+files and memory-mapped on later uses. A table then applies to a whole frame stack in one vectorized gather.
+
+Directions:
+    'distort': raw render -> composited image, what add_lens_dist does
+    'undistort': composited image -> raw render, to get pinhole frames back from the rendered sequences
+
+Environment:
+    SHOT_LAB_REMAP_CACHE: table directory (default .remap_cache at the repository root)
+"""
+import hashlib
+import os
+import sys
+import time
+import numpy as np
+from . import projection
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_tables = {}
+
+
+def cache_dir():
+    return os.environ.get("SHOT_LAB_REMAP_CACHE") or os.path.join(ROOT, ".remap_cache")
+
+
+def source_coords(resx, resy, dist_param, direction="distort"):
+    """
+    Source pixel position of every output pixel
+
+    :param resx, resy: image resolution
+    :param dist_param: Lensdist distortion parameter
+    :param direction: 'distort' or 'undistort'
+    :return: (resy, resx, 2) pixel coordinates in the source image, NaN where the output is empty
+    """
+    v, u = np.mgrid[0:resy, 0:resx] + 0.5
+    uv = np.stack((u, v), axis=-1)
+    if direction == "distort":
+        return projection.undistort_points(uv, dist_param, resx, resy)
+    if direction == "undistort":
+        return projection.distort_points(uv, dist_param, resx, resy)
+    raise ValueError("unknown remap direction '%s'" % direction)
+
+
+def bilinear_table(coords, resx, resy):
+    """
+    Gather indices and weights of the bilinear interpolation at the given source positions
+
+    :param coords: (resy, resx, 2) source pixel coordinates (pixel centers at half integers)
+    :param resx, resy: source resolution
+    :return: (4, resy * resx) int32 flat source indices, (4, resy * resx) float32 weights (0 outside the source)
+    """
+    x = coords[..., 0].ravel() - 0.5
+    y = coords[..., 1].ravel() - 0.5
+    valid = np.isfinite(x) & np.isfinite(y) & (x > -1.) & (x < resx) & (y > -1.) & (y < resy)
+    x, y = np.where(valid, x, 0.), np.where(valid, y, 0.)
+    x0, y0 = np.floor(x).astype(np.int64), np.floor(y).astype(np.int64)
+    fx, fy = x - x0, y - y0
+    index = np.empty((4, len(x)), dtype=np.int32)
+    weight = np.empty((4, len(x)), dtype=np.float32)
+    for i, (dx, dy, w) in enumerate(((0, 0, (1 - fx) * (1 - fy)), (1, 0, fx * (1 - fy)),
+                                     (0, 1, (1 - fx) * fy), (1, 1, fx * fy))):
+        xi, yi = x0 + dx, y0 + dy
+        inside = valid & (xi >= 0) & (xi < resx) & (yi >= 0) & (yi < resy)
+        index[i] = np.where(inside, yi * resx + xi, 0)
+        weight[i] = np.where(inside, w, 0.)
+    return index, weight
+
+
+class RemapTable:
+    """
+    Precomputed remap of frames of a given resolution
+
+    :param index: (4, resy * resx) flat source indices
+    :param weight: (4, resy * resx) bilinear weights
+    :param resx, resy: image resolution
+    """
+    def __init__(self, index, weight, resx, resy):
+        self.index = index
+        self.weight = weight
+        self.resx = resx
+        self.resy = resy
+        # nearest neighbour gather: the source pixel with the largest weight
+        self._nearest = None
+
+    @property
+    def nearest(self):
+        if self._nearest is None:
+            best = np.argmax(self.weight, axis=0)
+            cols = np.arange(self.index.shape[1])
+            self._nearest = (self.index[best, cols], self.weight[best, cols] > 0.)
+        return self._nearest
+
+    def apply(self, frames, mode="bilinear", fill=0., out=None, chunk=64):
+        """
+        Remap a frame or a frame stack
+
+        :param frames: (resy, resx[, C]) frame or (N, resy, resx[, C]) stack, e.g. a memory-mapped sequence
+        :param mode: 'bilinear' or 'nearest'
+        :param fill: value of the output pixels with no source
+        :param out: optional output array of the stack shape
+        :param chunk: number of frames gathered together
+        :return: remapped frames, float32 unless out is given
+        """
+        frames = np.asarray(frames)
+        single = frames.ndim == 2 or (frames.ndim == 3 and frames.shape[2] <= 4)
+        stack = frames[None] if single else frames
+        if stack.shape[1:3] != (self.resy, self.resx):
+            raise ValueError("frames of shape %s do not match the %dx%d table" % (stack.shape, self.resx, self.resy))
+        if out is None:
+            out = np.empty(frames.shape, dtype=np.float32)
+        target = out[None] if single else out
+        flat_shape = (len(stack), self.resy * self.resx) + stack.shape[3:]
+        extra = (None,) * (stack.ndim - 3)
+        for start in range(0, len(stack), chunk):
+            src = stack[start:start + chunk].reshape((-1,) + flat_shape[1:])
+            if mode == "nearest":
+                index, valid = self.nearest
+                res = np.where(valid[(slice(None),) + extra], src[:, index], fill)
+            else:
+                res = src[:, self.index[0]] * self.weight[0][(slice(None),) + extra]
+                for i in range(1, 4):
+                    res += src[:, self.index[i]] * self.weight[i][(slice(None),) + extra]
+                if fill:
+                    res[:, self.weight.sum(axis=0) == 0.] = fill
+            target[start:start + chunk] = res.reshape((len(res),) + stack.shape[1:])
+        return out
+
+
+def _key(resx, resy, dist_param, direction):
+    return hashlib.sha1(("%s %d %d %r" % (direction, resx, resy, float(dist_param))).encode()).hexdigest()[:16]
+
+
+def remap_table(resx, resy, dist_param, direction="distort", cache=True):
+    """
+    Remap table, built on first use then memory-mapped from the cache directory
+
+    :param resx, resy: image resolution
+    :param dist_param: Lensdist distortion parameter
+    :param direction: 'distort' or 'undistort'
+    :param cache: False to build the table in memory only
+    :return: RemapTable
+    """
+    key = _key(resx, resy, dist_param, direction)
+    if key in _tables:
+        return _tables[key]
+    if cache:
+        base = os.path.join(cache_dir(), "%s_%dx%d_%s" % (direction, resx, resy, key))
+        if not os.path.isfile(base + "_weight.npy"):
+            os.makedirs(cache_dir(), exist_ok=True)
+            index, weight = bilinear_table(source_coords(resx, resy, dist_param, direction), resx, resy)
+            # weights written last: their presence marks a complete table
+            for name, arr in (("_index", index), ("_weight", weight)):
+                tmp = base + name + ".tmp.npy"
+                np.save(tmp, arr)
+                os.replace(tmp, base + name + ".npy")
+        table = RemapTable(np.load(base + "_index.npy", mmap_mode="r"), np.load(base + "_weight.npy", mmap_mode="r"),
+                           resx, resy)
+    else:
+        table = RemapTable(*bilinear_table(source_coords(resx, resy, dist_param, direction), resx, resy), resx, resy)
+    _tables[key] = table
+    return table
+
+
+def distort(frames, dist_param, **kwargs):
+    """
+    Apply the Lensdist distortion to raw frames
+
+    :param frames: frame or (N, resy, resx[, C]) stack
+    :param dist_param: Lensdist distortion parameter
+    :return: distorted frames
+    """
+    frames = np.asarray(frames)
+    resy, resx = _resolution(frames)
+    return remap_table(resx, resy, dist_param, "distort").apply(frames, **kwargs)
+
+
+def undistort(frames, dist_param, **kwargs):
+    """
+    Undo the Lensdist distortion of rendered frames
+
+    :param frames: frame or (N, resy, resx[, C]) stack
+    :param dist_param: Lensdist distortion parameter
+    :return: undistorted frames
+    """
+    frames = np.asarray(frames)
+    resy, resx = _resolution(frames)
+    return remap_table(resx, resy, dist_param, "undistort").apply(frames, **kwargs)
+
+
+def _resolution(frames):
+    """(resy, resx) of a (H, W), (H, W, C), (N, H, W) or (N, H, W, C) array, with at most 4 channels"""
+    if frames.ndim == 2 or (frames.ndim == 3 and frames.shape[2] <= 4):
+        return frames.shape[:2]
+    return frames.shape[1:3]
+
+
+def _per_frame(frames, dist_param):
+    """Reference: mapping recomputed for every frame"""
+    out = np.empty(frames.shape, dtype=np.float32)
+    resy, resx = frames.shape[1:3]
+    for i, frame in enumerate(frames):
+        index, weight = bilinear_table(source_coords(resx, resy, dist_param, "undistort"), resx, resy)
+        out[i] = np.sum(frame.ravel()[index] * weight, axis=0).reshape(resy, resx)
+    return out
+
+
+def benchmark(num=2000, res=256, dist_param=0.05):
+    """
+    Undistort a synthetic sequence with the cached table and with the mapping recomputed per frame
+
+    :param num: number of frames
+    :param res: frame resolution
+    :param dist_param: Lensdist distortion parameter
+    :return:
+    """
+    v, u = np.mgrid[0:res, 0:res] + 0.5
+    base = (0.5 + 0.5 * np.sin(u / 7.) * np.cos(v / 11.)).astype(np.float32)
+    frames = np.broadcast_to(base, (num, res, res))
+    start = time.perf_counter()
+    _tables.clear()
+    remap_table(res, res, dist_param, "undistort", cache=False)
+    print("table build: %.3f s" % (time.perf_counter() - start))
+    count = min(num, 50)
+    start = time.perf_counter()
+    _per_frame(frames[:count], dist_param)
+    print("per frame mapping: %7.0f frames/s" % (count / (time.perf_counter() - start)))
+    for mode in ("nearest", "bilinear"):
+        start = time.perf_counter()
+        undistort(frames, dist_param, mode=mode)
+        print("table %-8s    %7.0f frames/s" % (mode, num / (time.perf_counter() - start)))
+    # a distortion followed by an undistortion only blurs the frame (bilinear resampling twice)
+    back = undistort(distort(base, dist_param), dist_param)
+    inner = slice(res // 4, 3 * res // 4)
+    print("round trip error: %.4f" % np.max(np.abs(back - base)[inner, inner]))
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,283 @@
+"""
+Render-free pinhole camera model following the Blender camera conventions, to get the ground truth image
+position of the shot or of the chessboard corners without launching a render.
+
+Conventions:
+    camera looks along its local -Z axis with Y up (point_at uses to_track_quat('-Z', 'Y'))
+    focal length and sensor width in mm, sensor fit AUTO, square pixels, no lens shift
+    pixel coordinates (u, v): u to the right, v downwards, origin at the top-left corner of the image,
+    pixel centers at half integers (row v, column u of the image array is the pixel [v, u])
+    lens distortion follows the CompositorNodeLensdist node (use_projector = False, no dispersion, no fit)
+"""
+import sys
+import time
+import numpy as np
+
+
+def rot_x(ang):
+    c, s = np.cos(ang), np.sin(ang)
+    return np.array([[1., 0., 0.], [0., c, -s], [0., s, c]])
+
+
+def rot_y(ang):
+    c, s = np.cos(ang), np.sin(ang)
+    return np.array([[c, 0., s], [0., 1., 0.], [-s, 0., c]])
+
+
+def rot_z(ang):
+    c, s = np.cos(ang), np.sin(ang)
+    return np.array([[c, -s, 0.], [s, c, 0.], [0., 0., 1.]])
+
+
+def ops_rotate(angle, axis):
+    """
+    Rotation of bpy.ops.transform.rotate(value=angle, orient_axis=axis) in the global orientation, about the
+    object origin. The operator turns by -value about the axis (Blender >= 2.80).
+
+    :param angle: operator value in radians
+    :param axis: 'X', 'Y' or 'Z'
+    :return: 3x3 rotation matrix, left-multiplying the object rotation
+    """
+    return {"X": rot_x, "Y": rot_y, "Z": rot_z}[axis](-angle)
+
+
+def euler_rotation(rot_euler):
+    """
+    Rotation matrix of a Blender XYZ euler triplet (obj.rotation_euler)
+
+    :param rot_euler: (X, Y, Z) angles in radians
+    :return: 3x3 rotation matrix, columns are the object axes in world coordinates
+    """
+    return rot_z(rot_euler[2]) @ rot_y(rot_euler[1]) @ rot_x(rot_euler[0])
+
+
+def look_at_rotation(camPos, target, roll=0.):
+    """
+    Rotation given to a camera by point_at: local -Z toward the target, local Y as close as possible to world Z
+
+    :param camPos: camera position triplet
+    :param target: looked at position triplet
+    :param roll: rotation about the viewing axis in radians
+    :return: 3x3 rotation matrix
+    """
+    direction = np.asarray(target, dtype=float) - np.asarray(camPos, dtype=float)
+    z_axis = -direction / np.linalg.norm(direction)
+    up = np.array([0., 0., 1.]) - z_axis[2] * z_axis
+    if np.linalg.norm(up) < 1e-9:
+        # looking straight down keeps the world axes, looking straight up flips Y
+        y_axis = np.array([0., 1., 0.]) if direction[2] < 0 else np.array([0., -1., 0.])
+    else:
+        y_axis = up / np.linalg.norm(up)
+    x_axis = np.cross(y_axis, z_axis)
+    return np.column_stack((x_axis, y_axis, z_axis)) @ rot_z(roll)
+
+
+def lensdist_scale(dist_param):
+    """
+    Scale applied by the Lensdist node to keep the image centered, 1 / (1 + k) for barrel (k < 0) and pincushion
+    distortions alike (fit off)
+
+    :param dist_param: distortion parameter
+    :return: clamped parameter, scale
+    """
+    k = min(max(dist_param, -0.999), 1.)
+    return k, 1. / (1. + k)
+
+
+def distort_points(uv, dist_param, resx, resy):
+    """
+    Pixel position in the composited image of a pixel of the raw render (inverse of the Lensdist lookup)
+
+    :param uv: (..., 2) undistorted pixel coordinates
+    :param dist_param: Lensdist distortion parameter
+    :param resx, resy: image resolution
+    :return: (..., 2) distorted pixel coordinates
+    """
+    uv = np.asarray(uv, dtype=float)
+    if dist_param == 0.:
+        return uv.copy()
+    k, sc = lensdist_scale(dist_param)
+    center = np.array([resx / 2., resy / 2.])
+    n_in = (uv - center) / center
+    r2 = np.sum(n_in**2, axis=-1, keepdims=True)
+    return center + center * n_in / (sc * (1. + k * r2))
+
+
+def undistort_points(uv, dist_param, resx, resy):
+    """
+    Raw render pixel looked up by the Lensdist node for a pixel of the composited image
+
+    :param uv: (..., 2) distorted pixel coordinates
+    :param dist_param: Lensdist distortion parameter
+    :param resx, resy: image resolution
+    :return: (..., 2) undistorted pixel coordinates, NaN where the node outputs nothing
+    """
+    uv = np.asarray(uv, dtype=float)
+    if dist_param == 0.:
+        return uv.copy()
+    k, sc = lensdist_scale(dist_param)
+    center = np.array([resx / 2., resy / 2.])
+    n_out = sc * (uv - center) / center
+    t = 1. - 4. * k * np.sum(n_out**2, axis=-1, keepdims=True)
+    with np.errstate(invalid="ignore"):
+        n_in = 2. * n_out / (1. + np.sqrt(np.where(t >= 0., t, np.nan)))
+    return center + center * n_in
+
+
+class Camera:
+    """
+    Pinhole camera
+
+    :param camPos: camera position triplet
+    :param rotation: 3x3 rotation matrix (camera axes in world coordinates)
+    :param resx, resy: image resolution
+    :param lens: focal length (mm), Blender default 50
+    :param sensor_width: sensor size (mm), Blender default 36
+    :param dist_param: Lensdist distortion parameter, see add_lens_dist
+    """
+    def __init__(self, camPos, rotation, resx, resy, lens=50., sensor_width=36., dist_param=0.):
+        self.location = np.asarray(camPos, dtype=float)
+        self.rotation = np.asarray(rotation, dtype=float)
+        self.resx = resx
+        self.resy = resy
+        self.lens = lens
+        self.sensor_width = sensor_width
+        self.dist_param = dist_param
+
+    @classmethod
+    def look_at(cls, camPos, target, resx, resy, roll=0., **kwargs):
+        """
+        Camera built like make_camera/point_at
+
+        :param camPos: camera position triplet
+        :param target: looked at position triplet
+        :param resx, resy: image resolution
+        :param roll: rotation about the viewing axis in radians
+        :return: Camera
+        """
+        return cls(camPos, look_at_rotation(camPos, target, roll), resx, resy, **kwargs)
+
+    @classmethod
+    def from_euler(cls, camPos, rot_euler, resx, resy, **kwargs):
+        """
+        Camera built like make_anim (rotation_euler overriding point_at)
+
+        :param camPos: camera position triplet
+        :param rot_euler: camera euler angles
+        :param resx, resy: image resolution
+        :return: Camera
+        """
+        return cls(camPos, euler_rotation(rot_euler), resx, resy, **kwargs)
+
+    @property
+    def focal_px(self):
+        """focal length in pixels (sensor fit AUTO: the sensor width spans the largest image side)"""
+        return self.lens / self.sensor_width * max(self.resx, self.resy)
+
+    @property
+    def K(self):
+        """intrinsic matrix, image v axis pointing down"""
+        f = self.focal_px
+        return np.array([[f, 0., self.resx / 2.], [0., f, self.resy / 2.], [0., 0., 1.]])
+
+    @property
+    def P(self):
+        """3x4 projection matrix of the undistorted image"""
+        flip = np.diag([1., -1., -1.])
+        R = flip @ self.rotation.T
+        return self.K @ np.column_stack((R, -R @ self.location))
+
+    def to_camera(self, points):
+        """
+        :param points: (..., 3) world coordinates
+        :return: (..., 3) camera coordinates (the visible points have a negative z)
+        """
+        return (np.asarray(points, dtype=float) - self.location) @ self.rotation
+
+    def project(self, points, distort=True):
+        """
+        Project world points in one batched call
+
+        :param points: (..., 3) world coordinates, e.g. a (N, 3) trajectory or a chessboard corner grid
+        :param distort: apply the Lensdist distortion
+        :return: (..., 2) pixel coordinates, (...) depth along the viewing axis
+        """
+        cam = self.to_camera(points)
+        depth = -cam[..., 2]
+        f = self.focal_px
+        with np.errstate(divide="ignore", invalid="ignore"):
+            uv = np.stack((self.resx / 2. + f * cam[..., 0] / depth,
+                           self.resy / 2. - f * cam[..., 1] / depth), axis=-1)
+        if distort and self.dist_param != 0.:
+            uv = distort_points(uv, self.dist_param, self.resx, self.resy)
+        return uv, depth
+
+    def in_view(self, uv, depth):
+        """
+        :return: mask of the projected points in front of the camera and inside the image
+        """
+        return (depth > 0) & (uv[..., 0] >= 0) & (uv[..., 0] < self.resx) & (uv[..., 1] >= 0) & (uv[..., 1] < self.resy)
+
+
+def chessboard_corners(square, inner=(6, 6), matrix_world=None, z=0.):
+    """
+    Inner corner grid of a chessboard centered on the plate origin
+
+    :param square: chessboard square size (bu)
+    :param inner: number of inner corners along x and y
+    :param matrix_world: optional 4x4 plate transform
+    :param z: height of the textured face in the plate frame
+    :return: (inner[1], inner[0], 3) world coordinates
+    """
+    x = (np.arange(inner[0]) - (inner[0] - 1) / 2.) * square
+    y = (np.arange(inner[1]) - (inner[1] - 1) / 2.) * square
+    grid = np.stack(list(np.meshgrid(x, y)) + [np.full((inner[1], inner[0]), float(z))], axis=-1)
+    if matrix_world is not None:
+        matrix_world = np.asarray(matrix_world, dtype=float)
+        grid = grid @ matrix_world[:3, :3].T + matrix_world[:3, 3]
+    return grid
+
+
+def compare_with_blender(cam_object, points):
+    """
+    Check the model against bpy_extras.object_utils.world_to_camera_view (to run inside Blender)
+
+    :param cam_object: Blender camera object of the current scene
+    :param points: (N, 3) world coordinates
+    :return: max pixel difference
+    """
+    import bpy
+    from bpy_extras.object_utils import world_to_camera_view
+    import mathutils
+    scene = bpy.context.scene
+    resx = scene.render.resolution_x * scene.render.resolution_percentage / 100.
+    resy = scene.render.resolution_y * scene.render.resolution_percentage / 100.
+    cam = Camera(np.array(cam_object.matrix_world.translation), np.array(cam_object.matrix_world.to_3x3()),
+                 resx, resy, cam_object.data.lens, cam_object.data.sensor_width)
+    uv, depth = cam.project(points, distort=False)
+    ref = np.array([world_to_camera_view(scene, cam_object, mathutils.Vector(p))[:] for p in points])
+    ref_uv = np.column_stack((ref[:, 0] * resx, (1. - ref[:, 1]) * resy))
+    return np.max(np.abs(uv - ref_uv))
+
+
+if __name__ == "__main__":
+    # convention checks: camera above the origin looking down, world X to the right and world Y up in the image
+    cam = Camera.look_at((0., 0., 5.), (0., 0., 0.), 500, 500)
+    uv, depth = cam.project(np.array([[0., 0., 0.], [1., 0., 0.], [0., 1., 0.]]))
+    assert np.allclose(uv[0], (250., 250.)) and uv[1, 0] > 250. and uv[2, 1] < 250. and np.all(depth == 5.)
+    P = cam.P @ np.array([1., 0., 0., 1.])
+    assert np.allclose(P[:2] / P[2], uv[1])
+    dist = np.random.uniform(0., 500., (1000, 2))
+    assert np.allclose(undistort_points(distort_points(dist, 0.1, 500, 500), 0.1, 500, 500), dist)
+    assert np.allclose(undistort_points(distort_points(dist, -0.1, 500, 500), -0.1, 500, 500), dist)
+    # barrel distortion: the composited image is enlarged by 1 / (1 + k), its corners sample the raw render at
+    # n_in = 2 sc n / (1 + sqrt(1 - 4 k sc^2 |n|^2))
+    sc = 1. / 0.9
+    n_in = 2. * sc / (1. + np.sqrt(1. + 0.4 * sc**2 * 2.))
+    assert np.allclose(undistort_points([[500., 500.]], -0.1, 500, 500), 250. + 250. * n_in)
+    num = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    traj = np.column_stack((np.linspace(-4., 4., num), np.zeros(num), np.zeros(num)))
+    cam = Camera.from_euler((0., -5., 0.), (np.pi / 2, 0., 0.), 500, 500, dist_param=0.05)
+    start = time.perf_counter()
+    cam.project(traj)
+    print("projected %d points in %.3f s" % (num, time.perf_counter() - start))
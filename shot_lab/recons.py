@@ -0,0 +1,96 @@
+"""
+Generate picture of a sphere with a given trajectory file, filmed by two cameras
+
+    blender -b -P shot_recons.py -- Trajectory.txt
+"""
+import argparse
+import math
+import os
+import numpy as np
+from . import cli
+from . import instrument
+from . import scene_builder
+from . import traj_bin
+from . import traj_io
+
+def make_shot_film(builder, traj_t, shot_traj, fps, exposure=0., subsamples=1, tolerance=None):
+    """
+    Generate keyframes of the sphere trajectory to make the animation, filmed at the camera frame rate
+
+    :param builder: scene_builder.SceneBuilder
+    :param traj_t: (N,) trajectory times (s)
+    :param shot_traj: (N, 3) trajectory (X,Y,Z)
+    :param fps: camera frame rate (Hz)
+    :param exposure: exposure time (s), for the motion blur
+    :param subsamples: motion blur sub-samples per frame
+    :param tolerance: optional keyframe decimation tolerance (bu)
+    :return: (n,) rendered frames
+    """
+    return builder.shot_film(traj_t, shot_traj, fps, 0.1, exposure, subsamples, tolerance)
+
+
+@instrument.spanned()
+def make_anim(builder, camPos, traj_t, doublesin_traj, fpath, resx, resy, rot_euler, f=0., fps=None, exposure=0.,
+              subsamples=1, tolerance=None):
+    """
+    Render the animation as black and white JPEGs
+
+    :param builder: scene_builder.SceneBuilder
+    :param camPos: camera position triplet
+    :param traj_t: (N,) trajectory times (s)
+    :param doublesin_traj: (N, 3) sphere trajectory
+    :param fpath: path to save the pictures to
+    :param resx, resy: camera resolution
+    :param rot_euler: camera euler angles
+    :param f: lens distortion parameter
+    :param fps: camera frame rate (Hz), the trajectory sampling rate by default
+    :param exposure: exposure time (s), for the motion blur
+    :param subsamples: motion blur sub-samples per frame
+    :param tolerance: optional keyframe decimation tolerance (bu)
+    :return:
+    """
+    builder.camera(camPos, (0, 0, 0), rot_euler=rot_euler)
+    builder.sun(camPos, (0., 0., 0.))
+    if fps is None:
+        fps = 1. / np.median(np.diff(traj_t))
+    make_shot_film(builder, traj_t, doublesin_traj, fps, exposure, subsamples, tolerance)
+    # builder.lens_dist(f)
+    # builder.render_settings(resx, resy, fpath, 'JPEG', 'BW')
+    #bpy.ops.render.render(animation=True)
+
+
+def parse_args(argv=None):
+    """
+    :param argv: command line, the options follow '--'
+    :return: settings namespace
+    """
+    parser = argparse.ArgumentParser(prog="shot_recons.py", description="Replay a trajectory file in the scene")
+    #traj_path = "C:/Users/Simon/Documents/GitHub/Blender_shot_lab/Trajectory.txt"
+    parser.add_argument("traj_path", nargs="?",
+                        default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                             "Trajectory.txt"),
+                        help="Trajectory.txt or binary .trj file")
+    parser.add_argument("--fps", type=float, default=None, help="camera frame rate (Hz), the trajectory rate by default")
+    parser.add_argument("--exposure", type=float, default=0., help="exposure time (s), for the motion blur")
+    parser.add_argument("--blur_samples", type=int, default=1, help="motion blur sub-samples per frame")
+    parser.add_argument("--dist_param", type=float, default=0., help="Lensdist distortion parameter")
+    parser.add_argument("--key_tolerance", type=float, default=1e-4,
+                        help="keyframe decimation tolerance (bu), see keyframes.fit_keyframes. "
+                             "0 for one keyframe per sample")
+    parser.add_argument("--resx", type=int, default=500)
+    parser.add_argument("--resy", type=int, default=500)
+    return cli.parse_job_args(parser, argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    builder = scene_builder.SceneBuilder()
+    if args.traj_path.endswith(traj_bin.EXT):
+        # memory-mapped, only the tracked rows are read
+        traj_t, doublesin_traj = traj_bin.open_traj_bin(args.traj_path).valid()
+    else:
+        traj = traj_io.load_traj(args.traj_path)
+        traj_t, doublesin_traj = traj[:, 0], traj[:, 1:]
+    make_anim(builder, (0.,-5., 0.), traj_t, doublesin_traj, '', args.resx, args.resy, (math.pi/2, 0., 0.),
+              args.dist_param, args.fps, args.exposure, args.blur_samples, args.key_tolerance or None)
+    print(builder.report())
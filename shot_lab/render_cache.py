@@ -0,0 +1,357 @@
+"""
+Content-addressed render cache: the rendered files are stored under the hash of the full scene description
+(object transforms and animation, camera, lens distortion, resolution, color mode, format, view transform) and
+copied back instead of rendering again when the same scene is requested. The cache directory is kept under a size
+budget by evicting the least recently used entries. It can be shared by concurrent processes (render_farm.py
+workers): entries are renamed into place whole, and entries evicted while being read count as misses.
+
+Environment:
+    SHOT_LAB_RENDER_CACHE: cache directory (default .render_cache at the repository root), 'off' to disable it
+    SHOT_LAB_RENDER_CACHE_MB: size budget in MB (default 2048)
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+import numpy as np
+from . import instrument
+from . import render_profiles
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_default = None
+
+
+class RenderCache:
+    """
+    :param cache_dir: cache directory
+    :param max_bytes: on-disk size budget
+    """
+    def __init__(self, cache_dir=None, max_bytes=2048 << 20):
+        self.cache_dir = cache_dir or os.path.join(ROOT, ".render_cache")
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(desc):
+        """
+        :param desc: JSON serializable scene description
+        :return: hex digest of the canonical description
+        """
+        return hashlib.sha256(json.dumps(desc, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def fetch(self, key, outputs):
+        """
+        Copy the cached files of an entry to the requested output paths. An entry evicted by another process
+        during the copy counts as a miss.
+
+        :param key: entry key
+        :param outputs: output file paths, in the order they were stored
+        :return: True on a hit
+        """
+        entry = self._entry(key)
+        cached = [os.path.join(entry, "%d_%s" % (i, os.path.basename(path))) for i, path in enumerate(outputs)]
+        try:
+            for src, dst in zip(cached, outputs):
+                os.makedirs(os.path.dirname(os.path.abspath(dst)), exist_ok=True)
+                shutil.copyfile(src, dst)
+            # the entry modification time is the LRU clock
+            os.utime(entry)
+        except FileNotFoundError:
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+    def store(self, key, outputs):
+        """
+        Add the rendered files to the cache then enforce the size budget. The entries are content addressed: when
+        another process stored the same key first, its entry is kept.
+
+        :param key: entry key
+        :param outputs: rendered file paths
+        :return:
+        """
+        entry = self._entry(key)
+        tmp = entry + ".tmp%d" % os.getpid()
+        os.makedirs(tmp, exist_ok=True)
+        names = ["%d_%s" % (i, os.path.basename(path)) for i, path in enumerate(outputs)]
+        for name, path in zip(names, outputs):
+            shutil.copyfile(path, os.path.join(tmp, name))
+        for attempt in range(2):
+            try:
+                os.replace(tmp, entry)
+                break
+            except OSError:
+                # a non-empty entry is not replaced: stored meanwhile by another worker, or holding other outputs
+                if attempt or all(os.path.exists(os.path.join(entry, name)) for name in names):
+                    shutil.rmtree(tmp, ignore_errors=True)
+                    break
+                shutil.rmtree(entry, ignore_errors=True)
+        self.evict()
+
+    def entries(self):
+        """
+        :return: list of (mtime, size, path) of the cache entries, skipping the ones removed while listing them
+        """
+        res = []
+        for bucket in os.listdir(self.cache_dir):
+            bucket = os.path.join(self.cache_dir, bucket)
+            if not os.path.isdir(bucket):
+                continue
+            for name in os.listdir(bucket):
+                path = os.path.join(bucket, name)
+                if ".tmp" in name:
+                    continue
+                try:
+                    size = sum(os.path.getsize(os.path.join(path, file)) for file in os.listdir(path))
+                    res.append((os.path.getmtime(path), size, path))
+                except FileNotFoundError:
+                    continue
+        return res
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits its budget
+
+        :return: number of removed entries
+        """
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        while entries and total > self.max_bytes:
+            _, size, path = entries.pop(0)
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            removed += 1
+        self.evictions += removed
+        return removed
+
+    def cached_render(self, desc, outputs, render_fn):
+        """
+        Render through the cache
+
+        :param desc: scene description
+        :param outputs: files written by render_fn
+        :param render_fn: function doing the actual render
+        :return: True if the render was skipped
+        """
+        with instrument.span("RenderCache.fetch"):
+            key = self.key(desc)
+            hit = self.fetch(key, outputs)
+        if hit:
+            return True
+        with instrument.span("render", outputs=len(outputs)):
+            render_fn()
+        with instrument.span("RenderCache.store"):
+            self.store(key, outputs)
+        return False
+
+    def stats(self):
+        """
+        :return: dict of hit/miss statistics
+        """
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.,
+                "evictions": self.evictions, "bytes": sum(size for _, size, _ in self.entries())}
+
+    def stats_line(self):
+        stats = self.stats()
+        return ("render cache: %(hits)d hits, %(misses)d misses (%(hit_rate).0f%%), %(evictions)d evictions, "
+                "%(mb).1f MB" % dict(stats, hit_rate=100 * stats["hit_rate"], mb=stats["bytes"] / 1e6))
+
+
+def default_cache():
+    """
+    Cache shared by the scripts, configured by the environment
+
+    :return: RenderCache or None when disabled
+    """
+    global _default
+    cache_dir = os.environ.get("SHOT_LAB_RENDER_CACHE")
+    if cache_dir == "off":
+        return None
+    if _default is None:
+        _default = RenderCache(cache_dir, int(float(os.environ.get("SHOT_LAB_RENDER_CACHE_MB", "2048")) * (1 << 20)))
+    return _default
+
+
+def _floats(values):
+    return [round(float(v), 6) for v in values]
+
+
+def _value(value):
+    """socket default value as JSON"""
+    if isinstance(value, str):
+        return value
+    if hasattr(value, "__len__"):
+        return _floats(value)
+    return round(float(value), 6)
+
+
+def describe_scene(scene):
+    """
+    Full description of what the render of a scene depends on
+
+    :param scene: bpy scene
+    :return: JSON serializable dict
+    """
+    objects = []
+    for obj in sorted(scene.objects, key=lambda obj: obj.name):
+        desc = {"name": obj.name, "type": obj.type, "hide_render": obj.hide_render,
+                "matrix_world": _floats(v for row in obj.matrix_world for v in row)}
+        if obj.type == 'CAMERA':
+            desc["camera"] = [obj.data.type, round(obj.data.lens, 6), round(obj.data.sensor_width, 6),
+                              obj.data.sensor_fit, round(obj.data.shift_x, 6), round(obj.data.shift_y, 6)]
+        elif obj.type == 'LIGHT':
+            desc["light"] = [obj.data.type, round(obj.data.energy, 6)]
+        elif obj.type == 'MESH':
+            desc["mesh"] = [len(obj.data.vertices), len(obj.data.polygons)]
+            desc["materials"] = [_describe_material(mat) for mat in obj.data.materials if mat is not None]
+        if obj.animation_data is not None and obj.animation_data.action is not None:
+            desc["animation"] = _describe_action(obj.animation_data.action)
+        objects.append(desc)
+    render = scene.render
+    desc = {"objects": objects,
+            "render": {"engine": render.engine, "resolution": [render.resolution_x, render.resolution_y,
+                                                               render.resolution_percentage],
+                       "file_format": render.image_settings.file_format,
+                       "color_mode": render.image_settings.color_mode,
+                       "quality": render.image_settings.quality,
+                       "frames": [scene.frame_start, scene.frame_end, scene.frame_step],
+                       "fps": [render.fps, render.fps_base],
+                       "motion_blur": [render.use_motion_blur, render.motion_blur_shutter],
+                       "border": [render.use_border, render.use_crop_to_border,
+                                  _floats([render.border_min_x, render.border_max_x, render.border_min_y,
+                                           render.border_max_y])],
+                       "profile": render_profiles.describe(scene)},
+            "view": [scene.view_settings.view_transform, scene.view_settings.look,
+                     round(scene.view_settings.exposure, 6), round(scene.view_settings.gamma, 6)],
+            "compositor": []}
+    if scene.use_nodes and scene.node_tree is not None:
+        for node in sorted(scene.node_tree.nodes, key=lambda node: node.name):
+            inputs = [_value(inp.default_value) for inp in node.inputs if hasattr(inp, "default_value")]
+            desc["compositor"].append([node.bl_idname, inputs, getattr(node, "use_projector", None),
+                                       getattr(node, "use_fit", None)])
+    if scene.world is not None:
+        desc["world"] = _floats(scene.world.color)
+    return desc
+
+
+def _describe_material(mat):
+    desc = {"name": mat.name, "diffuse_color": _floats(mat.diffuse_color), "nodes": []}
+    if mat.use_nodes and mat.node_tree is not None:
+        for node in sorted(mat.node_tree.nodes, key=lambda node: node.name):
+            image = getattr(node, "image", None)
+            if image is not None:
+                path = os.path.abspath(image.filepath_raw.replace("//", ""))
+                stamp = os.path.getmtime(path) if os.path.exists(path) else 0.
+                desc["nodes"].append([node.bl_idname, path, stamp,
+                                      _floats(node.texture_mapping.scale), _floats(node.texture_mapping.translation)])
+            else:
+                desc["nodes"].append([node.bl_idname] + [_value(inp.default_value) for inp in node.inputs
+                                                         if hasattr(inp, "default_value")])
+    return desc
+
+
+def _describe_action(action):
+    digest = hashlib.sha256()
+    for fcurve in sorted(action.fcurves, key=lambda fc: (fc.data_path, fc.array_index)):
+        co = np.empty(2 * len(fcurve.keyframe_points), dtype=np.float32)
+        fcurve.keyframe_points.foreach_get("co", co)
+        digest.update(("%s[%d]" % (fcurve.data_path, fcurve.array_index)).encode())
+        digest.update(co.tobytes())
+    return digest.hexdigest()
+
+
+def _still_path(scene, bpy):
+    path = bpy.path.abspath(scene.render.filepath)
+    ext = scene.render.file_extension
+    if scene.render.use_file_extension and not path.lower().endswith(ext):
+        path += ext
+    return path
+
+
+@instrument.spanned()
+def render_still(cache=None, backend=None):
+    """
+    bpy.ops.render.render(write_still=1) through the cache
+
+    :param cache: RenderCache, the shared one by default
+    :param backend: optional soft_render.Backend rendering in place of Blender
+    :return: True if the render was skipped
+    """
+    if backend is None:
+        import bpy
+        scene = bpy.context.scene
+        render = lambda: bpy.ops.render.render(write_still=1)
+    else:
+        bpy = backend.builder.bpy
+        scene = backend.scene
+        render = backend.render_still
+    cache = cache or default_cache()
+    if cache is None:
+        with instrument.span("render", outputs=1):
+            render()
+        return False
+    with instrument.span("describe_scene"):
+        desc = _describe(scene, backend)
+    return cache.cached_render(desc, [_still_path(scene, bpy)], render)
+
+
+@instrument.spanned()
+def render_animation(cache=None, backend=None, scene=None):
+    """
+    bpy.ops.render.render(animation=True) through the cache
+
+    :param cache: RenderCache, the shared one by default
+    :param backend: optional soft_render.Backend rendering in place of Blender
+    :param scene: bpy scene to render (Blender only), the context scene by default
+    :return: True if the render was skipped
+    """
+    if backend is None:
+        import bpy
+        if scene is None:
+            scene = bpy.context.scene
+        render = lambda: bpy.ops.render.render(animation=True, scene=scene.name)
+    else:
+        bpy = backend.builder.bpy
+        scene = backend.scene
+        render = backend.render_animation
+    cache = cache or default_cache()
+    if cache is None:
+        with instrument.span("render", outputs=scene.frame_end - scene.frame_start + 1):
+            render()
+        return False
+    outputs = [bpy.path.abspath(scene.render.frame_path(frame=frame))
+               for frame in range(scene.frame_start, scene.frame_end + 1, scene.frame_step)]
+    with instrument.span("describe_scene"):
+        desc = _describe(scene, backend)
+    return cache.cached_render(desc, outputs, render)
+
+
+def _describe(scene, backend):
+    desc = describe_scene(scene)
+    if backend is not None:
+        desc["backend"] = backend.describe()
+    return desc
+
+
+if __name__ == "__main__":
+    # store/fetch/evict cycle on dummy 1 MB renders with a 3 MB budget
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = RenderCache(os.path.join(tmp, "cache"), 3 << 20)
+        out = os.path.join(tmp, "ang_0.png")
+        for dist_param in (0., 0.1, 0., 0.2, 0.3, 0.4, 0.):
+            desc = {"render": {"resolution": [500, 500, 100]}, "dist_param": dist_param}
+            start = time.perf_counter()
+            hit = cache.cached_render(desc, [out], lambda: open(out, "wb").write(os.urandom(1 << 20)))
+            print("dist_param %.1f: %s in %.4f s" % (dist_param, "hit" if hit else "miss", time.perf_counter() - start))
+        print(cache.stats_line())
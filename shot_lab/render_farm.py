@@ -0,0 +1,195 @@
+"""
+Parallel render driver: splits a job into shards (camera x frame range, or calibration pose indices),
+runs them in concurrent headless Blender processes and stitches the outputs into the usual
+camLeft/camLeft_####.jpg, camTop/camTop_####.jpg and ang_i.png names.
+
+Worker side, the scripts call shard_from_argv() to know which part of the job to render.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CAMERAS = ("camLeft", "camTop")
+
+
+def anim_shards(frame_start, frame_end, frames_per_shard, cameras=CAMERAS):
+    """
+    Split the shot animation in camera x frame range shards
+
+    :param frame_start, frame_end: rendered frame range (inclusive, like scene.frame_start/frame_end)
+    :param frames_per_shard: number of frames per shard
+    :param cameras: camera names, also used as output subdirectory and file prefix
+    :return: list of shard dicts
+    """
+    shards = []
+    for camera in cameras:
+        for start in range(frame_start, frame_end + 1, frames_per_shard):
+            end = min(start + frames_per_shard - 1, frame_end)
+            shards.append({"id": "%s_%04d_%04d" % (camera, start, end), "kind": "anim", "camera": camera,
+                           "frames": [start, end], "prefix": camera + "/" + camera + "_"})
+    return shards
+
+
+def calib_shards(num_poses, poses_per_shard):
+    """
+    Split the calibration pictures in shards of pose indices
+
+    :param num_poses: number of chessboard poses
+    :param poses_per_shard: number of poses per shard
+    :return: list of shard dicts
+    """
+    return [{"id": "ang_%d_%d" % (start, min(start + poses_per_shard, num_poses) - 1), "kind": "calib",
+             "poses": list(range(start, min(start + poses_per_shard, num_poses))), "prefix": "ang_"}
+            for start in range(0, num_poses, poses_per_shard)]
+
+
+def sample_shards(names=("tilted_top", "tilted_left")):
+    """
+    The tilted sample pictures of make_sample_pic.py, as a single shard
+
+    :param names: picture names
+    :return: list of shard dicts
+    """
+    return [{"id": "sample", "kind": "sample", "names": list(names), "prefix": ""}]
+
+
+def shard_from_argv(argv=None):
+    """
+    Shard given to a worker after the '--' separator of the Blender command line
+
+    :param argv: command line, sys.argv by default
+    :return: shard dict, or None when the script renders the whole job
+    """
+    argv = sys.argv if argv is None else argv
+    if "--" not in argv:
+        return None
+    parser = argparse.ArgumentParser(prog="worker")
+    parser.add_argument("--shard", type=json.loads, default=None)
+    args, _ = parser.parse_known_args(argv[argv.index("--") + 1:])
+    return args.shard
+
+
+def worker_command(executable, script, shard, threads, config=None):
+    """
+    :param executable: renderer command prefix, e.g. ['blender'] or [sys.executable, '-m', 'shot_lab.stub_render']
+    :param script: script run by the renderer
+    :param shard: shard dict, with its 'out_dir'
+    :param threads: number of render threads of the worker
+    :param config: optional configuration overrides
+    :return: argument list
+    """
+    cmd = list(executable) + ["-b", "-t", str(threads), "-P", script, "--", "--shard", json.dumps(shard)]
+    if config:
+        cmd += ["--config", json.dumps(config)]
+    return cmd
+
+
+def stitch(shard_dir, out_dir):
+    """
+    Move the outputs of a finished shard to their final location, keeping their relative paths
+
+    :param shard_dir: shard scratch directory
+    :param out_dir: output directory
+    :return: list of output files
+    """
+    outputs = []
+    for dirpath, _, filenames in os.walk(shard_dir):
+        rel = os.path.relpath(dirpath, shard_dir)
+        os.makedirs(os.path.join(out_dir, rel), exist_ok=True)
+        for name in filenames:
+            target = os.path.normpath(os.path.join(out_dir, rel, name))
+            os.replace(os.path.join(dirpath, name), target)
+            outputs.append(target)
+    shutil.rmtree(shard_dir, ignore_errors=True)
+    return outputs
+
+
+def run_shard(shard, executable, script, out_dir, threads, retries, timeout, config=None):
+    """
+    Render a shard in a worker process, retrying on failure
+
+    :param config: optional configuration overrides given to the worker
+    :return: result dict (shard id, status, attempts, duration, outputs)
+    """
+    import subprocess
+    shard_dir = os.path.join(out_dir, ".shards", shard["id"])
+    env = dict(os.environ, OMP_NUM_THREADS=str(threads))
+    start = time.perf_counter()
+    error = ""
+    for attempt in range(1, retries + 2):
+        shutil.rmtree(shard_dir, ignore_errors=True)
+        os.makedirs(shard_dir)
+        cmd = worker_command(executable, script, dict(shard, out_dir=shard_dir), threads, config)
+        try:
+            proc = subprocess.run(cmd, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=timeout)
+            if proc.returncode == 0:
+                return {"id": shard["id"], "status": "ok", "attempts": attempt,
+                        "duration": time.perf_counter() - start, "outputs": stitch(shard_dir, out_dir)}
+            error = proc.stdout.decode(errors="replace")[-2000:]
+        except subprocess.TimeoutExpired:
+            error = "timeout after %s s" % timeout
+    shutil.rmtree(shard_dir, ignore_errors=True)
+    return {"id": shard["id"], "status": "failed", "attempts": retries + 1,
+            "duration": time.perf_counter() - start, "outputs": [], "error": error}
+
+
+def run_shards(shards, executable, script, out_dir, workers=2, threads=1, retries=2, timeout=None, config=None):
+    """
+    Run the shards on a bounded number of concurrent worker processes
+
+    :param shards: shard dicts
+    :param executable: renderer command prefix
+    :param script: script run by each worker
+    :param out_dir: output directory
+    :param workers: number of concurrent workers
+    :param threads: render threads per worker
+    :param retries: number of retries of a failed shard
+    :param timeout: worker timeout (s)
+    :param config: optional configuration overrides given to the workers
+    :return: list of result dicts, in shard order
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    os.makedirs(out_dir, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda shard: run_shard(shard, executable, script, out_dir, threads, retries, timeout,
+                                                        config), shards))
+    shutil.rmtree(os.path.join(out_dir, ".shards"), ignore_errors=True)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render the shot video or the calibration pictures in parallel")
+    parser.add_argument("job", choices=("anim", "calib"))
+    parser.add_argument("--out", required=True, help="output directory")
+    parser.add_argument("--renderer", default="blender", help="renderer command, e.g. 'python -m shot_lab.stub_render'")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--threads", type=int, default=1, help="render threads per worker")
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--timeout", type=float, default=None)
+    parser.add_argument("--frames", type=int, default=50, help="number of animation frames")
+    parser.add_argument("--poses", type=int, default=20, help="number of calibration poses")
+    parser.add_argument("--shard-size", type=int, default=None)
+    args = parser.parse_args(argv)
+    if args.job == "anim":
+        shards = anim_shards(0, args.frames - 1, args.shard_size or 10)
+        script = os.path.join(ROOT, "make_shot_video.py")
+    else:
+        shards = calib_shards(args.poses, args.shard_size or 2)
+        script = os.path.join(ROOT, "make_calib_pic.py")
+    start = time.perf_counter()
+    results = run_shards(shards, args.renderer.split(), script, args.out, args.workers, args.threads,
+                         args.retries, args.timeout)
+    failed = [res for res in results if res["status"] != "ok"]
+    print("%d shards, %d files, %d failed, %.1f s" % (len(results), sum(len(res["outputs"]) for res in results),
+                                                      len(failed), time.perf_counter() - start))
+    for res in failed:
+        print("shard %s failed after %d attempts:\n%s" % (res["id"], res["attempts"], res["error"]))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
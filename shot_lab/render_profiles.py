@@ -0,0 +1,200 @@
+"""
+Render engine and sampling profiles: a profile sets every setting the throughput and reproducibility of a job depend on
+(engine, device, samples, denoising, light paths, seed, tiles, threads) instead of inheriting the .blend defaults.
+
+    fast_synthetic: minimal-sample Cycles CPU, no denoising, a single diffuse bounce, fixed seed. BW calibration
+                    pictures and a diffuse sphere under a sun light should need nothing more (not yet measured
+                    against the reference renders, hence opt-in)
+    eevee:          Eevee with few anti-aliasing samples, the fastest when a GPU context is available
+    reference:      high-sample Cycles CPU with full light paths, to measure what the fast profiles lose
+    blend:          keep the .blend settings (default)
+
+    blender -b -P make_shot_video.py -- --render_profile fast_synthetic
+    python -m shot_lab.render_profiles [frames]      (benchmark, launches blender -b when bpy is not importable)
+
+A profile is a dict of settings paths relative to the scene, a tuple value giving alternatives tried in order
+(engine names changing across Blender versions). Settings missing from the running Blender version are skipped.
+"""
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_CYCLES = {"render.engine": "CYCLES", "cycles.device": "CPU", "cycles.seed": 0, "cycles.use_animated_seed": False,
+           "cycles.use_adaptive_sampling": False, "cycles.use_denoising": False, "cycles.use_auto_tile": True,
+           "cycles.tile_size": 2048, "render.use_persistent_data": True}
+PROFILES = {
+    "fast_synthetic": dict(_CYCLES, **{"cycles.samples": 16, "cycles.max_bounces": 1, "cycles.diffuse_bounces": 1,
+                                       "cycles.glossy_bounces": 0, "cycles.transmission_bounces": 0,
+                                       "cycles.volume_bounces": 0, "cycles.transparent_max_bounces": 0,
+                                       "cycles.caustics_reflective": False, "cycles.caustics_refractive": False}),
+    "eevee": {"render.engine": ("BLENDER_EEVEE_NEXT", "BLENDER_EEVEE"), "eevee.taa_render_samples": 8,
+              "render.use_persistent_data": True},
+    "reference": dict(_CYCLES, **{"cycles.samples": 1024, "cycles.max_bounces": 12, "cycles.diffuse_bounces": 4,
+                                  "cycles.glossy_bounces": 4, "cycles.transmission_bounces": 12,
+                                  "cycles.volume_bounces": 0, "cycles.transparent_max_bounces": 8,
+                                  "cycles.caustics_reflective": True, "cycles.caustics_refractive": True}),
+    "blend": {},
+}
+DEFAULT = "blend"
+# settings describing a render, for the render cache key
+KEYS = sorted(set(key for profile in PROFILES.values() for key in profile) - {"render.use_persistent_data"})
+
+
+def _owner(scene, path):
+    """:return: object holding the last attribute of path, and that attribute name (None when missing)"""
+    names = path.split(".")
+    owner = scene
+    for name in names[:-1]:
+        owner = getattr(owner, name, None)
+        if owner is None:
+            return None, names[-1]
+    return owner, names[-1]
+
+
+def _set(owner, name, value):
+    for choice in (value if isinstance(value, tuple) else (value,)):
+        try:
+            setattr(owner, name, choice)
+            return choice
+        except TypeError:
+            # enum item unknown to this Blender version
+            continue
+    raise ValueError("none of %s is a valid %s" % (value, name))
+
+
+def apply(scene, profile=DEFAULT, threads=None):
+    """
+    Set the render settings of a profile
+
+    :param scene: bpy scene
+    :param profile: PROFILES name or settings dict
+    :param threads: render threads, a fixed count when given (0 or None: automatic)
+    :return: dict of the settings applied
+    """
+    settings = PROFILES[profile] if isinstance(profile, str) else profile
+    applied = {}
+    for path, value in settings.items():
+        owner, name = _owner(scene, path)
+        if owner is not None and hasattr(owner, name):
+            applied[path] = _set(owner, name, value)
+    if threads:
+        scene.render.threads_mode = 'FIXED'
+        scene.render.threads = threads
+    elif threads is not None:
+        scene.render.threads_mode = 'AUTO'
+    return applied
+
+
+def describe(scene):
+    """
+    :param scene: bpy scene
+    :return: JSON serializable values of the profile settings (thread count excluded, it does not change the render)
+    """
+    desc = {}
+    for path in KEYS:
+        owner, name = _owner(scene, path)
+        value = getattr(owner, name, None) if owner is not None else None
+        if value is not None:
+            desc[path] = round(float(value), 6) if isinstance(value, float) else value
+    return desc
+
+
+def add_argument(parser):
+    """Add the --render_profile, --render_threads and --render_backend options of the Blender jobs"""
+    parser.add_argument("--render_profile", default=DEFAULT, choices=sorted(PROFILES),
+                        help="render engine and sampling settings, see render_profiles.py")
+    parser.add_argument("--render_threads", type=int, default=None,
+                        help="fixed render thread count (0: automatic), the .blend setting by default")
+    parser.add_argument("--render_backend", default="blender", choices=("blender", "numpy"),
+                        help="render with Blender or ray cast the scene with NumPy, see soft_render.py")
+
+
+def _chessboard(path):
+    from . import soft_render
+    from . import sphere_tracker
+    sphere_tracker.write_frame(path, soft_render.chessboard(square_px=64))
+
+
+def benchmark(frames=8, profiles=("fast_synthetic", "eevee", "reference"), resx=500, resy=500, threads=None):
+    """
+    Render the shot and a tilted calibration plate with each profile: images per second, and pixel differences
+    to the last profile (reference). Needs Blender (bpy module or run inside blender -b).
+
+    :param frames: images rendered per scene and profile
+    :param profiles: PROFILES names, the last one is the comparison reference
+    :param resx, resy: image resolution
+    :param threads: render threads
+    :return: dict profile -> (images per second, mean abs difference, max abs difference)
+    """
+    import bpy
+    from . import calib_poses
+    from . import projection
+    from . import scene_builder
+    from . import sphere_tracker
+    results = {}
+    images = {}
+    angles = 0.4 * np.sin(np.arange(frames))
+    with tempfile.TemporaryDirectory() as tmp, scene_builder.SceneBuilder() as builder:
+        chess_path = os.path.join(tmp, "chessboard.png")
+        _chessboard(chess_path)
+        builder.sun((0., -5., 5.), (0., 0., 0.))
+        for profile in profiles:
+            paths = []
+            try:
+                apply(builder.scene, profile, threads)
+                start = time.perf_counter()
+                for i, angle in enumerate(angles):
+                    builder.hide("plate")
+                    builder.camera((0., -5., 0.), (0., 0., 0.))
+                    builder.shot(0.1).location = (0.5 * np.sin(i), 0., 0.2 * np.cos(i))
+                    paths.append(os.path.join(tmp, "%s_shot_%d.png" % (profile, i)))
+                    builder.render_settings(resx, resy, paths[-1], 'PNG', 'BW')
+                    bpy.ops.render.render(write_still=True)
+                    builder.hide("shot")
+                    builder.camera((0., 0., 5.), (0., 0., 0.))
+                    builder.plate(2., 0.05, chess_path,
+                                  matrix_world=calib_poses.pose_matrices([projection.rot_x(angle)], np.eye(4))[0])
+                    paths.append(os.path.join(tmp, "%s_plate_%d.png" % (profile, i)))
+                    builder.render_settings(resx, resy, paths[-1], 'PNG', 'BW')
+                    bpy.ops.render.render(write_still=True)
+                elapsed = time.perf_counter() - start
+            except (ValueError, RuntimeError) as err:
+                # Eevee without a GPU context
+                print("%s: skipped (%s)" % (profile, err))
+                continue
+            images[profile] = np.stack(list(sphere_tracker.read_frames(paths)))
+            results[profile] = [len(paths) / elapsed]
+    reference = images.get(profiles[-1])
+    for profile, res in results.items():
+        diff = np.abs(images[profile] - reference) if reference is not None else np.full(1, np.nan)
+        res += [float(diff.mean()), float(diff.max())]
+        print("%-15s %7.2f images/s, difference to %s: mean %.4f, max %.3f"
+              % ((profile,) + tuple(res[:1]) + (profiles[-1],) + tuple(res[1:])))
+    return results
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    frames = int(argv[0]) if argv else 8
+    try:
+        import bpy  # noqa: F401
+    except ImportError:
+        import subprocess
+        code = "import sys; sys.path.insert(0, %r); from shot_lab import render_profiles; " \
+               "render_profiles.benchmark(%d)" % (ROOT, frames)
+        blender = os.environ.get("BLENDER", "blender")
+        try:
+            return subprocess.call([blender, "-b", "--python-expr", code])
+        except FileNotFoundError:
+            print("the benchmark renders with Blender: install the bpy module or set BLENDER to the executable")
+            return 1
+    benchmark(frames)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,356 @@
+"""
+Region of interest rendering of the shot animation: the sphere covers a tiny part of each frame, so only its
+bounding box is rendered (render.use_border / use_crop_to_border) and pasted onto a static background frame
+rendered once (through the render cache). The frames are assembled undistorted, the Lensdist distortion is then
+applied by lens_remap, since the compositor would distort the cropped region on its own.
+
+    blender -b -P make_shot_video.py -- --roi --dist_param 0.05
+
+The boxes come from the known trajectory: the sphere is projected with projection.Camera, through the corners of
+its bounding cube (conservative), over the whole exposure when the motion is blurred. Effects reaching outside the
+box (shadows, reflections of the sphere) are not rendered, widen the margin if the scene has any.
+
+Inside Blender the background and the crops are rendered to float OpenEXR files and read back with bpy
+(bpy.data.images, Blender's Python has neither imageio nor Pillow): the frames are assembled and distorted in
+scene-linear, where the Lensdist node works, and written with Image.save_render through the scene output format
+and view transform, like the full frame renders.
+
+    python -m shot_lab.roi_render [frames]              (NumPy ray caster benchmark)
+    python -m shot_lab.roi_render blender [frames]      (against bpy.ops.render.render(animation=True) frames,
+                                                         launches blender -b when bpy is not importable)
+"""
+import os
+import sys
+import time
+import numpy as np
+from . import instrument
+from . import lens_remap
+from . import projection
+from . import render_cache
+from . import trajectories
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_CORNERS = np.array([[x, y, z] for x in (-1., 1.) for y in (-1., 1.) for z in (-1., 1.)])
+
+
+def point_boxes(cam, points, margin=2):
+    """
+    Pixel boxes of the raw (undistorted) image holding point sets
+
+    :param cam: projection.Camera
+    :param points: (N, P, 3) points of each box
+    :param margin: extra pixels around the box
+    :return: (N, 4) int array of (x0, y0, x1, y1) boxes, clipped to the image, empty (x0 == x1) when not visible
+    """
+    uv, depth = cam.project(points, distort=False)
+    boxes = np.empty((len(points), 4), dtype=int)
+    boxes[:, :2] = np.floor(uv.min(axis=1)) - margin
+    boxes[:, 2:] = np.ceil(uv.max(axis=1)) + margin
+    # a point behind the camera: the box is unbounded
+    behind = ~(depth > 0.).all(axis=1)
+    boxes[behind] = (0, 0, cam.resx, cam.resy)
+    np.clip(boxes[:, 0::2], 0, cam.resx, out=boxes[:, 0::2])
+    np.clip(boxes[:, 1::2], 0, cam.resy, out=boxes[:, 1::2])
+    hidden = (boxes[:, 2] <= boxes[:, 0]) | (boxes[:, 3] <= boxes[:, 1])
+    boxes[hidden] = 0
+    return boxes
+
+
+def sphere_boxes(cam, centers, radius, margin=2):
+    """
+    Pixel boxes of the raw (undistorted) image holding the projected sphere
+
+    :param cam: projection.Camera
+    :param centers: (N, 3) or (N, S, 3) sphere centers, S positions over the exposure of each frame
+    :param radius: sphere radius (bu)
+    :param margin: extra pixels around the box
+    :return: (N, 4) int array of (x0, y0, x1, y1) boxes, clipped to the image, empty (x0 == x1) when not visible
+    """
+    centers = np.asarray(centers, dtype=float)
+    if centers.ndim == 2:
+        centers = centers[:, None]
+    corners = centers[:, :, None, :] + radius * _CORNERS
+    return point_boxes(cam, corners.reshape(len(centers), -1, 3), margin)
+
+
+def frame_boxes(cam, t, xyz, fps, radius, exposure=0., subsamples=1, margin=2):
+    """
+    Boxes of the camera frames of a trajectory, see trajectories.camera_keys
+
+    :param cam: projection.Camera
+    :param t: (M,) trajectory times (s)
+    :param xyz: (M, 3) trajectory positions
+    :param fps: camera frame rate (Hz)
+    :param radius: sphere radius (bu)
+    :param exposure: exposure time (s), the box covers the whole exposure
+    :param subsamples: motion blur sub-samples per frame
+    :param margin: extra pixels around the boxes
+    :return: (N,) frame numbers, (N, 4) boxes
+    """
+    t = np.asarray(t, dtype=float)
+    frames, times = trajectories.frame_times(t[0], t[-1], fps)
+    if exposure > 0.:
+        # both ends of the exposure besides the sub-samples
+        times = np.concatenate((trajectories.exposure_times(times, exposure, max(subsamples, 1)),
+                                (times - exposure / 2.)[:, None], (times + exposure / 2.)[:, None]), axis=1)
+    return frames, sphere_boxes(cam, trajectories.interpolate(t, xyz, times), radius, margin)
+
+
+def border(box, resx, resy):
+    """
+    :param box: (x0, y0, x1, y1) pixel box, y axis pointing down
+    :param resx, resy: image resolution
+    :return: render border_min_x, border_max_x, border_min_y, border_max_y (y axis pointing up)
+    """
+    x0, y0, x1, y1 = box
+    return x0 / float(resx), x1 / float(resx), (resy - y1) / float(resy), (resy - y0) / float(resy)
+
+
+def paste(background, crop, box, out=None):
+    """
+    :param background: (resy, resx) raw background frame
+    :param crop: (y1 - y0, x1 - x0) rendered region, cut at its bottom left corner if larger
+    :param box: (x0, y0, x1, y1) region box
+    :param out: optional output array
+    :return: assembled raw frame
+    """
+    if out is None:
+        out = background.copy()
+    else:
+        out[:] = background
+    x0, y0, x1, y1 = box
+    if x1 > x0 and y1 > y0:
+        # Blender may round the border one pixel off
+        h, w = min(y1 - y0, crop.shape[0]), min(x1 - x0, crop.shape[1])
+        out[y1 - h:y1, x0:x0 + w] = crop[crop.shape[0] - h:, :w]
+    return out
+
+
+def _read_image(bpy, path):
+    """
+    :param path: float (OpenEXR) or 8 bit image written by Blender
+    :return: (H, W) float32 grayscale frame, rows downwards: scene-linear values for a float image, the stored
+        values for a byte image (no color management either way)
+    """
+    image = bpy.data.images.load(path)
+    try:
+        width, height = image.size
+        buf = np.empty(width * height * 4, dtype=np.float32)
+        image.pixels.foreach_get(buf)
+    finally:
+        bpy.data.images.remove(image)
+    return buf.reshape(height, width, 4)[::-1, :, :3].mean(axis=2)
+
+
+def _write_image(bpy, scene, path, img):
+    """
+    Write a scene-linear grayscale frame with the scene output and color management settings, like a render
+
+    :param scene: bpy scene
+    :param path: output path
+    :param img: (H, W) scene-linear frame, rows downwards
+    :return:
+    """
+    height, width = img.shape
+    rgba = np.ones((height, width, 4), dtype=np.float32)
+    rgba[..., :3] = img[::-1, :, None]
+    image = bpy.data.images.new("roi_frame", width, height, float_buffer=True)
+    try:
+        image.pixels.foreach_set(rgba.ravel())
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        image.save_render(path, scene=scene)
+    finally:
+        bpy.data.images.remove(image)
+
+
+@instrument.spanned()
+def render_animation(builder, cam, t, xyz, fps, radius=0.1, exposure=0., subsamples=1, dist_param=0., margin=2,
+                     writer=None):
+    """
+    Render the current animation by regions of interest, in place of render_cache.render_animation: the frames are
+    written under render.filepath like Blender would, through the same file format extension.
+
+    The background and the crops are rendered without the compositor to float OpenEXR files (scene-linear, before
+    the view transform), assembled and distorted in scene-linear like the Lensdist node does, then saved through
+    the scene color management. The scene settings are restored even if a render fails.
+
+    :param builder: scene_builder.SceneBuilder of the animation (shot keyed, camera and render settings set)
+    :param cam: projection.Camera of the scene camera
+    :param t: (M,) trajectory times (s)
+    :param xyz: (M, 3) trajectory positions
+    :param fps: camera frame rate (Hz)
+    :param radius: sphere radius (bu)
+    :param exposure: exposure time (s)
+    :param subsamples: motion blur sub-samples per frame
+    :param dist_param: Lensdist distortion parameter, applied after assembling the frames
+    :param margin: extra pixels around the boxes
+    :param writer: optional frame_stack.StackWriter of the same frames, receiving the frames instead of files
+    :return: dict of statistics: frames, rendered pixel fraction, seconds
+    """
+    import bpy
+    from . import soft_render
+    start = time.perf_counter()
+    scene = builder.scene
+    render = scene.render
+    prefix = bpy.path.abspath(render.filepath)
+    frames, boxes = frame_boxes(cam, t, xyz, fps, radius, exposure, subsamples, margin)
+    keep = (frames >= scene.frame_start) & (frames <= scene.frame_end)
+    frames, boxes = frames[keep], boxes[keep]
+    paths = [bpy.path.abspath(render.frame_path(frame=int(number))) for number in frames]
+    if writer is not None and not np.array_equal(writer.frame_numbers, frames):
+        raise ValueError("the stack frames are not the rendered frames")
+    settings = render.image_settings
+    output = settings.file_format, settings.color_mode, settings.color_depth
+    state = (scene.use_nodes, render.use_border, render.use_crop_to_border, render.border_min_x,
+             render.border_max_x, render.border_min_y, render.border_max_y)
+    background_path = prefix + "background.exr"
+    crop_path = prefix + "crop.exr"
+    raw = 'OPEN_EXR', 'BW', '32'
+    try:
+        # raw renders: no Lensdist in the compositor, no border for the background
+        scene.use_nodes = False
+        render.use_border = False
+        settings.file_format, settings.color_mode, settings.color_depth = raw
+        builder.hide("shot")
+        render.filepath = background_path
+        render_cache.render_still()
+        background = _read_image(bpy, background_path)
+        builder.show("shot")
+        render.use_border = True
+        render.use_crop_to_border = True
+        frame = np.empty_like(background)
+        for i, (number, box, path) in enumerate(zip(frames, boxes, paths)):
+            scene.frame_set(int(number))
+            if box[2] > box[0]:
+                render.border_min_x, render.border_max_x, render.border_min_y, render.border_max_y = border(
+                    box, render.resolution_x, render.resolution_y)
+                render.filepath = crop_path
+                with instrument.span("render", frame=int(number)):
+                    bpy.ops.render.render(write_still=True)
+                paste(background, _read_image(bpy, crop_path), box, frame)
+            else:
+                frame[:] = background
+            out = lens_remap.distort(frame, dist_param) if dist_param else frame
+            if writer is None:
+                settings.file_format, settings.color_mode, settings.color_depth = output
+                _write_image(bpy, scene, path, out)
+                settings.file_format, settings.color_mode, settings.color_depth = raw
+            else:
+                # the sRGB transfer of the Standard view transform, like frame_stack.viewer_frames
+                writer.write(i, soft_render.srgb(np.clip(out, 0., 1.)).astype(np.float32))
+    finally:
+        builder.show("shot")
+        settings.file_format, settings.color_mode, settings.color_depth = output
+        (scene.use_nodes, render.use_border, render.use_crop_to_border, render.border_min_x, render.border_max_x,
+         render.border_min_y, render.border_max_y) = state
+        render.filepath = prefix
+        if os.path.exists(crop_path):
+            os.remove(crop_path)
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return {"frames": len(frames), "pixel_fraction": float(area.sum()) / (len(frames) * background.size or 1),
+            "seconds": time.perf_counter() - start}
+
+
+def blender_check(num_frames=8, res=200, dist_param=0.05, radius=0.1, margin=2):
+    """
+    Region of interest frames against bpy.ops.render.render(animation=True) frames of the same shot, rendered by
+    Blender (bpy module or run inside blender -b): the differences left are the sampling noise and the
+    interpolation of the distortion.
+
+    :param num_frames: number of frames
+    :param res: image resolution
+    :param dist_param: Lensdist distortion parameter
+    :param radius: sphere radius (bu)
+    :param margin: extra pixels around the boxes
+    :return: (mean abs difference, max abs difference) over the frames, in [0, 1] pixel values
+    """
+    import tempfile
+    import bpy
+    from . import scene_builder
+    cam_pos, rot_euler = (0., -5., 0.), (np.pi / 2, 0., 0.)
+    cam = projection.Camera.from_euler(cam_pos, rot_euler, res, res)
+    t = np.arange(num_frames) / 24.
+    xyz = trajectories.double_sine(t, amplitude=(0.5, 0.5))
+    with tempfile.TemporaryDirectory() as tmp, scene_builder.SceneBuilder() as builder:
+        builder.camera(cam_pos, rot_euler=rot_euler)
+        builder.sun(cam_pos, (0., 0., 0.))
+        builder.shot_film(t, xyz, 24., radius)
+        builder.lens_dist(dist_param)
+        builder.render_profile("fast_synthetic")
+        scene = builder.scene
+        builder.render_settings(res, res, os.path.join(tmp, "full_"), 'PNG', 'BW')
+        with instrument.span("render", frames=num_frames):
+            bpy.ops.render.render(animation=True)
+        full = [_read_image(bpy, bpy.path.abspath(scene.render.frame_path(frame=int(number))))
+                for number in range(scene.frame_start, scene.frame_end + 1)]
+        builder.render_settings(res, res, os.path.join(tmp, "roi_"), 'PNG', 'BW')
+        render_animation(builder, cam, t, xyz, 24., radius, dist_param=dist_param, margin=margin)
+        roi = [_read_image(bpy, bpy.path.abspath(scene.render.frame_path(frame=int(number))))
+               for number in range(scene.frame_start, scene.frame_end + 1)]
+    diff = np.abs(np.stack(full) - np.stack(roi))
+    print("%d frames %dx%d, region of interest against full frame renders: mean abs difference %.4f, max %.3f"
+          % (len(full), res, res, diff.mean(), diff.max()))
+    return float(diff.mean()), float(diff.max())
+
+
+def benchmark(num_frames=200, res=500, dist_param=0.05, radius=0.1):
+    """
+    Full frame and region of interest renders of the shot video, ray cast by soft_render (the stand-in for Cycles:
+    the cost grows with the number of pixels rendered like a path tracer's does), with the same assembling and
+    distortion path as render_animation
+
+    :param num_frames: number of frames
+    :param res: image resolution
+    :param dist_param: Lensdist distortion parameter
+    :param radius: sphere radius (bu)
+    :return:
+    """
+    from . import soft_render
+    cam = projection.Camera.from_euler((0., -5., 0.), (np.pi / 2, 0., 0.), res, res)
+    renderer = soft_render.SoftRenderer(cam, sun=(0., -1., 1.))
+    t = np.arange(num_frames) / 24.
+    xyz = trajectories.double_sine(t, amplitude=(0.5, 0.5))
+    full_box = (0, 0, res, res)
+    start = time.perf_counter()
+    full = [lens_remap.distort(renderer.trace_shot(center, radius, 0.5, full_box), dist_param) for center in xyz]
+    full_time = time.perf_counter() - start
+    start = time.perf_counter()
+    frames, boxes = frame_boxes(cam, t, xyz, 24., radius)
+    raw_background = np.full((res, res), renderer.ambient, dtype=np.float32)
+    frame = np.empty_like(raw_background)
+    err = 0.
+    for i, box in enumerate(boxes):
+        paste(raw_background, renderer.trace_shot(xyz[i], radius, 0.5, box), box, frame)
+        err = max(err, np.abs(lens_remap.distort(frame, dist_param) - full[i]).max())
+    roi_time = time.perf_counter() - start
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    print("%d frames %dx%d, boxes cover %.2f %% of the pixels"
+          % (num_frames, res, res, 100. * area.sum() / (num_frames * res * res)))
+    print("full frame: %.2f s, region of interest: %.2f s (%.1fx faster), max difference %.2e"
+          % (full_time, roi_time, full_time / roi_time, err))
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] != ["blender"]:
+        benchmark(int(argv[0]) if argv else 200)
+        return 0
+    frames = int(argv[1]) if len(argv) > 1 else 8
+    try:
+        import bpy  # noqa: F401
+    except ImportError:
+        import subprocess
+        code = "import sys; sys.path.insert(0, %r); from shot_lab import roi_render; " \
+               "roi_render.blender_check(%d)" % (ROOT, frames)
+        blender = os.environ.get("BLENDER", "blender")
+        try:
+            return subprocess.call([blender, "-b", "--python-expr", code])
+        except FileNotFoundError:
+            print("the check renders with Blender: install the bpy module or set BLENDER to the executable")
+            return 1
+    blender_check(frames)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""
+Generate calibration pictures of the chessboard position in the sample frame
+
+    blender -b -P make_sample_pic.py -- --tilt 10 --out sources
+"""
+import argparse
+import math
+import os
+from . import cli
+from . import instrument
+from . import render_cache
+from . import render_profiles
+from . import scene_builder
+from . import soft_render
+
+
+@instrument.spanned()
+def make_tilted_sample(builder, angle, axis, camPos, title, chess_path, resx=500, resy=500,
+                       render_profile=render_profiles.DEFAULT, render_threads=None, backend=None):
+    """
+    Generate a chessboard tilted in the sample frame
+
+    :param builder: scene_builder.SceneBuilder
+    :param angle: sample rotation agle
+    :param axis: sample rotation axis
+    :param camPos: camera position triplet
+    :param title: file path to save the pictures to
+    :param resx, resy: image resolution
+    :param render_profile: render_profiles.PROFILES name
+    :param render_threads: fixed render thread count
+    :param backend: optional soft_render.Backend rendering in place of Blender
+    :return:
+    """
+    L = 2
+    h = 0.1
+    f = h / L
+
+    builder.plate(L, f, chess_path)
+    builder.sun((0, 0, 11), (0., 10., 0.))
+    builder.hide('shot')
+    builder.camera(camPos, (0., 0., 0.), tilt=(angle, axis))
+    builder.render_settings(resx, resy, title+".png", 'PNG')
+    builder.render_profile(render_profile, render_threads)
+    render_cache.render_still(backend=backend)
+
+
+def parse_args(argv=None):
+    """
+    :param argv: command line, the options follow '--'
+    :return: settings namespace
+    """
+    #rep = "C:/Users/Simon/Documents/GitHub/Blender_shot_lab/sources/"
+    rep = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + "/../sources/"
+    parser = argparse.ArgumentParser(prog="make_sample_pic.py", description="Render the tilted sample pictures")
+    parser.add_argument("--cam_pos", type=cli.triplet, default=(0., 0., 5.), help="camera position 'x,y,z'")
+    parser.add_argument("--tilt", type=float, default=0., help="sample tilt (deg)")
+    parser.add_argument("--resx", type=int, default=500)
+    parser.add_argument("--resy", type=int, default=500)
+    render_profiles.add_argument(parser)
+    parser.add_argument("--chess_path", default=rep + "chessboard.png")
+    parser.add_argument("--out", default=rep, help="output directory")
+    return cli.parse_job_args(parser, argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    builder = scene_builder.SceneBuilder()
+    conver = math.pi/180
+    out_rep = args.out + "/"
+    if args.shard is not None:
+        out_rep = args.shard['out_dir'] + "/"
+    camPos = tuple(args.cam_pos)
+    tilt = args.tilt*conver
+    profile = dict(render_profile=args.render_profile, render_threads=args.render_threads,
+                   backend=soft_render.backend(args.render_backend, builder))
+    make_tilted_sample(builder, tilt, 'X', camPos, out_rep+"tilted_top", args.chess_path, args.resx, args.resy,
+                       **profile)
+    make_tilted_sample(builder, tilt, 'Z', camPos, out_rep+"tilted_left", args.chess_path, args.resx, args.resy,
+                       **profile)
+    print(builder.report())
+    if render_cache.default_cache() is not None:
+        print(render_cache.default_cache().stats_line())
@@ -0,0 +1,521 @@
+"""
+Scene library shared by the Blender jobs: the camera, sun, shot sphere, chessboard plate and Lensdist node are
+created once, then each new view only changes the transforms and parameters that differ from the current
+configuration, instead of deleting and rebuilding the whole scene with del_all().
+
+Data lifecycle: the meshes, materials and chessboard images are shared data blocks, created once per Blender
+session, kept by a fake user and reused by every builder. Everything else the builder creates (objects,
+camera and light data, actions) is deleted by clear() and close(), which then purge the orphan data blocks,
+so that bpy.data stays the same size across any number of scene rebuilds.
+
+    with SceneBuilder() as builder:
+        builder.camera(...)
+"""
+import colorsys
+import hashlib
+import sys
+import time
+import numpy as np
+from . import instrument
+from . import keyframes
+from . import projection
+from . import render_profiles
+from . import trajectories
+
+# bpy.data collections purged of their orphan data blocks
+ORPHAN_COLLECTIONS = ("objects", "meshes", "materials", "images", "cameras", "lights", "actions")
+
+
+def _traj_hash(frames, coords):
+    digest = hashlib.sha1(np.ascontiguousarray(frames, dtype=np.float32).tobytes())
+    digest.update(np.ascontiguousarray(coords, dtype=np.float32).tobytes())
+    return digest.hexdigest()
+
+
+def purge_orphans(data, collections=ORPHAN_COLLECTIONS):
+    """
+    Remove the data blocks without users, until none is left (removing a material can orphan its image)
+
+    :param data: bpy.data
+    :param collections: names of the bpy.data collections to purge
+    :return: number of removed data blocks
+    """
+    removed = 0
+    while True:
+        orphans = [(coll, block) for coll in (getattr(data, name) for name in collections)
+                   for block in coll if block.users == 0]
+        if not orphans:
+            return removed
+        for coll, block in orphans:
+            coll.remove(block)
+        removed += len(orphans)
+
+
+class SceneBuilder:
+    """
+    Keeps track of the objects it created and of the configuration they were last given
+
+    :param scene: scene to build, the current one by default
+    :param bpy: bpy module, imported by default (bpy_standin.BpyStandin to run without Blender)
+    :param mathutils: mathutils module, imported by default
+    """
+    def __init__(self, scene=None, bpy=None, mathutils=None):
+        if bpy is None:
+            import bpy
+        if mathutils is None:
+            import mathutils
+        self.bpy = bpy
+        self.mathutils = mathutils
+        self.scene = scene or bpy.context.scene
+        self.shared = {}
+        self.objects = {}
+        self.state = {}
+        self.fit = None
+        self.created = 0
+        self.updated = 0
+        self.skipped = 0
+        self.purged = 0
+        self.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @instrument.spanned()
+    def clear(self):
+        """
+        Reset the scene, like del_all, and purge the orphan data blocks
+
+        :return:
+        """
+        data = self.bpy.data
+        for obj in list(self.scene.objects):
+            data.objects.remove(obj, do_unlink=True)
+        self.scene.use_nodes = True
+        nodes = self.scene.node_tree.nodes
+        for name in nodes.keys():
+            if not(name == "Render Layers" or name == "Composite"):
+                nodes.remove(nodes[name])
+        self.objects = {}
+        self.state = {}
+        self.purged += purge_orphans(data)
+
+    @instrument.spanned()
+    def close(self):
+        """
+        Clear the scene and release the shared data blocks
+
+        :return:
+        """
+        self.clear()
+        for block in self.shared.values():
+            block.use_fake_user = False
+        self.shared = {}
+        self.purged += purge_orphans(self.bpy.data)
+
+    def _shared(self, collection, name, build):
+        """
+        Data block reused across scene rebuilds and builders, found by name and kept by a fake user
+
+        :param collection: bpy.data collection name
+        :param name: data block name
+        :param build: function returning a new data block named name
+        :return: data block
+        """
+        key = (collection, name)
+        block = self.shared.get(key)
+        if block is None:
+            block = getattr(self.bpy.data, collection).get(name)
+            if block is None:
+                with instrument.span("SceneBuilder.create", collection=collection, block=name):
+                    block = build()
+                block.name = name
+                self.created += 1
+            block.use_fake_user = True
+            self.shared[key] = block
+        return block
+
+    def _primitive(self, add, name):
+        """Mesh of a bpy.ops primitive, without the object the operator creates"""
+        def build():
+            add()
+            obj = self.bpy.context.object
+            mesh = obj.data
+            self.bpy.data.objects.remove(obj, do_unlink=True)
+            return mesh
+        return self._shared("meshes", name, build)
+
+    def _image(self, path):
+        """Image loaded once, shared by all the materials using it (not renamed, Blender names it after the file)"""
+        key = ("images", path)
+        image = self.shared.get(key)
+        if image is None:
+            with instrument.span("SceneBuilder.create", collection="images", block=path):
+                image = self.shared[key] = self.bpy.data.images.load(path, check_existing=True)
+            image.use_fake_user = True
+        return image
+
+    def _matrix(self, rotation, location):
+        mat = np.eye(4)
+        mat[:3, :3] = rotation
+        mat[:3, 3] = location
+        return self.mathutils.Matrix(mat.tolist())
+
+    def _diff(self, role, config):
+        """
+        :return: the keys of config that differ from the last applied configuration of role
+        """
+        old = self.state.get(role)
+        if old is None:
+            return set(config)
+        changed = set(key for key in config if old.get(key) != config[key])
+        if changed:
+            self.updated += 1
+        else:
+            self.skipped += 1
+        return changed
+
+    def _link(self, name, data):
+        obj = self.bpy.data.objects.new(name, data)
+        self.scene.collection.objects.link(obj)
+        self.created += 1
+        return obj
+
+    def _show(self, role):
+        obj = self.objects[role]
+        obj.hide_render = False
+        obj.hide_viewport = False
+        return obj
+
+    @instrument.spanned()
+    def camera(self, camPos, target=(0., 0., 0.), roll=0., rot_euler=None, tilt=None):
+        """
+        Place the scene camera
+
+        :param camPos: camera position triplet
+        :param target: looked at position triplet
+        :param roll: rotation about the viewing axis
+        :param rot_euler: euler angles overriding the look at rotation (make_anim)
+        :param tilt: optional (angle, axis) bpy.ops.transform.rotate applied after pointing (make_tilted_sample),
+            see projection.ops_rotate
+        :return: camera object
+        """
+        config = {"location": tuple(camPos), "target": tuple(target), "roll": roll,
+                  "rot_euler": None if rot_euler is None else tuple(rot_euler), "tilt": tilt}
+        if "camera" not in self.objects:
+            self.objects["camera"] = self._link("Camera", self.bpy.data.cameras.new("Camera"))
+        cam = self._show("camera")
+        if self._diff("camera", config):
+            if rot_euler is not None:
+                rotation = projection.euler_rotation(rot_euler)
+            else:
+                rotation = projection.look_at_rotation(camPos, target, roll)
+            if tilt is not None:
+                rotation = projection.ops_rotate(tilt[0], tilt[1]) @ rotation
+            cam.matrix_world = self._matrix(rotation, camPos)
+        self.scene.camera = cam
+        self.state["camera"] = config
+        return cam
+
+    @instrument.spanned()
+    def sun(self, location, target, radius=1.):
+        """
+        Place the sun light
+
+        :param location: light position triplet
+        :param target: looked at position triplet
+        :param radius: light radius, None to keep the Blender default
+        :return: sun object
+        """
+        config = {"location": tuple(location), "target": tuple(target), "radius": radius}
+        if "sun" not in self.objects:
+            light = self.bpy.data.lights.new("Sun", type='SUN')
+            # bpy.ops.object.light_add gives a sun 1 W/m^2, the data block default is 10
+            light.energy = 1.
+            self.objects["sun"] = self._link("Sun", light)
+        sun = self._show("sun")
+        changed = self._diff("sun", config)
+        if changed & {"location", "target"}:
+            sun.matrix_world = self._matrix(projection.look_at_rotation(location, target), location)
+        if "radius" in changed and radius is not None:
+            sun.data.shadow_soft_size = radius
+        self.state["sun"] = config
+        return sun
+
+    @instrument.spanned()
+    def shot(self, R, frames=None, coords=None, tolerance=None):
+        """
+        Sphere shot, keyframed along a trajectory
+
+        :param R: sphere radius (bu)
+        :param frames: (N,) keyframe frames
+        :param coords: (N, 3) sphere locations
+        :param tolerance: optional keyframe decimation tolerance (bu), see keyframes.fit_keyframes.
+            One keyframe per sample by default.
+        :return: shot object
+        """
+        config = {"radius": R, "traj": None if coords is None else _traj_hash(frames, coords), "tolerance": tolerance}
+        if "shot" not in self.objects:
+            mesh = self._primitive(lambda: self.bpy.ops.mesh.primitive_uv_sphere_add(radius=1., location=(0., 0., 0.)),
+                                   "ShotMesh")
+            if not len(mesh.materials):
+                mesh.materials.append(self._shared("materials", "ShotMat", self._shot_material))
+            self.objects["shot"] = self._link("Shot", mesh)
+        shot = self._show("shot")
+        changed = self._diff("shot", config)
+        if "radius" in changed:
+            shot.scale = (R, R, R)
+        if changed & {"traj", "tolerance"} and coords is not None:
+            if tolerance is None:
+                keyframes.insert_location_keyframes(shot, frames, coords, self.bpy.data.actions)
+            else:
+                self.fit = keyframes.fit_keyframes(frames, coords, tolerance)
+                keyframes.insert_location_keyframes(shot, self.fit.frames, self.fit.coords, self.bpy.data.actions,
+                                                    self.fit.slopes)
+        self.state["shot"] = config
+        return shot
+
+    @instrument.spanned()
+    def shot_film(self, t, xyz, fps, R=0.1, exposure=0., subsamples=1, tolerance=None):
+        """
+        Film the shot with a camera running at fps: sets the scene frame rate and frame range to the camera frames
+        within the trajectory span and keys the shot at the camera frame times (trajectories.camera_keys).
+        With an exposure and sub-samples, the motion blur shutter is opened for the exposure and the shot is also
+        keyed at the sub-sample times (fractional frames).
+
+        :param t: (M,) trajectory times (s)
+        :param xyz: (M, 3) trajectory positions
+        :param fps: camera frame rate (Hz)
+        :param R: sphere radius (bu)
+        :param exposure: exposure time (s)
+        :param subsamples: motion blur sub-samples per frame, no motion blur below 2
+        :param tolerance: optional keyframe decimation tolerance (bu)
+        :return: (N,) rendered frame numbers
+        """
+        frames, key_frames, coords = trajectories.camera_keys(t, xyz, fps, exposure, subsamples)
+        scene = self.scene
+        scene.render.fps, scene.render.fps_base = trajectories.blender_fps(fps)
+        scene.frame_start, scene.frame_end = int(frames[0]), int(frames[-1])
+        blur = subsamples > 1 and exposure > 0.
+        # Cycles and Blender 4.2+ Eevee settings, the shutter is given in frames
+        scene.render.use_motion_blur = blur
+        if blur:
+            scene.render.motion_blur_shutter = exposure * fps
+        self.shot(R, key_frames, coords, tolerance)
+        return frames
+
+    def _shot_material(self):
+        mat = self.bpy.data.materials.new(name='ShotMat')
+        mat.diffuse_color[:3] = colorsys.hsv_to_rgb(0.5, 0.5, 0.5)
+        return mat
+
+    def _plate_material(self):
+        mat = self.bpy.data.materials.new(name="test")
+        mat.use_nodes = True
+        texImage = mat.node_tree.nodes.new('ShaderNodeTexImage')
+        texImage.texture_mapping.scale = (4., 4., 1.)
+        texImage.texture_mapping.translation = (0.5, 0., 0.)
+        mat.node_tree.links.new(mat.node_tree.nodes["Principled BSDF"].inputs['Base Color'], texImage.outputs['Color'])
+        return mat
+
+    @instrument.spanned()
+    def plate(self, L, h, chess_path, matrix_world=None, specular=None):
+        """
+        Chessboard calibration plate
+
+        :param L: chessboard square size (bu)
+        :param h: chessboard height to length ratio
+        :param chess_path: chessboard picture path
+        :param matrix_world: optional 4x4 pose of the plate
+        :param specular: optional specular intensity of the plate material
+        :return: plate object
+        """
+        config = {"L": L, "h": h, "chess_path": chess_path, "specular": specular,
+                  "matrix_world": None if matrix_world is None else np.asarray(matrix_world).tolist()}
+        if "plate" not in self.objects:
+            mesh = self._primitive(lambda: self.bpy.ops.mesh.primitive_cube_add(size=1., enter_editmode=False,
+                                                                                location=(0, 0, 0)), "PlateMesh")
+            if not len(mesh.materials):
+                mesh.materials.append(self._shared("materials", "test", self._plate_material))
+            self.objects["plate"] = self._link("Plate", mesh)
+        plate = self._show("plate")
+        changed = self._diff("plate", config)
+        mat = plate.data.materials[0]
+        if "chess_path" in changed:
+            texImage = mat.node_tree.nodes["Image Texture"]
+            if texImage.image is None or texImage.image.filepath != chess_path:
+                texImage.image = self._image(chess_path)
+        if "specular" in changed and specular is not None:
+            mat.node_tree.nodes["Principled BSDF"].inputs[5].default_value = specular # 'Specular' input
+        if changed & {"L", "h", "matrix_world"}:
+            scale = np.diag([L, L, L * h, 1.])
+            pose = np.eye(4) if matrix_world is None else np.asarray(matrix_world, dtype=float)
+            plate.matrix_world = self.mathutils.Matrix((pose @ scale).tolist())
+        self.state["plate"] = config
+        return plate
+
+    @instrument.spanned()
+    def lens_dist(self, dist_param):
+        """
+        Lensdist compositor node between the render layers and the composite output
+
+        :param dist_param: lens distortion parameter
+        :return: compositor node
+        """
+        tree = self.scene.node_tree
+        node = tree.nodes.get("Lens Distortion")
+        if node is None:
+            node = tree.nodes.new('CompositorNodeLensdist')
+            node.name = "Lens Distortion"
+            tree.links.new(tree.nodes["Render Layers"].outputs[0], node.inputs[0])
+            tree.links.new(tree.nodes["Composite"].inputs[0], node.outputs[0])
+            node.use_projector = False
+            self.created += 1
+        if self._diff("lens_dist", {"dist_param": dist_param}):
+            node.inputs[1].default_value = dist_param
+        self.state["lens_dist"] = {"dist_param": dist_param}
+        return node
+
+    @instrument.spanned()
+    def render_settings(self, resx, resy, filepath, file_format='PNG', color_mode='RGB', view_transform='Standard'):
+        """
+        :param resx, resy: image resolution
+        :param filepath: output path
+        :param file_format: image format
+        :param color_mode: 'BW', 'RGB' ...
+        :param view_transform: color management of the saved images, Standard (plain sRGB, no look) for every output
+            path alike: files, frame stacks read back through the Viewer node, region of interest frames and the
+            NumPy renderer
+        :return:
+        """
+        render = self.scene.render
+        render.resolution_x = resx
+        render.resolution_y = resy
+        render.filepath = filepath
+        render.image_settings.file_format = file_format
+        render.image_settings.color_mode = color_mode
+        self.scene.view_settings.view_transform = view_transform
+        self.scene.view_settings.look = 'None'
+
+    @instrument.spanned()
+    def render_profile(self, profile=render_profiles.DEFAULT, threads=None):
+        """
+        Render engine and sampling settings, see render_profiles.py
+
+        :param profile: render_profiles.PROFILES name
+        :param threads: fixed render thread count (0: automatic), None to keep the current setting
+        :return:
+        """
+        config = {"profile": profile, "threads": threads}
+        if self._diff("render_profile", config):
+            render_profiles.apply(self.scene, profile, threads)
+        self.state["render_profile"] = config
+
+    def hide(self, *roles):
+        """
+        Hide objects not used by the current view instead of deleting them
+
+        :param roles: object roles ('shot', 'plate' ...)
+        :return:
+        """
+        for role in roles:
+            if role in self.objects:
+                self.objects[role].hide_render = True
+                self.objects[role].hide_viewport = True
+
+    def show(self, *roles):
+        """
+        Show objects hidden by hide
+
+        :param roles: object roles ('shot', 'plate' ...)
+        :return:
+        """
+        for role in roles:
+            if role in self.objects:
+                self._show(role)
+
+    def report(self):
+        report = "scene builder: %d created, %d updated, %d unchanged, %d orphans purged" % (
+            self.created, self.updated, self.skipped, self.purged)
+        if self.fit is not None:
+            report += "\nshot keyframes: %s" % self.fit
+        return report
+
+
+def count_blocks(data, collections=ORPHAN_COLLECTIONS):
+    """
+    :param data: bpy.data
+    :return: dict of the number of data blocks per collection
+    """
+    return {name: len(getattr(data, name)) for name in collections}
+
+
+def _heap_size(snapshot):
+    """Traced memory allocated by the shot_lab code (the builder and the bpy stand-in), not by NumPy or tracemalloc"""
+    import os
+    import tracemalloc
+    package = os.path.join(os.path.dirname(os.path.abspath(__file__)), "*")
+    return sum(stat.size for stat in snapshot.filter_traces([tracemalloc.Filter(True, package)]).statistics("filename"))
+
+
+def leak_check(rebuilds=2000, builders=20, bpy=None, mathutils=None, max_growth_kb=16.):
+    """
+    Memory growth check: rebuild the calibration and shot scenes many times, with a new builder every
+    rebuilds / builders rebuilds, and check that bpy.data and the Python heap allocated by shot_lab
+    stay flat once the first quarter of the builders has warmed up. Runs on the bpy stand-in by default, pass the
+    real modules to run it inside Blender (tests/test_scene_builder.py runs it on the stand-in).
+
+    :param rebuilds: number of scene rebuilds
+    :param builders: number of successive builders
+    :param max_growth_kb: allowed Python heap growth between the warmed up and the last builder (kB)
+    :return: dict of the data block counts and heap sizes after the warm up and the last builder
+    """
+    import tracemalloc
+    if bpy is None:
+        from . import bpy_standin
+        bpy = bpy_standin.BpyStandin()
+        mathutils = bpy.mathutils
+    rng = np.random.default_rng(0)
+    frames = np.arange(50)
+    first = None
+    builders = max(builders, 2)
+    tracemalloc.start()
+    start = time.perf_counter()
+    for b in range(builders):
+        builder = SceneBuilder(bpy=bpy, mathutils=mathutils)
+        for i in range(rebuilds // builders):
+            # alternate the calibration and shot scenes, each from scratch
+            builder.clear()
+            if i % 2:
+                builder.plate(2., 0.05, "chessboard_%d.png" % (i % 3), np.eye(4), specular=0.)
+                builder.sun((0., 0., 5.), (0., 10., 0.), None)
+                builder.camera((0., 0., 5.))
+            else:
+                builder.camera((0., -5., 0.), rot_euler=(np.pi / 2, 0., 0.))
+                builder.sun((0., -5., 0.), (0., 0., 0.))
+                builder.shot(0.1, frames, rng.random((50, 3)))
+            builder.lens_dist(0.01 * (i % 5))
+        last = (count_blocks(bpy.data), _heap_size(tracemalloc.take_snapshot()))
+        if b == max(builders // 4, 1):
+            first = last
+        if b < builders - 1:
+            builder.close()
+    duration = time.perf_counter() - start
+    tracemalloc.stop()
+    print("%d rebuilds by %d builders in %.2f s (%.2f ms per rebuild)"
+          % (rebuilds, builders, duration, 1000 * duration / rebuilds))
+    print("data blocks after the warm up:    %s" % first[0])
+    print("data blocks after the last builder: %s" % last[0])
+    growth = (last[1] - first[1]) / 1024.
+    print("python heap: %.1f kB -> %.1f kB (%+.1f kB)" % (first[1] / 1024., last[1] / 1024., growth))
+    assert last[0] == first[0], "bpy.data grows across rebuilds"
+    assert growth < max_growth_kb, "python heap grows across rebuilds"
+    builder.close()
+    assert sum(count_blocks(bpy.data).values()) == 0, "data left after close()"
+    return {"counts": (first[0], last[0]), "heap": (first[1], last[1])}
+
+
+if __name__ == "__main__":
+    leak_check(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
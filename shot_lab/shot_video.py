@@ -0,0 +1,213 @@
+"""
+Generate picture of a sphere with a given trajectory, filmed by two cameras
+
+    blender -b -P make_shot_video.py -- --num_frames 100 --dist_param 0.05 --out 3Drecons
+"""
+import argparse
+import json
+import math
+import os
+import numpy as np
+from . import camera_rig
+from . import cli
+from . import frame_stack
+from . import instrument
+from . import projection
+from . import render_cache
+from . import render_profiles
+from . import roi_render
+from . import scene_builder
+from . import soft_render
+from . import traj_bin
+from . import trajectories
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CAMERAS = {'camLeft': ((0.,-5., 0.), (math.pi/2, 0., 0.)),
+           'camTop': ((0.,0., 5.), (0., 0., math.pi/2))}
+
+
+def make_shot_film(builder, traj_t, shot_traj, fps, exposure=0., subsamples=1, tolerance=None):
+    """
+    Generate keyframes of the sphere trajectory to make the animation, filmed at the camera frame rate
+
+    :param builder: scene_builder.SceneBuilder
+    :param traj_t: (N,) trajectory times (s)
+    :param shot_traj: (N, 3) trajectory (X,Y,Z)
+    :param fps: camera frame rate (Hz)
+    :param exposure: exposure time (s), for the motion blur
+    :param subsamples: motion blur sub-samples per frame
+    :param tolerance: optional keyframe decimation tolerance (bu)
+    :return: (n,) rendered frames
+    """
+    return builder.shot_film(traj_t, shot_traj, fps, 0.1, exposure, subsamples, tolerance)
+
+def make_doublesin_traj(numFrame, kind="line"):
+    """
+    Make the shot trajectory
+
+    :param numFrame:
+    :param kind: 'line' (straight flight along X) or 'double_sine' (wobbling in Y and Z), see trajectories.py
+    :return: (numFrame, 3) array of the sphere positions
+    """
+    t = np.arange(numFrame, dtype=float)
+    if kind == "double_sine":
+        return trajectories.double_sine(t, (-4., 0., 0.), (4., 0., 0.), amplitude=(1., 1.), periods=2.)
+    return trajectories.line(t, (-4., 0., 0.), (4., 0., 0.))
+
+
+def shot_trajectory(num_frames, kind="line", traj_path=None, fps=None):
+    """
+    Sphere trajectory of the job: a trajectory file, or a synthetic one with a sample per camera frame
+
+    :param num_frames: number of frames of the synthetic trajectory
+    :param kind: synthetic trajectory kind, see make_doublesin_traj
+    :param traj_path: optional trajectory file, see traj_bin.py
+    :param fps: camera frame rate (Hz), 24 or the capture rate of the trajectory file by default
+    :return: (N,) times (s), (N, 3) positions, camera frame rate
+    """
+    if traj_path is None:
+        fps = fps or 24.
+        return np.arange(num_frames) / fps, make_doublesin_traj(num_frames, kind), fps
+    traj = traj_bin.open_traj_bin(traj_path)
+    traj_t, positions = traj.valid()
+    return traj_t, positions, fps or traj.frame_rate
+
+@instrument.spanned()
+def make_anim(builder, camPos, traj_t, doublesin_traj, fpath, resx, resy, rot_euler, f=0., frame_range=None, fps=24.,
+              exposure=0., subsamples=1, tolerance=None, roi_margin=None, render_profile=render_profiles.DEFAULT,
+              render_threads=None, output="jpeg", backend=None):
+    """
+    Render the animation as black and white JPEGs
+
+    :param builder: scene_builder.SceneBuilder
+    :param camPos: camera position triplet
+    :param traj_t: (N,) trajectory times (s)
+    :param doublesin_traj: (N, 3) sphere trajectory
+    :param fpath: path to save the pictures to
+    :param resx, resy: camera resolution
+    :param rot_euler: camera euler angles
+    :param f: lens distortion parameter
+    :param frame_range: optional (start, end) frames to render, all the camera frames of the trajectory by default
+    :param fps: camera frame rate (Hz)
+    :param exposure: exposure time (s), for the motion blur
+    :param subsamples: motion blur sub-samples per frame
+    :param tolerance: optional keyframe decimation tolerance (bu)
+    :param roi_margin: render only the box around the shot, with this margin (px), see roi_render.py
+    :param render_profile: render_profiles.PROFILES name
+    :param render_threads: fixed render thread count
+    :param output: 'jpeg' (a file per frame) or a frame_stack.py format ('npy', 'hdf5'): a single <fpath>stack file
+        holding the frames, their times and the ground truth shot positions
+    :param backend: optional soft_render.Backend rendering in place of Blender (by boxes already, roi_margin unused)
+    :return:
+    """
+    scene = builder.scene
+    builder.camera(camPos, (0, 0, 0), rot_euler=rot_euler)
+    builder.sun(camPos, (0., 0., 0.))
+    make_shot_film(builder, traj_t, doublesin_traj, fps, exposure, subsamples, tolerance)
+    if frame_range is not None:
+        scene.frame_start, scene.frame_end = frame_range
+    builder.lens_dist(f)
+    builder.render_settings(resx, resy, fpath, 'JPEG', 'BW')
+    builder.render_profile(render_profile, render_threads)
+    writer = None
+    if backend is not None:
+        roi_margin = None
+    if output != "jpeg":
+        # ground truth from the tracked samples only, like the keyframes of make_shot_film
+        gt_t, gt_xyz = trajectories.tracked_rows(traj_t, doublesin_traj)
+        frames, times = trajectories.frame_times(gt_t[0], gt_t[-1], fps)
+        keep = (frames >= scene.frame_start) & (frames <= scene.frame_end)
+        frames, times = frames[keep], times[keep]
+        positions = trajectories.interpolate(gt_t, gt_xyz, times)
+        attrs = frame_stack.camera_attrs(os.path.basename(fpath).rstrip("_"), camPos, rot_euler, resx, resy, f, fps,
+                                         exposure)
+        # render_farm.py shards of a camera share its prefix
+        path = fpath + ("stack" if frame_range is None else "stack_%04d_%04d" % tuple(frame_range))
+        if roi_margin is None:
+            frame_stack.render_stack(scene, path, frames, times, positions, attrs, output, backend=backend)
+            return
+        writer = frame_stack.StackWriter(path, (resy, resx), frames, times, positions, attrs, output)
+    if roi_margin is None:
+        render_cache.render_animation(backend=backend)
+    else:
+        if rot_euler is None:
+            cam = projection.Camera.look_at(camPos, (0., 0., 0.), resx, resy)
+        else:
+            cam = projection.Camera.from_euler(camPos, rot_euler, resx, resy)
+        stats = roi_render.render_animation(builder, cam, traj_t, doublesin_traj, fps, 0.1, exposure, subsamples, f,
+                                            roi_margin, writer)
+        if writer is not None:
+            writer.close()
+        print("%s: %d frames by region of interest (%.2f %% of the pixels) in %.1f s"
+              % (fpath, stats["frames"], 100. * stats["pixel_fraction"], stats["seconds"]))
+
+
+def parse_args(argv=None):
+    """
+    :param argv: command line, the options follow '--'
+    :return: settings namespace
+    """
+    parser = argparse.ArgumentParser(prog="make_shot_video.py", description="Render the shot seen by the cameras")
+    parser.add_argument("--num_frames", type=int, default=50)
+    parser.add_argument("--traj_kind", default="line", choices=("line", "double_sine"),
+                        help="analytic trajectory, see trajectories.py")
+    parser.add_argument("--traj_path", default=None,
+                        help="optional binary trajectory file (.trj) to film instead of the analytic one")
+    parser.add_argument("--fps", type=float, default=None,
+                        help="camera frame rate (Hz), the trajectory file rate or 24 for the analytic trajectory")
+    parser.add_argument("--exposure", type=float, default=0., help="exposure time (s), for the motion blur")
+    parser.add_argument("--blur_samples", type=int, default=1, help="motion blur sub-samples per frame")
+    parser.add_argument("--dist_param", type=float, default=0., help="Lensdist distortion parameter")
+    parser.add_argument("--roi", action="store_true",
+                        help="render only the box around the shot over a cached background, see roi_render.py")
+    parser.add_argument("--roi_margin", type=int, default=2, help="margin of the region of interest (px)")
+    parser.add_argument("--key_tolerance", type=float, default=None,
+                        help="keyframe decimation tolerance (bu), see keyframes.fit_keyframes. "
+                             "One keyframe per sample by default")
+    parser.add_argument("--resx", type=int, default=500)
+    parser.add_argument("--resy", type=int, default=500)
+    render_profiles.add_argument(parser)
+    parser.add_argument("--output", default="jpeg", choices=("jpeg",) + frame_stack.FORMATS,
+                        help="a JPEG per frame, or a single frame stack per camera, see frame_stack.py")
+    parser.add_argument("--cameras", type=json.loads, default={},
+                        help="extra or replaced cameras, JSON {name: [position, euler angles]} or "
+                             "{name: {location, rot_euler, resx, resy, dist_param}}, see camera_rig.RigCamera")
+    parser.add_argument("--rig", action="store_true",
+                        help="key the shot once and film every camera from its own view scene, see camera_rig.py")
+    parser.add_argument("--out", default=os.path.join(os.path.dirname(ROOT), "3Drecons"), help="output directory")
+    args = cli.parse_job_args(parser, argv)
+    if args.rig and args.roi:
+        parser.error("--rig renders whole frames, it does not combine with --roi")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    builder = scene_builder.SceneBuilder()
+    traj_t, doublesin_traj, fps = shot_trajectory(args.num_frames, args.traj_kind, args.traj_path, args.fps)
+    f = args.dist_param
+    timing = dict(fps=fps, exposure=args.exposure, subsamples=args.blur_samples, tolerance=args.key_tolerance,
+                  roi_margin=args.roi_margin if args.roi else None, render_profile=args.render_profile,
+                  render_threads=args.render_threads, output=args.output,
+                  backend=soft_render.backend(args.render_backend, builder))
+    cameras = {cam.name: cam for cam in camera_rig.make_cameras(dict(CAMERAS, **args.cameras), args.resx, args.resy, f)}
+    shard = args.shard
+    if shard is None and args.rig:
+        with camera_rig.CameraRig(builder, cameras.values()) as rig:
+            rig.film(traj_t, doublesin_traj, fps, 0.1, args.exposure, args.blur_samples, args.key_tolerance)
+            rig.setup(args.out, args.render_profile, args.render_threads)
+            rig.render(args.output, timing["backend"])
+            print(rig.report())
+    elif shard is None:
+        out_dir = args.out + "/"
+        for name, cam in cameras.items():
+            make_anim(builder, cam.location, traj_t, doublesin_traj, out_dir + name + "/" + name + "_", cam.resx,
+                      cam.resy, cam.rot_euler, cam.dist_param, **timing)
+    else:
+        # render_farm.py worker: a single camera and frame range
+        cam = cameras[shard['camera']]
+        make_anim(builder, cam.location, traj_t, doublesin_traj, shard['out_dir'] + "/" + shard['prefix'], cam.resx,
+                  cam.resy, cam.rot_euler, cam.dist_param, shard['frames'], **timing)
+    print(builder.report())
+    if render_cache.default_cache() is not None:
+        print(render_cache.default_cache().stats_line())
@@ -0,0 +1,477 @@
+"""
+NumPy render backend of the lab scenes, a diffuse sphere (the shot) or a chessboard plate under a sun light, ray cast
+without Blender from the same camera, light and Lensdist description, in batches of frames spread over processes.
+
+    renderer = SoftRenderer(projection.Camera.from_euler(camPos, rot_euler, 500, 500, dist_param=0.05))
+    frames = renderer.render_shot(centers, radius=0.1)         (N, H, W) float32 frames in [0, 1]
+    frames = render_parallel(renderer, "plates", matrices, texture=chessboard())
+
+    blender -b -P make_shot_video.py -- --render_backend numpy       (in place of bpy.ops.render.render)
+    python -m shot_lab.soft_render [frames]                          (benchmark)
+
+Shading: Lambert diffuse lit by the sun and by the uniform world color, no shadows (one convex object per scene),
+then the Lensdist distortion and the sRGB transfer function of the Standard view transform. The sphere is smooth
+(Blender's UV sphere is faceted) and the plate texture covers its top face. Only the box around the projected object
+is ray cast, the rest of each frame is the precomputed background, so the cost per frame follows the object size.
+"""
+import os
+import sys
+import time
+import numpy as np
+from . import instrument
+from . import lens_remap
+from . import projection
+from . import roi_render
+
+LUMA = np.array([0.2126, 0.7152, 0.0722])
+_CUBE = np.array([[x, y, z] for x in (-.5, .5) for y in (-.5, .5) for z in (-.5, .5)])
+_EDGE = np.linspace(0., 1., 16)
+
+
+def srgb(linear):
+    """sRGB transfer function, what saving with the Standard view transform applies"""
+    linear = np.clip(linear, 0., 1.)
+    return np.where(linear <= 0.0031308, 12.92 * linear, 1.055 * linear ** (1. / 2.4) - 0.055)
+
+
+def linear(encoded):
+    """Inverse sRGB transfer function, image textures to scene linear"""
+    encoded = np.asarray(encoded, dtype=np.float32)
+    return np.where(encoded <= 0.04045, encoded / 12.92, ((encoded + 0.055) / 1.055) ** 2.4)
+
+
+def chessboard(squares=7, square_px=32):
+    """
+    :param squares: number of squares along each side, a 7x7 board has the 6x6 inner corners of calibration.py
+    :param square_px: texture pixels per square
+    :return: (squares * square_px, squares * square_px) linear texture
+    """
+    board = (np.indices((squares, squares)).sum(axis=0) % 2).astype(np.float32)
+    return np.kron(board, np.ones((square_px, square_px), dtype=np.float32))
+
+
+class SoftRenderer:
+    """
+    :param cam: projection.Camera, with the Lensdist parameter
+    :param sun: direction towards the sun (world)
+    :param strength: sun strength (Blender W/m2)
+    :param ambient: world color (linear gray), lights the objects and fills the background
+    :param samples: samples per pixel along each axis
+    """
+    def __init__(self, cam, sun=(0., 0., 1.), strength=1., ambient=0.05, samples=2):
+        self.cam = cam
+        self.sun = np.asarray(sun, dtype=float) / np.linalg.norm(sun)
+        self.strength = strength
+        self.ambient = ambient
+        self.samples = samples
+        self._table = None
+        self._background = None
+        self._delta = None
+
+    def __getstate__(self):
+        # the process pool workers memory-map the remap table from the cache again
+        state = dict(self.__dict__)
+        state["_table"] = state["_background"] = state["_delta"] = None
+        return state
+
+    @property
+    def shape(self):
+        return self.cam.resy, self.cam.resx
+
+    @property
+    def table(self):
+        """Lensdist remap table, None without distortion"""
+        if self._table is None and self.cam.dist_param:
+            self._table = lens_remap.remap_table(self.cam.resx, self.cam.resy, self.cam.dist_param, "distort")
+        return self._table
+
+    @property
+    def background(self):
+        """(H, W) linear background after distortion (the corners left without source go dark like Lensdist)"""
+        if self._background is None:
+            frame = np.full(self.shape, self.ambient, dtype=np.float32)
+            self._background = frame if self.table is None else self.table.apply(frame)
+        return self._background
+
+    def _rays(self, box, unit=True):
+        """(h * s, w * s, 3) ray directions through the box samples, camera frame, normalized when unit"""
+        x0, y0, x1, y1 = box
+        sub = (np.arange(self.samples) + 0.5) / self.samples
+        f = self.cam.focal_px
+        xs = ((np.arange(x0, x1)[:, None] + sub).ravel() - self.cam.resx / 2.) / f
+        ys = -((np.arange(y0, y1)[:, None] + sub).ravel() - self.cam.resy / 2.) / f
+        dirs = np.empty((len(ys), len(xs), 3))
+        dirs[..., 0] = xs
+        dirs[..., 1] = ys[:, None]
+        dirs[..., 2] = -1.
+        return dirs / np.linalg.norm(dirs, axis=-1, keepdims=True) if unit else dirs
+
+    def _shade(self, hit, normal, albedo):
+        """linear radiance of the diffuse surface, the world color where nothing is hit"""
+        lambert = np.clip(normal @ self.sun, 0., None) * (self.strength / np.pi)
+        return np.where(hit, albedo * (self.ambient + lambert), self.ambient)
+
+    def _downsample(self, samples, box):
+        x0, y0, x1, y1 = box
+        s = self.samples
+        return samples.reshape(y1 - y0, s, x1 - x0, s).mean(axis=(1, 3)).astype(np.float32)
+
+    def trace_shot(self, center, radius, albedo, box):
+        """
+        :param center: sphere center (world)
+        :param radius: sphere radius (bu)
+        :param albedo: diffuse albedo (linear)
+        :param box: (x0, y0, x1, y1) raw image box
+        :return: (y1 - y0, x1 - x0) linear raw pixels
+        """
+        dirs = self._rays(box)
+        c = self.cam.to_camera(center)
+        b = dirs @ c
+        disc = b * b - (c @ c - radius * radius)
+        dist = b - np.sqrt(np.clip(disc, 0., None))
+        hit = (disc > 0.) & (dist > 0.)
+        # normals in world coordinates
+        normal = ((dirs * dist[..., None] - c) / radius) @ self.cam.rotation.T
+        return self._downsample(self._shade(hit, normal, albedo), box)
+
+    def trace_plate(self, matrix, texture, albedo, box):
+        """
+        :param matrix: 4x4 plate matrix_world, scale included (unit cube mesh)
+        :param texture: (th, tw) linear texture of the top face, None for a plain plate
+        :param albedo: albedo of the other faces (linear)
+        :param box: (x0, y0, x1, y1) raw image box
+        :return: (y1 - y0, x1 - x0) linear raw pixels
+        """
+        inverse = np.linalg.inv(np.asarray(matrix, dtype=float))
+        A = inverse[:3, :3]
+        origin = (A @ self.cam.location + inverse[:3, 3]).astype(np.float32)
+        # slab test in the cube frame, one (h * s, w * s) array per axis, single precision is plenty at image scale
+        dirs = np.moveaxis(self._rays(box, unit=False) @ (A @ self.cam.rotation).T, -1, 0).astype(np.float32)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            inv = 1. / dirs
+            t1 = (-0.5 - origin[:, None, None]) * inv
+            t2 = (0.5 - origin[:, None, None]) * inv
+        near = np.fmin(t1, t2)
+        t_near = np.maximum(np.maximum(near[0], near[1]), near[2])
+        far = np.fmax(t1, t2)
+        hit = (np.minimum(np.minimum(far[0], far[1]), far[2]) >= t_near) & (t_near > 0.)
+        # faces 2 * axis + (outward normal along +axis): flat, a single Lambert term each
+        axis = np.where(near[0] == t_near, 0, np.where(near[1] == t_near, 1, 2))
+        face = 2 * axis + (np.take_along_axis(dirs, axis[None], axis=0)[0] < 0.)
+        normals = np.repeat(np.eye(3), 2, axis=0) * np.tile((-1., 1.), 3)[:, None] @ A
+        normals /= np.linalg.norm(normals, axis=-1, keepdims=True)
+        lambert = np.clip(normals @ self.sun, 0., None) * (self.strength / np.pi)
+        surface = np.full(hit.shape, albedo, dtype=np.float32)
+        if texture is not None:
+            top = hit & (face == 5)
+            point_x = origin[0] + t_near * dirs[0]
+            point_y = origin[1] + t_near * dirs[1]
+            th, tw = texture.shape
+            tx = np.clip(((point_x[top] + 0.5) * tw).astype(int), 0, tw - 1)
+            ty = np.clip(((0.5 - point_y[top]) * th).astype(int), 0, th - 1)
+            surface[top] = texture[ty, tx]
+        radiance = np.where(hit, surface * (self.ambient + lambert.astype(np.float32)[face]), self.ambient)
+        return self._downsample(radiance, box)
+
+    def compose(self, raw, box, out):
+        """
+        Frame of a raw box traced over the background: distorted through the remap table rows whose sources fall
+        in the box, then sRGB encoded, only around the box
+
+        :param raw: (y1 - y0, x1 - x0) linear raw pixels
+        :param box: (x0, y0, x1, y1)
+        :param out: (H, W) output frame
+        :return: out
+        """
+        background = self.background
+        x0, y0, x1, y1 = box
+        if x1 <= x0 or y1 <= y0:
+            return out
+        table = self.table
+        if table is None:
+            out[y0:y1, x0:x1] = srgb(raw)
+            return out
+        resy, resx = self.shape
+        # the distortion is radial and monotone: the box border bounds the output region
+        edge = np.empty((4, len(_EDGE), 2))
+        edge[:2, :, 0] = x0 + _EDGE * (x1 - x0)
+        edge[:2, :, 1] = ((y0,), (y1,))
+        edge[2:, :, 0] = ((x0,), (x1,))
+        edge[2:, :, 1] = y0 + _EDGE * (y1 - y0)
+        uv = projection.distort_points(edge.reshape(-1, 2), self.cam.dist_param, resx, resy)
+        u0, v0 = np.clip(np.floor(np.nanmin(uv, axis=0)).astype(int) - 2, 0, (resx, resy))
+        u1, v1 = np.clip(np.ceil(np.nanmax(uv, axis=0)).astype(int) + 2, 0, (resx, resy))
+        flat = (np.arange(v0, v1)[:, None] * resx + np.arange(u0, u1)).ravel()
+        if self._delta is None:
+            self._delta = np.zeros(self.shape, dtype=np.float32)
+        self._delta[y0:y1, x0:x1] = raw - self.ambient
+        gathered = self._delta.ravel()[np.asarray(table.index)[:, flat]] * np.asarray(table.weight)[:, flat]
+        self._delta[y0:y1, x0:x1] = 0.
+        region = background[v0:v1, u0:u1] + gathered.sum(axis=0).reshape(v1 - v0, u1 - u0)
+        out[v0:v1, u0:u1] = srgb(region)
+        return out
+
+    def _render(self, trace, params, boxes, dtype, out):
+        background = srgb(self.background).astype(np.float32)
+        if out is None:
+            out = np.empty((len(params),) + self.shape, dtype=dtype)
+        direct = out.dtype == np.float32 and isinstance(out, np.ndarray)
+        frame = np.empty(self.shape, dtype=np.float32)
+        for i, (param, box) in enumerate(zip(params, boxes)):
+            target = out[i] if direct else frame
+            target[:] = background
+            box = tuple(int(v) for v in box)
+            self.compose(trace(param, box), box, target)
+            if not direct:
+                out[i] = frame if out.dtype != np.uint8 else frame * 255. + 0.5
+        return out
+
+    def render_shot(self, centers, radius=0.1, albedo=0.5, dtype=np.float32, out=None):
+        """
+        :param centers: (N, 3) sphere centers
+        :param radius: sphere radius (bu)
+        :param albedo: diffuse albedo (linear)
+        :param dtype: float32 frames in [0, 1] or uint8
+        :param out: optional (N, H, W) output array, e.g. a frame_stack memmap
+        :return: (N, H, W) frames
+        """
+        centers = np.asarray(centers, dtype=float).reshape(-1, 3)
+        boxes = roi_render.sphere_boxes(self.cam, centers, radius, margin=1)
+        return self._render(lambda center, box: self.trace_shot(center, radius, albedo, box), centers, boxes,
+                            dtype, out)
+
+    def render_plates(self, matrices, texture=None, albedo=0.8, dtype=np.float32, out=None):
+        """
+        :param matrices: (N, 4, 4) plate matrix_world, scale included
+        :param texture: linear top face texture, chessboard() by default
+        :param albedo: albedo of the plate sides (linear)
+        :param dtype: float32 frames in [0, 1] or uint8
+        :param out: optional (N, H, W) output array
+        :return: (N, H, W) frames
+        """
+        matrices = np.asarray(matrices, dtype=float).reshape(-1, 4, 4)
+        texture = chessboard() if texture is None else texture
+        corners = _CUBE @ matrices[:, :3, :3].transpose(0, 2, 1) + matrices[:, None, :3, 3]
+        boxes = roi_render.point_boxes(self.cam, corners, margin=1)
+        return self._render(lambda matrix, box: self.trace_plate(matrix, texture, albedo, box), matrices, boxes,
+                            dtype, out)
+
+
+def _render_chunk(renderer, kind, params, kwargs, shared=None):
+    """Render a chunk of frames, into the shared memory block (name, shape, dtype, start) when given"""
+    if shared is None:
+        return getattr(renderer, "render_" + kind)(params, **kwargs)
+    from multiprocessing import shared_memory
+    name, shape, dtype, start = shared
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        frames = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        getattr(renderer, "render_" + kind)(params, out=frames[start:start + len(params)], **kwargs)
+        del frames
+    finally:
+        block.close()
+
+
+def render_parallel(renderer, kind, params, workers=None, chunk=64, **kwargs):
+    """
+    Render a batch of frames over a process pool, the workers writing the frames into shared memory
+
+    :param renderer: SoftRenderer
+    :param kind: 'shot' (params: sphere centers) or 'plates' (params: matrices)
+    :param params: per frame parameters
+    :param workers: number of processes, all cores by default, 1 to render in process
+    :param chunk: frames per task
+    :param kwargs: render_shot or render_plates options (dtype, out ...)
+    :return: (N, H, W) frames
+    """
+    if workers == 1 or len(params) <= chunk:
+        return _render_chunk(renderer, kind, params, kwargs)
+    import itertools
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import shared_memory
+    out = kwargs.pop("out", None)
+    dtype = np.dtype(kwargs.pop("dtype", np.float32) if out is None else out.dtype)
+    shape = (len(params),) + renderer.shape
+    # build the remap table once, the workers memory-map it
+    renderer.table
+    block = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * dtype.itemsize)
+    try:
+        starts = range(0, len(params), chunk)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(_render_chunk, itertools.repeat(renderer), itertools.repeat(kind),
+                          [params[start:start + chunk] for start in starts], itertools.repeat(kwargs),
+                          [(block.name, shape, dtype.str, start) for start in starts]))
+        frames = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        if out is None:
+            out = frames.copy()
+        else:
+            out[:] = frames
+        del frames
+    finally:
+        block.close()
+        block.unlink()
+    return out
+
+
+class Backend:
+    """
+    Renders the scene of a scene_builder.SceneBuilder in place of bpy.ops.render.render: the camera, sun,
+    world color, Lensdist parameter and the visible object (shot or plate) are read from the builder, the
+    frames are written where Blender would write them.
+
+    :param builder: scene_builder.SceneBuilder
+    :param samples: samples per pixel along each axis
+    :param workers: render processes, 1 to render in process
+    """
+    name = "numpy"
+
+    def __init__(self, builder, samples=2, workers=1):
+        self.builder = builder
+        self.samples = samples
+        self.workers = workers
+
+    @property
+    def scene(self):
+        return self.builder.scene
+
+    def describe(self):
+        """:return: what the renders depend on besides the scene, for the render cache"""
+        return [self.name, self.samples]
+
+    def renderer(self):
+        """:return: SoftRenderer of the current scene"""
+        builder = self.builder
+        render = self.scene.render
+        scale = getattr(render, "resolution_percentage", 100) / 100.
+        cam_obj = builder.objects["camera"]
+        matrix = np.array(cam_obj.matrix_world, dtype=float)
+        dist_param = builder.state.get("lens_dist", {}).get("dist_param", 0.)
+        cam = projection.Camera(matrix[:3, 3], matrix[:3, :3], int(render.resolution_x * scale),
+                                int(render.resolution_y * scale), cam_obj.data.lens, cam_obj.data.sensor_width,
+                                dist_param)
+        sun, strength = (0., 0., 1.), 0.
+        if self._visible("sun"):
+            sun_obj = builder.objects["sun"]
+            # the sun shines along its -Z axis
+            sun = np.array(sun_obj.matrix_world, dtype=float)[:3, 2]
+            strength = getattr(sun_obj.data, "energy", 1.)
+        world = getattr(self.scene, "world", None)
+        ambient = float(LUMA @ np.asarray(world.color)[:3]) if world is not None else 0.05
+        return SoftRenderer(cam, sun, strength, ambient, self.samples)
+
+    def _visible(self, role):
+        return role in self.builder.objects and not self.builder.objects[role].hide_render
+
+    @instrument.spanned()
+    def frames(self, numbers, dtype=np.float32):
+        """
+        :param numbers: frame numbers
+        :param dtype: float32 frames in [0, 1] or uint8
+        :return: (N, H, W) frames
+        """
+        shot, plate = self._visible("shot"), self._visible("plate")
+        if shot and plate:
+            raise ValueError("the NumPy backend renders scenes holding the shot or the plate, not both")
+        renderer = self.renderer()
+        if shot:
+            centers, radius, albedo = self.shot(numbers)
+            return render_parallel(renderer, "shot", centers, self.workers, radius=radius, albedo=albedo, dtype=dtype)
+        if plate:
+            obj = self.builder.objects["plate"]
+            matrices = np.repeat(np.array(obj.matrix_world, dtype=float)[None], len(numbers), axis=0)
+            return render_parallel(renderer, "plates", matrices, self.workers, texture=self._texture(obj),
+                                   dtype=dtype)
+        return np.repeat(srgb(renderer.background)[None].astype(dtype), len(numbers), axis=0)
+
+    def shot(self, numbers):
+        """
+        :param numbers: frame numbers
+        :return: (N, 3) shot centers evaluated from its animation, radius and albedo
+        """
+        obj = self.builder.objects["shot"]
+        centers = np.empty((len(numbers), 3))
+        for i, number in enumerate(numbers):
+            self.scene.frame_set(int(number))
+            centers[i] = tuple(obj.location)
+        return centers, float(obj.scale[0]), float(LUMA @ np.asarray(obj.data.materials[0].diffuse_color)[:3])
+
+    def _texture(self, plate):
+        from . import sphere_tracker
+        node = plate.data.materials[0].node_tree.nodes.get("Image Texture")
+        path = None if node is None or node.image is None else self.builder.bpy.path.abspath(node.image.filepath)
+        if path is None or not os.path.isfile(path):
+            return chessboard()
+        return linear(next(sphere_tracker.read_frames([path])))
+
+    def _write(self, path, frame):
+        from . import sphere_tracker
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        sphere_tracker.write_frame(path, frame)
+
+    def render_still(self):
+        """bpy.ops.render.render(write_still=True)"""
+        render = self.scene.render
+        path = self.builder.bpy.path.abspath(render.filepath)
+        if not path.lower().endswith(render.file_extension):
+            path += render.file_extension
+        self._write(path, self.frames([self.scene.frame_current])[0])
+
+    def render_animation(self):
+        """bpy.ops.render.render(animation=True)"""
+        scene = self.scene
+        numbers = range(scene.frame_start, scene.frame_end + 1, getattr(scene, "frame_step", 1))
+        for number, frame in zip(numbers, self.frames(numbers)):
+            self._write(self.builder.bpy.path.abspath(scene.render.frame_path(frame=number)), frame)
+
+
+def backend(name, builder, **kwargs):
+    """
+    :param name: 'blender' or 'numpy' (--render_backend)
+    :param builder: scene_builder.SceneBuilder
+    :return: Backend, None for Blender
+    """
+    return Backend(builder, **kwargs) if name == "numpy" else None
+
+
+def benchmark(num_frames=2000, res=500, dist_param=0.05, workers=None):
+    """
+    Shot and plate frames per second, in process and over a process pool, and the difference of the box
+    rendering to whole frames ray cast then distorted
+
+    :param num_frames: number of frames per scene
+    :param res: image resolution
+    :param dist_param: Lensdist distortion parameter
+    :param workers: pool processes, all cores by default
+    :return:
+    """
+    cam = projection.Camera.from_euler((0., -5., 0.), (np.pi / 2, 0., 0.), res, res, dist_param=dist_param)
+    renderer = SoftRenderer(cam, sun=(0., -1., 1.))
+    t = np.arange(num_frames) / 240.
+    centers = np.column_stack((-1. + 2. * t / t[-1], 0.3 * np.sin(t), 0.3 * np.cos(t)))
+    angles = 0.5 * np.sin(np.linspace(0., 6., num_frames))
+    matrices = np.tile(np.diag([2., 2., 0.1, 1.]), (num_frames, 1, 1))
+    matrices[:, :3, :3] = np.einsum("ij,njk,kl->nil", projection.rot_x(np.pi / 2),
+                                    np.array([projection.rot_y(angle) for angle in angles]), np.diag([2., 2., 0.1]))
+    renderer.table
+    for kind, params in (("shot", centers), ("plates", matrices)):
+        start = time.perf_counter()
+        single = render_parallel(renderer, kind, params[:num_frames // 10], 1)
+        single_time = (time.perf_counter() - start) / len(single)
+        start = time.perf_counter()
+        frames = render_parallel(renderer, kind, params, workers)
+        pool_time = (time.perf_counter() - start) / len(frames)
+        err = 0.
+        full = (0, 0, res, res)
+        for i in range(0, num_frames, max(num_frames // 5, 1)):
+            if kind == "shot":
+                raw = renderer.trace_shot(params[i], 0.1, 0.5, full)
+            else:
+                raw = renderer.trace_plate(params[i], chessboard(), 0.8, full)
+            err = max(err, np.abs(srgb(lens_remap.distort(raw, dist_param)) - frames[i]).max())
+        print("%-6s %dx%d: %7.0f frames/s in process, %7.0f frames/s with %d processes, "
+              "max difference to whole frames %.1e"
+              % (kind, res, res, 1. / single_time, 1. / pool_time, workers or os.cpu_count(), err))
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
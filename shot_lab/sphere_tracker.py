@@ -0,0 +1,261 @@
+"""
+Streaming tracker of the shot sphere in the rendered camLeft_/camTop_ frame sequences: the sphere is thresholded
+against the dark background and located by its intensity-weighted centroid (or a circle fit of its edge) to
+sub-pixel accuracy. Once found, only a window around the position predicted from the previous frames is searched,
+so the cost per frame does not grow with the image size. Frames are read one at a time.
+"""
+import argparse
+import glob
+import sys
+import time
+import numpy as np
+
+
+def frame_paths(prefix, ext=".jpg"):
+    """
+    :param prefix: output path given to make_anim, e.g. '.../camLeft/camLeft_'
+    :param ext: image extension
+    :return: sorted frame paths
+    """
+    return sorted(glob.glob(prefix + "[0-9]*" + ext))
+
+
+def read_frames(paths):
+    """
+    Lazily read grayscale frames (needs imageio or Pillow)
+
+    :param paths: image paths
+    :return: generator of 2D float32 arrays in [0, 1]
+    """
+    try:
+        import imageio.v3 as iio
+
+        def read(path):
+            return iio.imread(path)
+    except ImportError:
+        try:
+            from PIL import Image
+        except ImportError:
+            raise ImportError("reading frames needs imageio or Pillow")
+
+        def read(path):
+            with Image.open(path) as img:
+                return np.asarray(img.convert("L"))
+    for path in paths:
+        img = np.asarray(read(path))
+        if img.ndim == 3:
+            img = img[..., :3].mean(axis=2)
+        yield img.astype(np.float32) / (255. if img.dtype == np.uint8 else 1.)
+
+
+def write_frame(path, img):
+    """
+    Write a [0, 1] grayscale frame (needs imageio or Pillow)
+
+    :param path: image path, the format follows the extension
+    :param img: 2D float array
+    :return:
+    """
+    img = (np.clip(img, 0., 1.) * 255. + 0.5).astype(np.uint8)
+    try:
+        import imageio.v3 as iio
+        iio.imwrite(path, img)
+    except ImportError:
+        try:
+            from PIL import Image
+        except ImportError:
+            raise ImportError("writing frames needs imageio or Pillow")
+        Image.fromarray(img).save(path)
+
+
+def fit_circle(xs, ys):
+    """
+    Algebraic (Kasa) least squares circle fit
+
+    :param xs, ys: point coordinates
+    :return: center x, center y, radius
+    """
+    A = np.column_stack((xs, ys, np.ones(len(xs))))
+    b = xs**2 + ys**2
+    (a0, a1, a2), _, _, _ = np.linalg.lstsq(A, b, rcond=None)
+    cx, cy = a0 / 2., a1 / 2.
+    return cx, cy, np.sqrt(max(a2 + cx**2 + cy**2, 0.))
+
+
+def locate(img, threshold, method="centroid"):
+    """
+    Sub-pixel position of the bright blob of an image (or image window)
+
+    :param img: 2D array
+    :param threshold: intensity separating the sphere from the background
+    :param method: 'centroid' (intensity weighted) or 'circle' (fit of the blob edge)
+    :return: (x, y, radius) in pixel coordinates of img (pixel centers at half integers), None if not found
+    """
+    weight = img - threshold
+    mask = weight > 0
+    count = np.count_nonzero(mask)
+    if count == 0:
+        return None
+    rows, cols = np.nonzero(mask)
+    if method == "circle" and count >= 12:
+        # edge pixels: inside pixels with at least one outside 4-neighbour
+        padded = np.pad(mask, 1)
+        inner = padded[:-2, 1:-1] & padded[2:, 1:-1] & padded[1:-1, :-2] & padded[1:-1, 2:]
+        edge = mask & ~inner
+        ey, ex = np.nonzero(edge)
+        if len(ex) >= 6:
+            cx, cy, r = fit_circle(ex + 0.5, ey + 0.5)
+            return cx, cy, r
+    w = weight[rows, cols]
+    total = w.sum()
+    return (cols @ w) / total + 0.5, (rows @ w) / total + 0.5, np.sqrt(count / np.pi)
+
+
+def _coarse_search(img, threshold, block):
+    """Block of the image holding the most above-threshold signal, as a (x, y) pixel position"""
+    h, w = (img.shape[0] // block) * block, (img.shape[1] // block) * block
+    signal = np.clip(img[:h, :w] - threshold, 0., None)
+    sums = signal.reshape(h // block, block, w // block, block).sum(axis=(1, 3))
+    if sums.max() <= 0.:
+        return None
+    by, bx = np.unravel_index(np.argmax(sums), sums.shape)
+    return (bx + 0.5) * block, (by + 0.5) * block
+
+
+def track(frames, threshold=None, method="centroid", margin=3., block=16):
+    """
+    Track the sphere along a frame sequence
+
+    :param frames: iterable of 2D arrays (e.g. read_frames(frame_paths(prefix)))
+    :param threshold: sphere/background threshold, estimated on the first frame if None
+    :param method: 'centroid' or 'circle'
+    :param margin: window half size in sphere radii around the predicted position
+    :param block: block size of the full frame search
+    :return: generator of (x, y, radius) per frame, NaN when the sphere is not found
+    """
+    prev = None
+    velocity = np.zeros(2)
+    for img in frames:
+        if threshold is None:
+            threshold = 0.5 * (float(np.median(img)) + float(img.max()))
+        found = None
+        if prev is not None:
+            # search window centered on the constant velocity prediction
+            cx, cy = prev[0] + velocity[0], prev[1] + velocity[1]
+            half = int(np.ceil(margin * max(prev[2], 2.)))
+            x0, y0 = max(int(cx) - half, 0), max(int(cy) - half, 0)
+            x1, y1 = min(int(cx) + half + 1, img.shape[1]), min(int(cy) + half + 1, img.shape[0])
+            if x1 > x0 and y1 > y0:
+                window = img[y0:y1, x0:x1]
+                res = locate(window, threshold, method)
+                if res is not None:
+                    x, y, r = res
+                    # blob cut by the window border: fall back to the full frame search
+                    touching = ((window[0] > threshold).any() or (window[-1] > threshold).any()
+                                or (window[:, 0] > threshold).any() or (window[:, -1] > threshold).any())
+                    if not touching or (x0 == 0 or y0 == 0 or x1 == img.shape[1] or y1 == img.shape[0]):
+                        found = (x + x0, y + y0, r)
+        if found is None:
+            seed = _coarse_search(img, threshold, block)
+            if seed is not None:
+                half = 4 * block
+                x0, y0 = max(int(seed[0]) - half, 0), max(int(seed[1]) - half, 0)
+                res = locate(img[y0:y0 + 2 * half, x0:x0 + 2 * half], threshold, method)
+                if res is not None:
+                    found = (res[0] + x0, res[1] + y0, res[2])
+        if found is None:
+            prev = None
+            velocity[:] = 0.
+            yield (np.nan, np.nan, np.nan)
+            continue
+        if prev is not None:
+            velocity = np.array([found[0] - prev[0], found[1] - prev[1]])
+        prev = found
+        yield found
+
+
+def track_sequence(prefix, ext=".jpg", **kwargs):
+    """
+    Track a rendered sequence
+
+    :param prefix: output path given to make_anim, or a frame stack file (.npy, .h5) written by make_anim
+    :param ext: image extension
+    :return: (N, 3) array of (x, y, radius)
+    """
+    from . import frame_stack
+    if prefix.endswith(tuple(frame_stack.EXTS.values())):
+        with frame_stack.open_stack(prefix) as stack:
+            return np.array(list(track((stack[i].astype(np.float32) / 255. for i in range(len(stack))), **kwargs)))
+    return np.array(list(track(read_frames(frame_paths(prefix, ext)), **kwargs)))
+
+
+def synthetic_frames(centers, radius, resx, resy, background=0.05, level=0.8, noise=0.01, seed=0):
+    """
+    Frames of an anti-aliased disk over a noisy background, made without Blender
+
+    :param centers: (N, 2) disk centers in pixels
+    :param radius: disk radius in pixels
+    :param resx, resy: image resolution
+    :return: generator of 2D float32 arrays
+    """
+    rng = np.random.default_rng(seed)
+    base = (background + noise * rng.standard_normal((resy, resx))).astype(np.float32)
+    for cx, cy in centers:
+        img = base.copy()
+        x0, y0 = max(int(cx - radius - 2), 0), max(int(cy - radius - 2), 0)
+        x1, y1 = min(int(cx + radius + 3), resx), min(int(cy + radius + 3), resy)
+        if x1 > x0 and y1 > y0:
+            yy, xx = np.mgrid[y0:y1, x0:x1] + 0.5
+            coverage = np.clip(radius + 0.5 - np.hypot(xx - cx, yy - cy), 0., 1.)
+            img[y0:y1, x0:x1] += (level - background) * coverage
+        yield img
+
+
+def benchmark(num=500):
+    """
+    Tracking speed and accuracy on synthetic sequences of growing image size, same sphere size in pixels
+
+    :param num: number of frames per sequence
+    :return:
+    """
+    for res in (500, 1000, 2000):
+        t = np.linspace(0., 1., num)
+        centers = np.column_stack((0.1 * res + 0.8 * res * t, 0.5 * res + 0.2 * res * np.sin(2 * np.pi * t)))
+        radius = 6.
+        for method in ("centroid", "circle"):
+            # frames are generated lazily (constant memory), their generation time is not counted
+            gen_time = [0.]
+
+            def frames():
+                gen = synthetic_frames(centers, radius, res, res)
+                while True:
+                    start = time.perf_counter()
+                    img = next(gen, None)
+                    gen_time[0] += time.perf_counter() - start
+                    if img is None:
+                        return
+                    yield img
+            start = time.perf_counter()
+            found = np.array(list(track(frames(), method=method)))
+            duration = time.perf_counter() - start - gen_time[0]
+            err = np.hypot(found[:, 0] - centers[:, 0], found[:, 1] - centers[:, 1])
+            print("%4dx%-4d %-8s %7.0f frames/s, mean error %.3f px, max %.3f px"
+                  % (res, res, method, num / duration, np.nanmean(err), np.nanmax(err)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="track", description="Track the sphere in a rendered frame sequence")
+    parser.add_argument("prefix", nargs="?", default=None,
+                        help="output path given to make_anim or frame stack file, the benchmark runs without it")
+    parser.add_argument("--ext", default=".jpg")
+    parser.add_argument("--method", default="centroid", choices=("centroid", "circle"))
+    args = parser.parse_args(argv)
+    if args.prefix is None:
+        benchmark()
+    else:
+        np.savetxt(sys.stdout, track_sequence(args.prefix, args.ext, method=args.method), fmt="%.4f")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
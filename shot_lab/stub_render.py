@@ -0,0 +1,39 @@
+"""
+Stand-in for the Blender executable, to exercise render_farm.py without Blender:
+writes empty files under the names the real worker would render.
+
+    shot-lab farm anim --out /tmp/farm --renderer "python -m shot_lab.stub_render"
+
+STUB_FAIL_RATE (0 to 1) makes a random fraction of the runs fail, to exercise the retries.
+"""
+import os
+import random
+import sys
+import time
+from . import render_farm
+
+
+def main(argv):
+    shard = render_farm.shard_from_argv(argv)
+    if shard is None:
+        print("stub_render: no --shard given")
+        return 2
+    if random.random() < float(os.environ.get("STUB_FAIL_RATE", "0")):
+        print("stub_render: simulated failure of shard %s" % shard["id"])
+        return 1
+    if shard["kind"] == "anim":
+        names = [shard["prefix"] + "%04d.jpg" % frame for frame in range(shard["frames"][0], shard["frames"][1] + 1)]
+    elif shard["kind"] == "sample":
+        names = [name + ".png" for name in shard["names"]]
+    else:
+        names = [shard["prefix"] + "%d.png" % pose for pose in shard["poses"]]
+    for name in names:
+        path = os.path.join(shard["out_dir"], name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        time.sleep(float(os.environ.get("STUB_RENDER_TIME", "0.01")))
+        open(path, "wb").close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
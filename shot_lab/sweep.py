@@ -0,0 +1,302 @@
+"""
+Parameter sweep runner: expands a declarative sweep (full grid or random search) into configurations, renders
+each distinct scene once with concurrent headless Blender workers (make_calib_pic.py, make_shot_video.py or
+make_sample_pic.py, given the configuration after '--' as --config), analyses it and appends a row per
+configuration to a results table.
+
+Configurations that only differ by analysis parameters share their render, and renders already completed by a
+previous run of the same sweep are reused, so an interrupted overnight sweep can simply be started again.
+
+Sweep file (JSON, or YAML when PyYAML is installed):
+
+    {"job": "calib",
+     "mode": "grid",
+     "base": {"num_poses": 20, "pose_set": "sobol"},
+     "params": {"dist_param": [0., 0.02, 0.05, 0.1], "resx": [500, 1000], "inner": [[6, 6]]}}
+
+    mode 'random' draws "samples" configurations (seed "seed"), a parameter being a list of choices or
+    {"uniform": [lo, hi]}, {"loguniform": [lo, hi]}, {"int": [lo, hi]}; resy follows resx unless given.
+
+    shot-lab sweep sweep.json --out sweeps/dist --workers 4 --renderer blender
+"""
+import argparse
+import csv
+import hashlib
+import itertools
+import json
+import os
+import sys
+import time
+import numpy as np
+from . import render_farm
+from . import render_profiles
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# script, default values of the script settings (all of them change the render) and analysis only settings
+JOBS = {
+    "calib": {"script": "make_calib_pic.py",
+              "defaults": {"L": 2., "h": 0.1, "resx": 500, "resy": 500, "dist_param": 0., "cam_pos": [0., 0., 5.],
+                           "pose_set": "legacy", "num_poses": 20, "render_profile": render_profiles.DEFAULT,
+                           "render_backend": "blender"},
+              "analysis": {"inner": [6, 6], "calib_iterations": 20}},
+    "anim": {"script": "make_shot_video.py",
+             "defaults": {"num_frames": 50, "traj_kind": "line", "traj_path": None, "key_tolerance": None,
+                          "fps": None, "exposure": 0., "blur_samples": 1, "roi": False, "roi_margin": 2,
+                          "dist_param": 0., "resx": 500, "resy": 500, "render_profile": render_profiles.DEFAULT,
+                          "render_backend": "blender", "output": "jpeg", "cameras": {}},
+             "analysis": {}},
+    "sample": {"script": "make_sample_pic.py",
+               "defaults": {"cam_pos": [0., 0., 5.], "tilt": 0., "resx": 500, "resy": 500,
+                            "render_profile": render_profiles.DEFAULT, "render_backend": "blender"},
+               "analysis": {}},
+}
+METRICS = {"calib": ["images", "rms_px", "focal_rel", "center_px", "dist_param_est", "dist_param_err"],
+           "anim": [], "sample": []}
+
+
+def load_sweep(path):
+    """
+    :param path: .json, .yaml or .yml sweep file
+    :return: sweep dict
+    """
+    with open(path) as f:
+        if path.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("YAML sweep files need PyYAML, use JSON instead")
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def _draw(spec, rng):
+    if isinstance(spec, dict):
+        (law, (lo, hi)), = spec.items()
+        if law == "uniform":
+            return float(rng.uniform(lo, hi))
+        if law == "loguniform":
+            return float(np.exp(rng.uniform(np.log(lo), np.log(hi))))
+        if law == "int":
+            return int(rng.integers(lo, hi + 1))
+        raise ValueError("unknown sampling law '%s'" % law)
+    if isinstance(spec, list):
+        return spec[rng.integers(len(spec))]
+    return spec
+
+
+def expand(sweep):
+    """
+    Configurations of a sweep, completed with the job defaults, duplicates removed
+
+    :param sweep: sweep dict
+    :return: list of configuration dicts
+    """
+    job = JOBS[sweep["job"]]
+    params = sweep.get("params", {})
+    if sweep.get("mode", "grid") == "grid":
+        names = list(params)
+        values = [spec if isinstance(spec, list) else [spec] for spec in params.values()]
+        points = [dict(zip(names, combo)) for combo in itertools.product(*values)]
+    elif sweep["mode"] == "random":
+        rng = np.random.default_rng(sweep.get("seed", 0))
+        points = [{name: _draw(spec, rng) for name, spec in params.items()} for _ in range(sweep["samples"])]
+    else:
+        raise ValueError("unknown sweep mode '%s'" % sweep["mode"])
+    configs, seen = [], set()
+    for point in points:
+        config = dict(job["defaults"], **job["analysis"])
+        config.update(sweep.get("base", {}))
+        config.update(point)
+        if "resx" in point and "resy" not in point and "resy" not in sweep.get("base", {}):
+            config["resy"] = config["resx"]
+        unknown = set(config) - set(job["defaults"]) - set(job["analysis"])
+        if unknown:
+            raise ValueError("unknown %s settings: %s" % (sweep["job"], ", ".join(sorted(unknown))))
+        key = json.dumps(config, sort_keys=True)
+        if key not in seen:
+            seen.add(key)
+            configs.append(config)
+    return configs
+
+
+def render_config(job, config):
+    """
+    :return: the part of a configuration that changes the render
+    """
+    return {name: config[name] for name in JOBS[job]["defaults"]}
+
+
+def render_key(job, config):
+    """
+    :return: digest of the render configuration, the name of the render directory
+    """
+    desc = json.dumps({"job": job, "config": render_config(job, config)}, sort_keys=True)
+    return hashlib.sha256(desc.encode()).hexdigest()[:16]
+
+
+def job_shards(job, config, shard_size=None):
+    """
+    Render shards of a configuration
+
+    :param shard_size: frames or poses per shard, a single shard per camera by default
+    :return: list of shard dicts
+    """
+    if job == "calib":
+        return render_farm.calib_shards(config["num_poses"], shard_size or config["num_poses"])
+    if job == "anim":
+        from . import shot_video
+        from . import trajectories
+        cameras = tuple(sorted(set(render_farm.CAMERAS) | set(config["cameras"])))
+        # the camera frames make_anim renders, which follow the trajectory file span and fps when given
+        traj_t, _, fps = shot_video.shot_trajectory(config["num_frames"], config["traj_kind"], config["traj_path"],
+                                                    config["fps"])
+        frames, _ = trajectories.frame_times(traj_t[0], traj_t[-1], fps)
+        return render_farm.anim_shards(int(frames[0]), int(frames[-1]), shard_size or len(frames), cameras)
+    return render_farm.sample_shards()
+
+
+def analyse(job, config, render_dir):
+    """
+    Measurements made on a finished render
+
+    :return: dict of METRICS[job] values
+    """
+    if job != "calib":
+        return {}
+    from . import calib_poses
+    from . import calibration
+    from . import projection
+    inner = tuple(config["inner"])
+    res = calibration.calibrate_dir(render_dir, inner, calib_poses.square_size(config["L"], inner), processes=1,
+                                    iterations=config["calib_iterations"])
+    cam = projection.Camera.look_at(config["cam_pos"], (0., 0., 0.), config["resx"], config["resy"],
+                                    dist_param=config["dist_param"])
+    err = calibration.compare(res, cam)
+    return {"images": int(res["used"].sum()), "rms_px": res["rms"], "focal_rel": err["focal_rel"],
+            "center_px": err["center_px"], "dist_param_est": res["dist_param"], "dist_param_err": err["dist_param"]}
+
+
+def _cell(value):
+    if isinstance(value, (list, dict, tuple)) or value is None:
+        return json.dumps(value)
+    if isinstance(value, float):
+        return "%.6g" % value
+    return value
+
+
+def run_sweep(sweep, out_dir, executable, workers=2, threads=1, retries=1, timeout=None, shard_size=None):
+    """
+    Render and analyse every configuration of a sweep
+
+    :param sweep: sweep dict
+    :param out_dir: sweep directory: renders/<render key>/ and results.csv
+    :param executable: renderer command prefix
+    :param workers: number of concurrent render workers
+    :param threads: render threads per worker
+    :param retries: number of retries of a failed shard
+    :param timeout: worker timeout (s)
+    :param shard_size: frames or poses per shard
+    :return: list of result rows
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    job = sweep["job"]
+    configs = expand(sweep)
+    script = os.path.join(ROOT, JOBS[job]["script"])
+    renders = {}
+    for config in configs:
+        renders.setdefault(render_key(job, config), []).append(config)
+    print("%d configurations, %d distinct renders" % (len(configs), len(renders)))
+    columns = (["config"] + sorted(configs[0]) + ["render_key", "shared", "status", "render_s"] + METRICS[job]
+               + ["error"])
+    os.makedirs(out_dir, exist_ok=True)
+    rows = []
+    with open(os.path.join(out_dir, "results.csv"), "w", newline="") as f, \
+            ThreadPoolExecutor(max_workers=workers) as pool:
+        writer = csv.DictWriter(f, columns, restval="")
+        writer.writeheader()
+        pending, results, futures = {}, {}, {}
+        for key, group in renders.items():
+            render_dir = os.path.join(out_dir, "renders", key)
+            done = os.path.join(render_dir, "render.json")
+            if os.path.isfile(done):
+                with open(done) as d:
+                    results[key] = dict(json.load(d)["result"], reused=True)
+                continue
+            results[key] = {"status": "ok", "render_s": 0., "reused": False}
+            shards = job_shards(job, group[0], shard_size)
+            pending[key] = len(shards)
+            for shard in shards:
+                futures[pool.submit(render_farm.run_shard, shard, executable, script, render_dir, threads,
+                                    retries, timeout, render_config(job, group[0]))] = key
+
+        def finish(key):
+            render_dir = os.path.join(out_dir, "renders", key)
+            result = results[key]
+            if not result["reused"] and result["status"] == "ok":
+                with open(os.path.join(render_dir, "render.json"), "w") as d:
+                    json.dump({"job": job, "config": render_config(job, renders[key][0]),
+                               "result": {"status": "ok", "render_s": result["render_s"]}}, d)
+            for i, config in enumerate(renders[key]):
+                row = {"config": len(rows), "render_key": key, "shared": result["reused"] or i > 0,
+                       "status": result["status"], "render_s": result["render_s"] if i == 0 else 0.,
+                       "error": result.get("error", "")}
+                row.update(config)
+                if result["status"] == "ok":
+                    try:
+                        row.update(analyse(job, config, render_dir))
+                    except Exception as exc:
+                        row.update(status="analysis failed", error=repr(exc))
+                rows.append(row)
+                writer.writerow({name: _cell(value) for name, value in row.items()})
+                f.flush()
+
+        for key in renders:
+            if key not in pending:
+                finish(key)
+        # configurations are analysed as soon as their render is complete, while the other renders go on
+        for future in as_completed(futures):
+            key = futures[future]
+            shard = future.result()
+            result = results[key]
+            result["render_s"] += shard["duration"]
+            if shard["status"] != "ok":
+                result.update(status="render failed", error=shard["error"][-500:])
+            pending[key] -= 1
+            if pending[key] == 0:
+                finish(key)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a parameter sweep of the calibration, animation or sample renders")
+    parser.add_argument("sweep", help="JSON or YAML sweep file")
+    parser.add_argument("--out", default=None, help="sweep directory, next to the sweep file by default")
+    parser.add_argument("--renderer", default="blender", help="renderer command, e.g. 'python -m shot_lab.stub_render'")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--threads", type=int, default=1, help="render threads per worker")
+    parser.add_argument("--retries", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=None)
+    parser.add_argument("--shard-size", type=int, default=None)
+    parser.add_argument("--dry-run", action="store_true", help="only list the configurations")
+    args = parser.parse_args(argv)
+    sweep = load_sweep(args.sweep)
+    if args.dry_run:
+        configs = expand(sweep)
+        for config in configs:
+            print(render_key(sweep["job"], config), json.dumps(config, sort_keys=True))
+        print("%d configurations, %d distinct renders"
+              % (len(configs), len(set(render_key(sweep["job"], config) for config in configs))))
+        return 0
+    out_dir = args.out or os.path.splitext(os.path.abspath(args.sweep))[0]
+    start = time.perf_counter()
+    rows = run_sweep(sweep, out_dir, args.renderer.split(), args.workers, args.threads, args.retries, args.timeout,
+                     args.shard_size)
+    failed = [row for row in rows if row["status"] != "ok"]
+    print("%d configurations, %d failed, %.1f s, results in %s"
+          % (len(rows), len(failed), time.perf_counter() - start, os.path.join(out_dir, "results.csv")))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+"""
+Compact binary trajectory container, opened through np.memmap without copying.
+
+Layout (little endian):
+    header (64 bytes): magic, version, xyz dtype, number of rows, frame rate, valid row range, valid time range
+    t block: n float64, sorted, used as the time index
+    xyz block: (n, 3) float32 or float64 positions
+"""
+import argparse
+import os
+import struct
+import sys
+import numpy as np
+from . import traj_io
+
+EXT = ".trj"
+MAGIC = b"SHOTTRJ\0"
+VERSION = 1
+HEADER = struct.Struct("<8sII QdQQdd")
+HEADER_SIZE = 64
+DTYPES = {0: np.dtype("<f4"), 1: np.dtype("<f8")}
+
+
+class TrajFile:
+    """
+    Memory-mapped view of a binary trajectory file
+
+    :param file_path: .trj file path
+    :param mode: np.memmap mode, 'r' (read only) or 'r+'
+    """
+    def __init__(self, file_path, mode="r"):
+        with open(file_path, "rb") as file:
+            raw = file.read(HEADER.size)
+        if len(raw) < HEADER.size:
+            raise ValueError("%s: truncated trajectory header" % file_path)
+        magic, version, dtype_code, n_rows, frame_rate, valid_start, valid_stop, t_start, t_end = HEADER.unpack(raw)
+        if magic != MAGIC:
+            raise ValueError("%s: not a binary trajectory file" % file_path)
+        if version != VERSION:
+            raise ValueError("%s: unsupported trajectory version %d" % (file_path, version))
+        self.file_path = file_path
+        self.frame_rate = frame_rate
+        self.valid_start = valid_start
+        self.valid_stop = valid_stop
+        self.t_start = t_start
+        self.t_end = t_end
+        self._tracked = None
+        if n_rows == 0:
+            self.t = np.zeros(0)
+            self.xyz = np.zeros((0, 3), DTYPES[dtype_code])
+            return
+        self.t = np.memmap(file_path, dtype="<f8", mode=mode, offset=HEADER_SIZE, shape=(n_rows,))
+        self.xyz = np.memmap(file_path, dtype=DTYPES[dtype_code], mode=mode,
+                             offset=HEADER_SIZE + 8 * n_rows, shape=(n_rows, 3))
+
+    def __len__(self):
+        return len(self.t)
+
+    def tracked(self):
+        """
+        :return: (valid_stop - valid_start,) mask of the rows of the valid range holding a tracked position,
+            computed once on first use
+        """
+        if self._tracked is None:
+            self._tracked = np.isfinite(self.xyz[self.valid_start:self.valid_stop]).all(axis=1)
+        return self._tracked
+
+    def valid(self):
+        """
+        Tracked rows: the rows between the first and the last tracked positions, without the untracked (NaN) rows
+        of the tracking gaps in between
+
+        :return: (t, xyz) memmap views, or copies of the tracked rows when the range holds gaps
+        """
+        t, xyz = self.t[self.valid_start:self.valid_stop], self.xyz[self.valid_start:self.valid_stop]
+        tracked = self.tracked()
+        if tracked.all():
+            return t, xyz
+        return t[tracked], xyz[tracked]
+
+    def window(self, t0, t1):
+        """
+        Slice the rows with t0 <= t < t1 using a binary search on the time index
+
+        :param t0, t1: time window bounds
+        :return: (t, xyz) memmap views
+        """
+        start, stop = np.searchsorted(self.t, (t0, t1))
+        return self.t[start:stop], self.xyz[start:stop]
+
+
+def open_traj_bin(file_path, mode="r"):
+    """
+    Open a binary trajectory file
+
+    :param file_path: .trj file path
+    :param mode: np.memmap mode
+    :return: TrajFile
+    """
+    return TrajFile(file_path, mode)
+
+
+def _write_header(file, dtype_code, n_rows, frame_rate, valid_start, valid_stop, t_start, t_end):
+    file.seek(0)
+    file.write(HEADER.pack(MAGIC, VERSION, dtype_code, n_rows, frame_rate, valid_start, valid_stop, t_start, t_end)
+               .ljust(HEADER_SIZE, b"\0"))
+
+
+def convert_txt(txt_path, bin_path, frame_rate=None, dtype=np.float32, chunk_bytes=1 << 24):
+    """
+    Convert a (t, X, Y, Z) column text file to the binary format, streaming by chunks.
+    Untracked (NaN) rows are kept so that the time grid stays regular, the header records the tracked range.
+
+    :param txt_path: text trajectory path
+    :param bin_path: output .trj path
+    :param frame_rate: sampling rate (Hz), estimated from the time column if None
+    :param dtype: position dtype, float32 (Blender location precision) or float64
+    :param chunk_bytes: approximate number of bytes parsed at once
+    :return: TrajFile opened on the output
+    """
+    dtype = np.dtype(dtype).newbyteorder("<")
+    dtype_code = [code for code, dt in DTYPES.items() if dt == dtype]
+    if not dtype_code:
+        raise ValueError("unsupported position dtype %s" % dtype)
+    xyz_path = bin_path + ".xyz.tmp"
+    n_rows = 0
+    valid_start = valid_stop = 0
+    t_start = t_end = np.nan
+    t_last = -np.inf
+    dt = None
+    try:
+        with open(bin_path, "wb") as out, open(xyz_path, "wb") as xyz_out:
+            out.write(b"\0" * HEADER_SIZE)
+            for chunk in traj_io.iter_traj_chunks(txt_path, chunk_bytes, drop_nan=False):
+                t = chunk[:, 0]
+                if t[0] < t_last or np.any(np.diff(t) < 0):
+                    raise ValueError("%s: time column is not sorted" % txt_path)
+                if dt is None and len(t) > 1:
+                    dt = np.median(np.diff(t))
+                tracked = np.flatnonzero(~np.isnan(chunk[:, 1:]).any(axis=1))
+                if len(tracked):
+                    if np.isnan(t_start):
+                        valid_start = n_rows + tracked[0]
+                        t_start = t[tracked[0]]
+                    valid_stop = n_rows + tracked[-1] + 1
+                    t_end = t[tracked[-1]]
+                out.write(np.ascontiguousarray(t, "<f8").tobytes())
+                xyz_out.write(np.ascontiguousarray(chunk[:, 1:], dtype).tobytes())
+                n_rows += len(chunk)
+                t_last = t[-1]
+        if frame_rate is None:
+            frame_rate = 1. / dt if dt else 0.
+        with open(bin_path, "r+b") as out, open(xyz_path, "rb") as xyz_in:
+            out.seek(0, os.SEEK_END)
+            while True:
+                block = xyz_in.read(chunk_bytes)
+                if not block:
+                    break
+                out.write(block)
+            _write_header(out, dtype_code[0], n_rows, frame_rate, valid_start, valid_stop, t_start, t_end)
+    finally:
+        if os.path.exists(xyz_path):
+            os.remove(xyz_path)
+    return open_traj_bin(bin_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="traj-convert", description="Convert a Trajectory.txt file to the binary format")
+    parser.add_argument("txt_path")
+    parser.add_argument("bin_path")
+    parser.add_argument("frame_rate", type=float, nargs="?", default=None)
+    args = parser.parse_args(argv)
+    traj = convert_txt(args.txt_path, args.bin_path, args.frame_rate)
+    print("%d rows at %.1f Hz, tracked rows [%d, %d), %.1f MB -> %.1f MB"
+          % (len(traj), traj.frame_rate, traj.valid_start, traj.valid_stop,
+             os.path.getsize(args.txt_path) / 1e6, os.path.getsize(args.bin_path) / 1e6))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
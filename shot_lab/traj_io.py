@@ -0,0 +1,202 @@
+"""
+Trajectory file loading: parses the (t, X, Y, Z) column format of Trajectory.txt in bulk into NumPy arrays
+"""
+import os
+import sys
+import time
+import numpy as np
+
+NCOLS = 4
+
+
+def _line_columns(buf):
+    """
+    Number of whitespace separated fields of every line, counted on the raw bytes without splitting the lines
+
+    :param buf: (n,) uint8 array of the block bytes
+    :return: (number of lines,) int array
+    """
+    # whitespace and control characters, the latter failing the float parsing anyway
+    space = buf <= 32
+    starts = np.flatnonzero(space[:-1] > space[1:]) + 1
+    if len(buf) and not space[0]:
+        starts = np.concatenate(([0], starts))
+    newlines = np.flatnonzero(buf == 10)
+    return np.bincount(np.searchsorted(newlines, starts), minlength=len(newlines) + 1)
+
+
+def _bad_line(lines, columns):
+    """Index of the first line that is neither blank nor NCOLS floats, None if they all are"""
+    wrong = np.flatnonzero((columns != 0) & (columns != NCOLS))
+    if len(wrong):
+        return wrong[0]
+    for i in np.flatnonzero(columns):
+        try:
+            [float(field) for field in lines[i].split()]
+        except ValueError:
+            return i
+    return None
+
+
+def _parse_block(text, file_path, first_line=1):
+    """
+    Parse a block of whitespace separated floats into a (n, 4) array, every non blank line holding 4 columns
+
+    :param text: block of complete lines (str or bytes)
+    :param file_path: file path, only used in error messages
+    :param first_line: line number of the first line of the block in the file, for the error messages
+    :return: (n, 4) float64 array
+    """
+    if isinstance(text, str):
+        text = text.encode("ascii")
+    columns = _line_columns(np.frombuffer(text, dtype=np.uint8))
+    rows = int(np.count_nonzero(columns))
+    try:
+        values = np.fromstring(text, dtype=np.float64, sep=" ") if rows else np.empty(0)
+    except ValueError:
+        # a field that is not a float, located below
+        values = np.empty(0)
+    if values.size != NCOLS * rows or (columns[columns != 0] != NCOLS).any():
+        lines = text.split(b"\n")
+        bad = _bad_line(lines, columns)
+        bad = len(lines) - 1 if bad is None else bad
+        raise ValueError("%s:%d: expected %d columns (t, X, Y, Z), got %r"
+                         % (file_path, first_line + bad, NCOLS, lines[bad].decode("ascii", "replace").strip()))
+    return values.reshape(-1, NCOLS)
+
+
+def drop_nan_rows(traj):
+    """
+    Remove the rows holding at least one NaN in one vectorized step
+
+    :param traj: (n, 4) trajectory array
+    :return: (m, 4) contiguous array of the valid rows
+    """
+    return np.ascontiguousarray(traj[~np.isnan(traj).any(axis=1)])
+
+
+def load_traj(file_path, drop_nan=True):
+    """
+    Import a whole trajectory from a column file (t, X, Y, Z)
+
+    :param file_path: trajectory file path
+    :param drop_nan: remove the rows where a coordinate is NaN (untracked frames)
+    :return: contiguous (n, 4) float64 array of (t, X, Y, Z) rows
+    """
+    with open(file_path, "rb") as file:
+        traj = _parse_block(file.read(), file_path)
+    if drop_nan:
+        traj = drop_nan_rows(traj)
+    return traj
+
+
+def iter_traj_chunks(file_path, chunk_bytes=1 << 24, drop_nan=True):
+    """
+    Read a trajectory file by chunks for files larger than RAM
+
+    :param file_path: trajectory file path
+    :param chunk_bytes: approximate number of bytes parsed at once
+    :param drop_nan: remove the rows where a coordinate is NaN
+    :return: generator of (n, 4) float64 arrays, in file order
+    """
+    rest = b""
+    line = 1
+    with open(file_path, "rb") as file:
+        while True:
+            block = file.read(chunk_bytes)
+            if not block:
+                break
+            block = rest + block
+            cut = block.rfind(b"\n") + 1
+            # keep the trailing partial line for the next block
+            rest = block[cut:]
+            if cut == 0:
+                continue
+            chunk = _parse_block(block[:cut], file_path, line)
+            line += block.count(b"\n", 0, cut)
+            if drop_nan:
+                chunk = drop_nan_rows(chunk)
+            if len(chunk):
+                yield chunk
+    if rest.strip():
+        chunk = _parse_block(rest, file_path, line)
+        if drop_nan:
+            chunk = drop_nan_rows(chunk)
+        if len(chunk):
+            yield chunk
+
+
+def save_traj(file_path, traj):
+    """
+    Write a trajectory in the Trajectory.txt column format
+
+    :param file_path: output file path
+    :param traj: (n, 4) array of (t, X, Y, Z) rows
+    :return:
+    """
+    np.savetxt(file_path, np.asarray(traj, dtype=np.float64).reshape(-1, NCOLS), fmt="%.18e")
+
+
+def _import_traj_legacy(file_path):
+    """Per-line loader formerly used by shot_recons.py, kept as the benchmark reference
+
+    :param file_path: trajectory file path
+    """
+    file = open(file_path, "r")
+    data = file.read().split("\n")
+    file.close()
+    traj_coords = []
+    for line in data:
+        data = list(map(float, line.split()))
+        if len(data) > 0 and not(np.isnan(data[0]) or np.isnan(data[1]) or np.isnan(data[2]) or np.isnan(data[3])):
+            traj_coords.append((data[0], data[1], data[2]))
+
+    return traj_coords
+
+
+def make_synthetic_file(file_path, num_rows, rate=19000., nan_rows=1000):
+    """
+    Write a Trajectory.txt-like file: NaN rows before the shot is tracked then a straight flight
+
+    :param file_path: output file path
+    :param num_rows: total number of rows
+    :param rate: sampling rate (Hz)
+    :param nan_rows: number of leading untracked rows
+    :return:
+    """
+    block = 1 << 20
+    with open(file_path, "w") as file:
+        for start in range(0, num_rows, block):
+            idx = np.arange(start, min(start + block, num_rows))
+            t = idx / rate
+            traj = np.column_stack((t, -4. + 8. * idx / num_rows, 0.1 * np.sin(t), np.zeros(len(idx))))
+            traj[idx < nan_rows, 1:] = np.nan
+            np.savetxt(file, traj, fmt="%.18e")
+
+
+def benchmark(num_rows=10000000):
+    """
+    Compare the legacy loader with the vectorized and chunked loaders on a synthetic file
+
+    :param num_rows: number of rows of the synthetic file
+    :return:
+    """
+    file_path = "traj_bench_%d.txt" % num_rows
+    make_synthetic_file(file_path, num_rows)
+    print("file: %s, %d rows, %.1f MB" % (file_path, num_rows, os.path.getsize(file_path) / 1e6))
+    try:
+        start = time.perf_counter()
+        traj = load_traj(file_path)
+        print("load_traj:        %.2f s (%d valid rows)" % (time.perf_counter() - start, len(traj)))
+        start = time.perf_counter()
+        count = sum(len(chunk) for chunk in iter_traj_chunks(file_path))
+        print("iter_traj_chunks: %.2f s (%d valid rows)" % (time.perf_counter() - start, count))
+        start = time.perf_counter()
+        count = len(_import_traj_legacy(file_path))
+        print("legacy loader:    %.2f s (%d valid rows)" % (time.perf_counter() - start, count))
+    finally:
+        os.remove(file_path)
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 10000000)
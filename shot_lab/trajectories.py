@@ -0,0 +1,630 @@
+"""
+Shot trajectory generators, returning (N, 3) position arrays sampled at any rate.
+
+Parametric curves (line, double_sine, parabola) are evaluated in closed form on a time array. Ballistic flights
+with drag, spin (Magnus lift) and ground impacts are integrated by an adaptive step RK4, from impact to impact,
+then resampled through the cubic Hermite interpolant of the step nodes (positions and velocities), so the
+integration step and the output rate are independent:
+
+    t = sample_times(0.05, 19000.)
+    xyz = ballistic((-4., 0., 0.5), (150., 0., 5.), cd=0.47, spin=(0., 0., 300.)).sample(t)
+    traj_io.save_traj("Trajectory.txt", to_traj(t, xyz))
+
+Blender units are taken as meters, the Z axis is up.
+
+Trajectories sampled at one rate are filmed at another by camera_keys: resampled at the camera frame times
+(frame = (t - t0) * fps), plus the motion blur sub-sample times within the exposure.
+"""
+import argparse
+import array
+import json
+import math
+import sys
+import time
+import numpy as np
+from . import traj_io
+
+GRAVITY = 9.81
+AIR_DENSITY = 1.2
+AIR_VISCOSITY = 1.8e-5
+
+
+def sample_times(duration, rate, t0=0.):
+    """
+    :param duration: trajectory duration (s)
+    :param rate: sampling rate (Hz)
+    :param t0: first sample time
+    :return: (N,) sample times, N = floor(duration * rate) + 1
+    """
+    return t0 + np.arange(int(math.floor(duration * rate + 1e-9)) + 1) / float(rate)
+
+
+def to_traj(t, xyz):
+    """
+    :param t: (N,) sample times
+    :param xyz: (N, 3) positions
+    :return: (N, 4) array of (t, X, Y, Z) rows, the Trajectory.txt columns
+    """
+    return np.column_stack((np.asarray(t, dtype=np.float64), np.asarray(xyz, dtype=np.float64)))
+
+
+def line(t, start=(-4., 0., 0.), end=(4., 0., 0.), t0=None, t1=None):
+    """
+    Uniform straight flight, the former make_doublesin_traj path
+
+    :param t: (N,) sample times
+    :param start, end: positions at t0 and t1
+    :param t0, t1: start and end times, the first and last sample times by default
+    :return: (N, 3) positions
+    """
+    t = np.asarray(t, dtype=np.float64)
+    t0 = t[0] if t0 is None else t0
+    t1 = t[-1] if t1 is None else t1
+    s = (t - t0) / (t1 - t0) if t1 != t0 else np.zeros_like(t)
+    start = np.asarray(start, dtype=np.float64)
+    return start + s[:, None] * (np.asarray(end, dtype=np.float64) - start)
+
+
+def double_sine(t, start=(-4., 0., 0.), end=(4., 0., 0.), amplitude=(1., 1.), periods=2., t0=None, t1=None):
+    """
+    Straight flight along X wobbling in the Y (cosine) and Z (sine) directions
+
+    :param t: (N,) sample times
+    :param start, end: mean positions at t0 and t1
+    :param amplitude: (Y, Z) amplitudes
+    :param periods: number of oscillations between t0 and t1
+    :param t0, t1: start and end times, the first and last sample times by default
+    :return: (N, 3) positions
+    """
+    t = np.asarray(t, dtype=np.float64)
+    t0 = t[0] if t0 is None else t0
+    t1 = t[-1] if t1 is None else t1
+    xyz = line(t, start, end, t0, t1)
+    theta = 2 * math.pi * periods * (t - t0) / (t1 - t0) if t1 != t0 else np.zeros_like(t)
+    xyz[:, 1] += amplitude[0] * np.cos(theta)
+    xyz[:, 2] += amplitude[1] * np.sin(theta)
+    return xyz
+
+
+def parabola(t, p0, v0, g=GRAVITY, t0=None):
+    """
+    Ballistic flight without drag, in closed form
+
+    :param t: (N,) sample times
+    :param p0, v0: position and velocity at t0
+    :param g: gravity (along -Z)
+    :param t0: launch time, the first sample time by default
+    :return: (N, 3) positions
+    """
+    t = np.asarray(t, dtype=np.float64)
+    dt = t - (t[0] if t0 is None else t0)
+    xyz = np.asarray(p0, dtype=np.float64) + dt[:, None] * np.asarray(v0, dtype=np.float64)
+    xyz[:, 2] -= 0.5 * g * dt ** 2
+    return xyz
+
+
+def hermite(t, nodes_t, nodes_x, nodes_v):
+    """
+    Evaluate the cubic Hermite interpolant of the integration nodes. Nodes may share a time (impact), the
+    interval after the node then starts from its last copy.
+
+    :param t: (N,) sample times, within [nodes_t[0], nodes_t[-1]]
+    :param nodes_t: (M,) node times, non decreasing
+    :param nodes_x: (M, 3) node positions
+    :param nodes_v: (M, 3) node velocities
+    :return: (N, 3) positions
+    """
+    t = np.asarray(t, dtype=np.float64)
+    i = np.clip(np.searchsorted(nodes_t, t, side="right") - 1, 0, len(nodes_t) - 2)
+    h = nodes_t[i + 1] - nodes_t[i]
+    s = ((t - nodes_t[i]) / np.where(h > 0., h, 1.))[:, None]
+    h = h[:, None]
+    s2 = s * s
+    s3 = s2 * s
+    return ((2 * s3 - 3 * s2 + 1) * nodes_x[i] + (s3 - 2 * s2 + s) * h * nodes_v[i]
+            + (3 * s2 - 2 * s3) * nodes_x[i + 1] + (s3 - s2) * h * nodes_v[i + 1])
+
+
+class Flight:
+    """
+    Integrated trajectory: RK4 step nodes and the impacts
+
+    :param t: (M,) node times
+    :param x: (M, 3) node positions
+    :param v: (M, 3) node velocities
+    :param impacts: list of (time, position, incoming velocity, outgoing velocity)
+    """
+    def __init__(self, t, x, v, impacts=()):
+        self.t = t
+        self.x = x
+        self.v = v
+        self.impacts = list(impacts)
+
+    def __len__(self):
+        return len(self.t)
+
+    @property
+    def duration(self):
+        return self.t[-1] - self.t[0]
+
+    def sample(self, t):
+        """
+        :param t: (N,) sample times, clamped to the integrated time range
+        :return: (N, 3) positions
+        """
+        return hermite(np.clip(t, self.t[0], self.t[-1]), self.t, self.x, self.v)
+
+    def resample(self, rate):
+        """
+        :param rate: sampling rate (Hz)
+        :return: (N,) times and (N, 3) positions from the launch to the end of the flight
+        """
+        t = sample_times(self.duration, rate, self.t[0])
+        return t, self.sample(t)
+
+
+def _coefficients(mass, radius, drag, cd, cl, rho, mu):
+    """:return: quadratic drag, linear drag and Magnus coefficients of the acceleration"""
+    area = math.pi * radius ** 2
+    if drag not in ("quadratic", "linear", None):
+        raise ValueError("unknown drag model %r" % (drag,))
+    k_quad = 0.5 * rho * cd * area / mass if drag == "quadratic" else 0.
+    k_lin = 6 * math.pi * mu * radius / mass if drag == "linear" else 0.
+    return k_quad, k_lin, 0.5 * rho * cl * area * radius / mass
+
+
+def _acceleration(vx, vy, vz, wx, wy, wz, k_quad, k_lin, g):
+    """
+    Drag, Magnus lift and gravity at a velocity, component-wise: floats for one flight, (B,) arrays for a batch
+
+    :param vx, vy, vz: velocity
+    :param wx, wy, wz: spin scaled by the Magnus coefficient (and the spin decay)
+    :return: acceleration components
+    """
+    k = k_quad * (vx * vx + vy * vy + vz * vz) ** 0.5 + k_lin
+    return -k * vx + (wy * vz - wz * vy), -k * vy + (wz * vx - wx * vz), -k * vz + (wx * vy - wy * vx) - g
+
+
+def _stage_spins(w, spin_decay, elapsed, h):
+    """:return: spin at the start, middle and end of a step starting elapsed seconds after the launch"""
+    if not spin_decay:
+        return w, w, w
+    return tuple(tuple(math.exp(-spin_decay * (elapsed + s)) * c for c in w) for s in (0., 0.5 * h, h))
+
+
+def _rk4_step(x, v, h, spins, k_quad, k_lin, g):
+    """
+    One RK4 step of the flight, component-wise like _acceleration
+
+    :param x, v: position and velocity components
+    :param h: step (s)
+    :param spins: stage spins, see _stage_spins
+    :return: position and velocity components at the end of the step
+    """
+    (w1x, w1y, w1z), (w2x, w2y, w2z), (w4x, w4y, w4z) = spins
+    vx, vy, vz = v
+    h2 = 0.5 * h
+    a1x, a1y, a1z = _acceleration(vx, vy, vz, w1x, w1y, w1z, k_quad, k_lin, g)
+    b2x, b2y, b2z = vx + h2 * a1x, vy + h2 * a1y, vz + h2 * a1z
+    a2x, a2y, a2z = _acceleration(b2x, b2y, b2z, w2x, w2y, w2z, k_quad, k_lin, g)
+    b3x, b3y, b3z = vx + h2 * a2x, vy + h2 * a2y, vz + h2 * a2z
+    a3x, a3y, a3z = _acceleration(b3x, b3y, b3z, w2x, w2y, w2z, k_quad, k_lin, g)
+    b4x, b4y, b4z = vx + h * a3x, vy + h * a3y, vz + h * a3z
+    a4x, a4y, a4z = _acceleration(b4x, b4y, b4z, w4x, w4y, w4z, k_quad, k_lin, g)
+    h6 = h / 6.
+    return ((x[0] + h6 * (vx + 2 * (b2x + b3x) + b4x), x[1] + h6 * (vy + 2 * (b2y + b3y) + b4y),
+             x[2] + h6 * (vz + 2 * (b2z + b3z) + b4z)),
+            (vx + h6 * (a1x + 2 * (a2x + a3x) + a4x), vy + h6 * (a1y + 2 * (a2y + a3y) + a4y),
+             vz + h6 * (a1z + 2 * (a2z + a3z) + a4z)))
+
+
+class _Model:
+    """Flight parameters shared by ballistic and ballistic_batch"""
+    def __init__(self, mass, radius, drag, cd, spin, cl, spin_decay, rho, mu, g, ground, restitution, friction, t0):
+        self.k_quad, self.k_lin, k_mag = _coefficients(mass, radius, drag, cd, cl, rho, mu)
+        self.spin = k_mag * np.asarray(spin, dtype=np.float64)
+        self.spin_decay = spin_decay
+        self.g = g
+        self.radius = radius
+        self.floor = None if ground is None else ground + radius
+        self.restitution = restitution
+        self.friction = friction
+        self.t0 = t0
+
+    def step(self, x, v, t, h, spin):
+        return _rk4_step(x, v, h, _stage_spins(spin, self.spin_decay, t - self.t0, h), self.k_quad, self.k_lin,
+                         self.g)
+
+    def impact(self, t, x, v, h, nx, nv, spin):
+        """
+        Impact within the step from (t, x, v) to (nx, nv): contact time from the Hermite interpolant of the step,
+        contact state from an RK4 step to it, then the bounce
+
+        :return: contact time, position, incoming and outgoing velocities, True when the flight stops
+        """
+        s = _hermite_root(x[2] - self.floor, h * v[2], nx[2] - self.floor, h * nv[2])
+        contact, vin = self.step(x, v, t, s * h, spin)
+        contact = (contact[0], contact[1], self.floor)
+        vout = ((1. - self.friction) * vin[0], (1. - self.friction) * vin[1], -self.restitution * vin[2])
+        # bounce lower than a hundredth of the radius: resting
+        return t + s * h, contact, vin, vout, vout[2] * vout[2] < 2 * self.g * 1e-2 * self.radius
+
+    def crosses(self, z, nz):
+        """:return: True when a step from height z to nz goes through the ground"""
+        return self.floor is not None and nz < self.floor <= z
+
+
+def ballistic(p0, v0, duration=0.1, dt=1e-5, mass=0.0027, radius=0.02, drag="quadratic", cd=0.47, spin=(0., 0., 0.),
+              cl=0.2, spin_decay=0., rho=AIR_DENSITY, mu=AIR_VISCOSITY, g=GRAVITY, ground=None, restitution=0.8,
+              friction=0.1, max_bounces=10, t0=0., tol=1e-10):
+    """
+    Integrate a spinning sphere flight by RK4, with an adaptive step by default
+
+    Accelerations: gravity along -Z, drag opposed to the velocity, quadratic (0.5 rho cd A |v| v / m) or linear
+    (Stokes, 6 pi mu r v / m), and Magnus lift 0.5 rho cl A r (w x v) / m, the spin w decaying as exp(-spin_decay t).
+    When ground is given, the sphere bounces on the z = ground + radius plane: the normal velocity is reversed and
+    scaled by restitution, the tangential one scaled by 1 - friction. The flight stops at the end of the
+    duration, after max_bounces impacts or once the sphere rests on the ground.
+
+    The adaptive step is controlled by step doubling: a step is kept when its two half steps agree with it, and
+    with the Hermite interpolant of its ends at its middle, within tol. A smooth flight then takes a few hundred
+    steps where the fixed step needs duration / dt.
+
+    :param p0, v0: launch position and velocity
+    :param duration: flight duration (s)
+    :param dt: integration step (s), the first step of the adaptive integration
+    :param mass: sphere mass (kg)
+    :param radius: sphere radius (bu)
+    :param drag: 'quadratic', 'linear' or None
+    :param cd: drag coefficient of the quadratic model
+    :param spin: angular velocity vector (rad/s)
+    :param cl: lift coefficient of the Magnus model
+    :param spin_decay: spin decay rate (1/s)
+    :param rho, mu: air density and viscosity
+    :param g: gravity
+    :param ground: ground height, None for a free flight
+    :param restitution: normal coefficient of restitution
+    :param friction: tangential velocity loss at the impacts
+    :param max_bounces: impacts before the flight stops
+    :param t0: launch time
+    :param tol: position error allowed per step (bu), None for the fixed step dt
+    :return: Flight
+    """
+    model = _Model(mass, radius, drag, cd, spin, cl, spin_decay, rho, mu, g, ground, restitution, friction, t0)
+    spin = tuple(map(float, model.spin))
+    step = model.step
+    t_end = t0 + (duration if tol else int(math.ceil(duration / dt - 1e-9)) * dt)
+    t, x, v = t0, tuple(map(float, p0)), tuple(map(float, v0))
+    # nodes (t, x, y, z, vx, vy, vz) in a flat float buffer: no array row per step
+    nodes = array.array("d", (t,) + x + v)
+    push = nodes.extend
+    impacts = []
+    h = dt
+    # t accumulates rounding errors over the steps: no remainder step shorter than a thousandth of dt
+    while t < t_end - 1e-3 * dt:
+        last = t + h > t_end - 1e-3 * dt
+        if last:
+            h = t_end - t
+        t_next = t_end if last else t + h
+        if tol:
+            mx, mv = step(x, v, t, 0.5 * h, spin)
+            nx, nv = step(mx, mv, t + 0.5 * h, 0.5 * h, spin)
+            if model.floor is not None and x[2] <= model.floor and min(mx[2], nx[2]) < model.floor:
+                # step longer than the hop after a bounce: the parabola is exact in RK4, the error never says so
+                h *= 0.5
+                continue
+            fx, _ = step(x, v, t, h, spin)
+            # Richardson estimate of the half steps error, and the Hermite interpolant of the step at its middle
+            err = max(max(abs(a - b) for a, b in zip(nx, fx)) / 15.,
+                      max(abs(0.5 * (a + b) + 0.125 * h * (c - d) - m) for a, b, c, d, m in zip(x, nx, v, nv, mx)))
+            if err > tol and h > 1e-6 * dt:
+                h *= max(0.2, 0.9 * (tol / err) ** 0.2)
+                continue
+            segments = ((t, x, v, t + 0.5 * h, mx, mv), (t + 0.5 * h, mx, mv, t_next, nx, nv))
+            h = h * min(4., 0.9 * (tol / err) ** 0.2) if err else 4. * h
+        else:
+            nx, nv = step(x, v, t, h, spin)
+            segments = ((t, x, v, t_next, nx, nv),)
+        for ts, xs, vs, te, xe, ve in segments:
+            if model.crosses(xs[2], xe[2]):
+                t, x, vin, v, stop = model.impact(ts, xs, vs, te - ts, xe, ve, spin)
+                push((t,) + x + vin + (t,) + x + v)
+                impacts.append((t, x, vin, v))
+                break
+            push((te,) + xe + ve)
+        else:
+            t, x, v = t_next, nx, nv
+            continue
+        if len(impacts) >= max_bounces or stop:
+            break
+        if not tol:
+            h = dt
+    nodes = np.frombuffer(nodes, dtype=np.float64).reshape(-1, 7)
+    return Flight(nodes[:, 0].copy(), nodes[:, 1:4].copy(), nodes[:, 4:].copy(), impacts)
+
+
+def ballistic_batch(p0, v0, duration=0.1, dt=1e-5, mass=0.0027, radius=0.02, drag="quadratic", cd=0.47,
+                    spin=(0., 0., 0.), cl=0.2, spin_decay=0., rho=AIR_DENSITY, mu=AIR_VISCOSITY, g=GRAVITY, ground=None,
+                    restitution=0.8, friction=0.1, max_bounces=10, t0=0.):
+    """
+    Flights of a batch of launches, integrated together: the fixed step RK4 of ballistic on (B,) component arrays,
+    the nodes written to preallocated arrays. Many flights (trajectory sets, sweeps) cost a few NumPy calls per step
+    instead of a Python step per flight. The launches crossing the ground within a step bounce as in ballistic and
+    finish the step on their own, back on the common time grid.
+
+    :param p0, v0: (B, 3) launch positions and velocities
+    :param spin: (3,) or (B, 3) angular velocities (rad/s)
+    :return: list of B Flight, see ballistic for the other parameters
+    """
+    p0, v0 = np.broadcast_arrays(np.atleast_2d(np.asarray(p0, dtype=np.float64)),
+                                 np.atleast_2d(np.asarray(v0, dtype=np.float64)))
+    model = _Model(mass, radius, drag, cd, spin, cl, spin_decay, rho, mu, g, ground, restitution, friction, t0)
+    spin = tuple(np.broadcast_to(model.spin, p0.shape).T)
+    n_steps = int(math.ceil(duration / dt - 1e-9))
+    t = t0 + dt * np.arange(n_steps + 1)
+    # component major nodes: x[i] unpacks to the (B,) component arrays of _rk4_step
+    x = np.empty((n_steps + 1, 3, len(p0)))
+    v = np.empty_like(x)
+    x[0], v[0] = p0.T, v0.T
+    active = np.ones(len(p0), dtype=bool)
+    impacts = [[] for _ in range(len(p0))]
+    for i in range(n_steps):
+        x[i + 1], v[i + 1] = model.step(tuple(x[i]), tuple(v[i]), t[i], dt, spin)
+        if model.floor is None:
+            continue
+        for j in np.flatnonzero(active & (x[i + 1, 2] < model.floor) & (x[i, 2] >= model.floor)):
+            row = [tuple(a[:, j].tolist()) for a in (x[i], v[i], x[i + 1], v[i + 1])]
+            w = tuple(float(c[j]) for c in spin)
+            tc, contact, vin, vout, stop = model.impact(t[i], row[0], row[1], dt, row[2], row[3], w)
+            impacts[j].append((i + 1, tc, contact, vin, vout))
+            if len(impacts[j]) >= max_bounces or stop:
+                active[j] = False
+            else:
+                x[i + 1, :, j], v[i + 1, :, j] = model.step(contact, vout, tc, t[i + 1] - tc, w)
+    flights = []
+    for j in range(len(p0)):
+        # grid nodes, with the contact node pair of each impact before the grid node ending its step
+        pieces, start = [], 0
+        for k, tc, contact, vin, vout in impacts[j]:
+            pieces += [(t[start:k], x[start:k, :, j], v[start:k, :, j]), ([tc, tc], [contact, contact], [vin, vout])]
+            start = k
+        if active[j]:
+            pieces.append((t[start:], x[start:, :, j], v[start:, :, j]))
+        flights.append(Flight(np.concatenate([p[0] for p in pieces]), np.concatenate([p[1] for p in pieces]),
+                              np.concatenate([p[2] for p in pieces]), [event[1:] for event in impacts[j]]))
+    return flights
+
+
+def _hermite_root(f0, d0, f1, d1, iterations=60):
+    """
+    Root in [0, 1] of the cubic Hermite curve from f0 (slope d0) to f1 (slope d1), f0 >= 0 > f1: safeguarded Newton
+    iterations, falling back to bisection, until the Newton update is below 1e-15
+
+    :return: curve parameter of the root
+    """
+    lo, hi = 0., 1.
+    s = f0 / (f0 - f1)
+    for _ in range(iterations):
+        s2, s3 = s * s, s * s * s
+        f = (2 * s3 - 3 * s2 + 1) * f0 + (s3 - 2 * s2 + s) * d0 + (3 * s2 - 2 * s3) * f1 + (s3 - s2) * d1
+        if f > 0.:
+            lo = s
+        else:
+            hi = s
+        df = (6 * s2 - 6 * s) * (f0 - f1) + (3 * s2 - 4 * s + 1) * d0 + (3 * s2 - 2 * s) * d1
+        update = f / df if df != 0. else 1.
+        s = s - update
+        if not lo < s < hi:
+            s = 0.5 * (lo + hi)
+        elif abs(update) < 1e-15:
+            break
+    return s
+
+
+def frame_times(t_start, t_end, fps, t0=None):
+    """
+    Camera frames falling within a time range
+
+    :param t_start, t_end: time range (s), the trajectory span
+    :param fps: camera frame rate (Hz)
+    :param t0: time of frame 0, t_start by default
+    :return: (N,) frame numbers and (N,) frame times
+    """
+    t0 = t_start if t0 is None else t0
+    first = int(math.ceil((t_start - t0) * fps - 1e-9))
+    last = int(math.floor((t_end - t0) * fps + 1e-9))
+    frames = np.arange(first, last + 1)
+    return frames, t0 + frames / float(fps)
+
+
+def exposure_times(times, exposure=0., subsamples=1):
+    """
+    Motion blur sub-sample times: the exposure centered on each frame time (Blender's 'CENTER' shutter position),
+    cut in equal slices sampled at their middle
+
+    :param times: (N,) frame times
+    :param exposure: exposure time (s)
+    :param subsamples: sub-samples per frame
+    :return: (N, subsamples) times
+    """
+    offsets = exposure * ((np.arange(subsamples) + 0.5) / subsamples - 0.5)
+    return np.asarray(times, dtype=np.float64)[:, None] + offsets
+
+
+def tracked_rows(t, xyz):
+    """
+    Drop the untracked (non-finite) samples of a capture
+
+    :param t: (M,) trajectory times (s)
+    :param xyz: (M, 3) trajectory positions
+    :return: (m,) times and (m, 3) positions of the tracked samples, float64
+    """
+    t = np.asarray(t, dtype=np.float64)
+    xyz = np.asarray(xyz, dtype=np.float64).reshape(-1, 3)
+    tracked = np.isfinite(xyz).all(axis=1)
+    return t[tracked], xyz[tracked]
+
+
+def interpolate(t, xyz, times, kind="cubic"):
+    """
+    Resample a trajectory at other times, clamped to its time span
+
+    :param t: (M,) sample times, increasing
+    :param xyz: (M, 3) positions
+    :param times: (...) resampling times
+    :param kind: 'cubic' (Hermite, finite difference slopes) or 'linear'
+    :return: (..., 3) positions
+    """
+    t = np.asarray(t, dtype=np.float64)
+    xyz = np.asarray(xyz, dtype=np.float64).reshape(-1, 3)
+    times = np.asarray(times, dtype=np.float64)
+    flat = np.clip(times.ravel(), t[0], t[-1])
+    if len(t) < 2:
+        return np.broadcast_to(xyz[:1], times.shape + (3,)).copy()
+    if kind == "linear":
+        out = np.column_stack([np.interp(flat, t, xyz[:, i]) for i in range(3)])
+    elif kind == "cubic":
+        out = hermite(flat, t, xyz, np.gradient(xyz, t, axis=0))
+    else:
+        raise ValueError("unknown interpolation %r" % (kind,))
+    return out.reshape(times.shape + (3,))
+
+
+def blender_fps(fps):
+    """
+    :param fps: frame rate (Hz)
+    :return: scene.render (fps, fps_base), Blender playing fps / fps_base frames per second
+    """
+    rounded = max(int(round(fps)), 1)
+    return rounded, rounded / float(fps)
+
+
+def camera_keys(t, xyz, fps, exposure=0., subsamples=1, t0=None, kind="cubic"):
+    """
+    Shot keyframes seen by a camera running at fps: the trajectory resampled at the camera frame times,
+    and at the motion blur sub-sample times (fractional frames) when subsamples > 1
+
+    :param t: (M,) trajectory times (s)
+    :param xyz: (M, 3) trajectory positions, NaN rows (untracked) are skipped
+    :param fps: camera frame rate (Hz)
+    :param exposure: exposure time (s)
+    :param subsamples: motion blur sub-samples per frame
+    :param t0: time of frame 0, the first tracked time by default
+    :param kind: interpolation, see interpolate
+    :return: (N,) rendered frames, (K,) keyframe frames and (K, 3) keyframe positions
+    """
+    t, xyz = tracked_rows(t, xyz)
+    t0 = t[0] if t0 is None else t0
+    frames, times = frame_times(t[0], t[-1], fps, t0)
+    if subsamples > 1 and exposure > 0.:
+        times = np.unique(np.concatenate((times, exposure_times(times, exposure, subsamples).ravel())))
+    return frames, (times - t0) * fps, interpolate(t, xyz, times, kind)
+
+
+def generate(kind, duration, rate, **kwargs):
+    """
+    :param kind: 'line', 'double_sine', 'parabola' or 'ballistic'
+    :param duration: trajectory duration (s)
+    :param rate: sampling rate (Hz)
+    :param kwargs: generator parameters
+    :return: (N,) times and (N, 3) positions
+    """
+    if kind == "ballistic":
+        return ballistic(duration=duration, **kwargs).resample(rate)
+    t = sample_times(duration, rate)
+    funcs = {"line": line, "double_sine": double_sine, "parabola": parabola}
+    if kind not in funcs:
+        raise ValueError("unknown trajectory kind %r" % (kind,))
+    return t, funcs[kind](t, **kwargs)
+
+
+def write(file_path, t, xyz):
+    """
+    Write a trajectory in the Trajectory.txt column format
+
+    :param file_path: output file path
+    :param t: (N,) sample times
+    :param xyz: (N, 3) positions
+    :return:
+    """
+    traj_io.save_traj(file_path, to_traj(t, xyz))
+
+
+def benchmark(n_steps=1000000):
+    """
+    Time the adaptive and fixed step RK4 integrations (with and without drag and spin), the batch integration and
+    the Hermite resampling, and check them against the closed form parabola and a fine fixed step reference
+
+    :param n_steps: number of fixed integration steps
+    :return:
+    """
+    p0, v0 = (-4., 0., 0.5), (80., 0., 3.)
+    duration = 0.1
+    dt = duration / n_steps
+    t = sample_times(duration, 19000.)
+    for label, kwargs in (("quadratic drag + decaying spin", dict(spin=(0., 0., 500.), spin_decay=2.)),
+                          ("no drag", dict(drag=None))):
+        start = time.perf_counter()
+        fixed = ballistic(p0, v0, duration, dt, tol=None, **kwargs)
+        elapsed_fixed = time.perf_counter() - start
+        start = time.perf_counter()
+        flight = ballistic(p0, v0, duration, dt, **kwargs)
+        elapsed = time.perf_counter() - start
+        print("RK4, %s: %d fixed steps in %.2f s (%.2f us per step), adaptive %d nodes in %.1f ms, "
+              "max deviation %.1e bu" % (label, len(fixed) - 1, elapsed_fixed, 1e6 * elapsed_fixed / (len(fixed) - 1),
+                                         len(flight), 1000 * elapsed, np.abs(flight.sample(t) - fixed.sample(t)).max()))
+    flights, steps = 1000, max(n_steps // 1000, 1)
+    rng = np.random.default_rng(0)
+    launches, spins = np.asarray(v0) + rng.normal(0., 5., (flights, 3)), rng.normal(0., 300., (flights, 3))
+    start = time.perf_counter()
+    batch = ballistic_batch(np.tile(p0, (flights, 1)), launches, duration, duration / steps, spin=spins,
+                            spin_decay=2., ground=0.)
+    elapsed = time.perf_counter() - start
+    single = ballistic(p0, launches[0], duration, duration / steps, spin=spins[0], spin_decay=2., ground=0., tol=None)
+    print("RK4 batch, quadratic drag + decaying spin + ground: %d flights of %d steps in %.2f s "
+          "(%.2f us per flight step), %d impacts, max deviation from ballistic %.1e bu"
+          % (flights, steps, elapsed, 1e6 * elapsed / (flights * steps), sum(len(f.impacts) for f in batch),
+             np.abs(batch[0].sample(t) - single.sample(t)).max()))
+    start = time.perf_counter()
+    t, xyz = flight.resample(19000.)
+    print("Hermite resampling: %d samples at 19 kHz in %.1f ms" % (len(t), 1000 * (time.perf_counter() - start)))
+    print("adaptive, no drag: max error against the closed form parabola %.2e bu"
+          % np.abs(xyz - parabola(t, p0, v0)).max())
+    coarse = ballistic(p0, v0, duration, 1e-3, cd=0.47, spin=(0., 0., 500.), tol=None)
+    fine = ballistic(p0, v0, duration, 5e-4, cd=0.47, spin=(0., 0., 500.), tol=None)
+    print("drag + spin, 1 ms fixed step: max deviation from a 0.5 ms step flight %.2e bu"
+          % np.abs(coarse.sample(t) - fine.sample(t)).max())
+    start = time.perf_counter()
+    frames, key_frames, keys = camera_keys(t, parabola(t, p0, v0), 2000., 2e-4, 4)
+    elapsed = time.perf_counter() - start
+    # the sub-samples beyond the trajectory ends are clamped
+    inside = (key_frames >= 0.) & (key_frames <= 2000. * duration)
+    print("19 kHz samples filmed at 2 kHz, 0.2 ms exposure, 4 blur sub-samples: %d frames, %d keys in %.1f ms, "
+          "max error %.2e bu" % (len(frames), len(key_frames), 1000 * elapsed,
+                                 np.abs(keys - parabola(key_frames / 2000., p0, v0, t0=0.))[inside].max()))
+    start = time.perf_counter()
+    bounce = ballistic((0., 0., 1.), (1., 0., 0.), 3., drag=None, ground=0., radius=0.02)
+    print("bounces: %d impacts in %.1f ms, first at t = %.4f s (closed form %.4f s)"
+          % (len(bounce.impacts), 1000 * (time.perf_counter() - start), bounce.impacts[0][0],
+             math.sqrt(2 * 0.98 / GRAVITY)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="traj-gen", description="Write a synthetic Trajectory.txt")
+    parser.add_argument("out", nargs="?", default=None, help="output file, runs the benchmark when omitted")
+    parser.add_argument("--kind", default="ballistic", choices=("line", "double_sine", "parabola", "ballistic"))
+    parser.add_argument("--duration", type=float, default=0.1, help="(s)")
+    parser.add_argument("--rate", type=float, default=19000., help="sampling rate (Hz)")
+    parser.add_argument("--params", default="{}", help="generator parameters (JSON)")
+    args = parser.parse_args(argv)
+    if args.out is None:
+        benchmark()
+        return 0
+    t, xyz = generate(args.kind, args.duration, args.rate, **json.loads(args.params))
+    write(args.out, t, xyz)
+    print("%s: %d rows" % (args.out, len(t)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+"""
+Stereo (or multi-view) triangulation of the shot, vectorized over all the frames at once:
+linear DLT followed by an optional Gauss-Newton refinement of the reprojection error
+"""
+import sys
+import time
+import numpy as np
+from . import projection
+
+
+def dlt(uv, P):
+    """
+    Linear triangulation, solving the DLT system with the point at finite distance (w = 1) in least squares
+
+    :param uv: (V, N, 2) undistorted pixel tracks of the V views
+    :param P: (V, 3, 4) projection matrices
+    :return: (N, 3) points
+    """
+    # one contiguous array per image coordinate, the system is assembled component-wise
+    uv = np.ascontiguousarray(np.moveaxis(np.asarray(uv, dtype=float), -1, 1))
+    P = np.asarray(P, dtype=float)
+    M, rhs = [0.] * 6, [0.] * 3
+    for view in range(len(P)):
+        for k in range(2):
+            # row u P3 - P1 (or v P3 - P2) of the DLT system, normalized
+            row = [uv[view, k] * P[view, 2, i] - P[view, k, i] for i in range(4)]
+            norm = 1. / np.sqrt(row[0] * row[0] + row[1] * row[1] + row[2] * row[2])
+            row = [elem * norm for elem in row]
+            _accumulate(M, rhs, row[:3], -row[3])
+    return _solve3(M, rhs)
+
+
+def _accumulate(M, rhs, a, b):
+    """
+    Add the rows a . x = b to the normal equations M x = rhs
+
+    :param M: upper triangle of M as the list [m00, m01, m02, m11, m12, m22]
+    :param rhs: [r0, r1, r2]
+    :param a: [a0, a1, a2] row coefficient arrays
+    :param b: right hand side array
+    """
+    idx = 0
+    for i in range(3):
+        for j in range(i, 3):
+            M[idx] = M[idx] + a[i] * a[j]
+            idx += 1
+        rhs[i] = rhs[i] + a[i] * b
+
+
+def _solve3(M, rhs):
+    """Batched 3x3 symmetric solve by the adjugate, NaN for singular systems"""
+    a, b, c, d, e, f = M
+    r0, r1, r2 = rhs
+    c00, c01, c02 = d * f - e * e, c * e - b * f, b * e - c * d
+    c11, c12, c22 = a * f - c * c, b * c - a * e, a * d - b * b
+    det = a * c00 + b * c01 + c * c02
+    with np.errstate(divide="ignore", invalid="ignore"):
+        inv = 1. / np.where(det == 0., np.nan, det)
+    return np.column_stack(((c00 * r0 + c01 * r1 + c02 * r2) * inv, (c01 * r0 + c11 * r1 + c12 * r2) * inv,
+                            (c02 * r0 + c12 * r1 + c22 * r2) * inv))
+
+
+def project(X, P):
+    """
+    :param X: (N, 3) points
+    :param P: (V, 3, 4) projection matrices
+    :return: (V, N, 2) pixel coordinates, (V, N) homogeneous depth
+    """
+    h = np.stack([X @ p[:, :3].T + p[:, 3] for p in P])
+    return h[..., :2] / h[..., 2:], h[..., 2]
+
+
+def reprojection_errors(X, uv, P):
+    """
+    :param X: (N, 3) points
+    :param uv: (V, N, 2) pixel tracks
+    :param P: (V, 3, 4) projection matrices
+    :return: (V, N) reprojection error in pixels
+    """
+    return np.linalg.norm(project(X, P)[0] - uv, axis=-1)
+
+
+def refine(X, uv, P, iterations=3):
+    """
+    Gauss-Newton minimization of the reprojection error, all points updated together
+
+    :param X: (N, 3) initial points
+    :param uv: (V, N, 2) pixel tracks
+    :param P: (V, 3, 4) projection matrices
+    :param iterations: number of iterations
+    :return: (N, 3) refined points
+    """
+    P = np.asarray(P, dtype=float)
+    uv = np.ascontiguousarray(np.moveaxis(np.asarray(uv, dtype=float), -1, 1))
+    for _ in range(iterations):
+        x, y, z = np.ascontiguousarray(X.T)
+        M, rhs = [0.] * 6, [0.] * 3
+        for view in range(len(P)):
+            h = [P[view, i, 0] * x + P[view, i, 1] * y + P[view, i, 2] * z + P[view, i, 3] for i in range(3)]
+            inv_w = 1. / h[2]
+            for k in range(2):
+                proj = h[k] * inv_w
+                # d(u)/dX = (P1 - u P3) / w, d(v)/dX = (P2 - v P3) / w
+                J = [(P[view, k, i] - proj * P[view, 2, i]) * inv_w for i in range(3)]
+                _accumulate(M, rhs, J, uv[view, k] - proj)
+        X = X + _solve3(M, rhs)
+    return X
+
+
+def triangulate(tracks, cameras, refine_iter=3, chunk=1 << 14):
+    """
+    Reconstruct the 3D positions from the pixel tracks of calibrated cameras
+
+    :param tracks: (V, N, 2) pixel positions in the rendered (distorted) images, NaN for lost frames
+    :param cameras: V projection.Camera, e.g. built from the make_anim camera positions and euler angles
+    :param refine_iter: number of Gauss-Newton iterations, 0 for the linear solution only
+    :param chunk: number of frames processed together, small enough for the temporaries to stay in the CPU cache
+    :return: (N, 3) points, (V, N) reprojection errors
+    """
+    tracks = np.asarray(tracks, dtype=float)
+    P = np.stack([cam.P for cam in cameras])
+    num = tracks.shape[1]
+    X = np.empty((num, 3))
+    errors = np.empty((len(cameras), num))
+    for start in range(0, num, chunk):
+        part = slice(start, start + chunk)
+        uv = np.stack([projection.undistort_points(track[part], cam.dist_param, cam.resx, cam.resy)
+                       for track, cam in zip(tracks, cameras)])
+        points = dlt(uv, P)
+        if refine_iter:
+            points = refine(points, uv, P, refine_iter)
+        X[part] = points
+        errors[:, part] = reprojection_errors(points, uv, P)
+    return X, errors
+
+
+def benchmark(num=1000000, noise=0.2):
+    """
+    Triangulate a noisy synthetic trajectory seen by the camLeft/camTop setup of make_shot_video.py
+
+    :param num: number of frame pairs
+    :param noise: pixel noise standard deviation
+    :return:
+    """
+    cameras = [projection.Camera.from_euler((0., -5., 0.), (np.pi/2, 0., 0.), 500, 500, dist_param=0.05),
+               projection.Camera.from_euler((0., 0., 5.), (0., 0., np.pi/2), 500, 500, dist_param=0.05)]
+    theta = np.linspace(0., 2*np.pi, num)
+    truth = np.column_stack((np.linspace(-1.5, 1.5, num), 0.5 * np.cos(2*theta), 0.5 * np.sin(2*theta)))
+    rng = np.random.default_rng(0)
+    tracks = np.stack([cam.project(truth)[0] for cam in cameras]) + rng.normal(0., noise, (2, num, 2))
+    for refine_iter in (0, 2):
+        start = time.perf_counter()
+        X, err = triangulate(tracks, cameras, refine_iter)
+        duration = time.perf_counter() - start
+        print("%d refinement iterations: %.2f M frame pairs/s, 3D RMS error %.2e bu, reprojection RMS %.3f px"
+              % (refine_iter, num / duration / 1e6, np.sqrt(np.mean(np.sum((X - truth)**2, axis=1))),
+                 np.sqrt(np.mean(err**2))))
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
@@ -0,0 +1,12 @@
+import numpy as np
+from shot_lab import calib_poses
+from shot_lab import projection
+
+
+def test_coverage_poses_follow_the_plate():
+    cam = projection.Camera.look_at((0., 0., 5.), (0., 0., 0.), 500, 500)
+    poses = calib_poses.make_poses("coverage", 10, cam, L=4., h=0.025)
+    assert np.allclose(poses, calib_poses.coverage_poses(10, cam, L=4., h=0.025))
+    assert not np.allclose(poses, calib_poses.make_poses("coverage", 10, cam))
+    # the plate size is ignored by the pose sets that do not look at the image
+    assert np.allclose(calib_poses.make_poses("sobol", 10, cam, L=4.), calib_poses.sobol_poses(10))
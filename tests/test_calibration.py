@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+from shot_lab import calib_poses
+from shot_lab import calibration
+from shot_lab import projection
+from shot_lab import sphere_tracker
+
+
+def test_calibrate_dir_without_images(tmp_path):
+    with pytest.raises(ValueError, match="no ang_"):
+        calibration.calibrate_dir(str(tmp_path))
+
+
+def test_calibrate_dir_default_square(tmp_path):
+    # the default square is the one of the rendered plate, L / (inner + 1)
+    cam = projection.Camera.look_at((0., 0., 5.), (0., 0., 0.), 300, 300, dist_param=0.05)
+    square = calib_poses.square_size()
+    for i, rot in enumerate(calib_poses.sobol_poses(8, max_tilt=np.pi / 5)):
+        sphere_tracker.write_frame(str(tmp_path / ("ang_%d.png" % i)), calibration.render_chessboard(cam, rot, square))
+    res = calibration.calibrate_dir(str(tmp_path), processes=1)
+    assert res["used"].sum() >= 6
+    assert abs(res["dist_param"] - 0.05) < 5e-3
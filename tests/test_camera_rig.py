@@ -0,0 +1,18 @@
+import numpy as np
+from shot_lab import bpy_standin
+from shot_lab import camera_rig
+from shot_lab import scene_builder
+from shot_lab import shot_video
+
+
+def test_stack_ground_truth_skips_tracking_gaps():
+    bpy = bpy_standin.BpyStandin()
+    builder = scene_builder.SceneBuilder(bpy=bpy, mathutils=bpy.mathutils)
+    traj_t = np.arange(200) / 100.
+    xyz = shot_video.make_doublesin_traj(200, "double_sine")
+    xyz[40:47] = np.nan
+    with camera_rig.CameraRig(builder, camera_rig.ring(2, resx=50, resy=50)) as rig:
+        rig.film(traj_t, xyz, 24.)
+        frames, times, positions, _ = rig._stack(rig.cameras[0])
+    assert len(frames) == len(times) == len(positions) > 0
+    assert np.isfinite(positions).all()
@@ -0,0 +1,81 @@
+import numpy as np
+from shot_lab import bpy_standin
+from shot_lab import keyframes
+from shot_lab import scene_builder
+
+
+def animated_shot(insert, frames, coords):
+    bpy = bpy_standin.BpyStandin()
+    shot = bpy.add_object("Shot")
+    insert(bpy, shot, frames, coords)
+    return bpy, shot
+
+
+def positions(bpy, shot, frames):
+    scene = bpy.context.scene
+    res = []
+    for frame in frames:
+        scene.frame_set(frame)
+        res.append(list(shot.location))
+    return np.array(res)
+
+
+def test_bulk_matches_per_frame_keyframing():
+    frames = np.arange(40)
+    coords = np.column_stack((np.linspace(-4., 4., 40), np.sin(frames / 5.), np.cos(frames / 7.)))
+    bulk = animated_shot(lambda bpy, shot, f, c: keyframes.insert_location_keyframes(shot, f, c, bpy.data.actions),
+                         frames, coords)
+    per_frame = animated_shot(lambda bpy, shot, f, c: keyframes._insert_per_frame(bpy.context.scene, shot, f, c),
+                              frames, coords)
+    assert np.allclose(positions(*bulk, frames), coords, atol=1e-6)
+    assert np.allclose(positions(*bulk, frames), positions(*per_frame, frames), atol=1e-6)
+
+
+def test_bulk_keyframing_replaces_previous_curves():
+    frames = np.arange(10)
+    bpy, shot = animated_shot(lambda bpy, shot, f, c: keyframes.insert_location_keyframes(shot, f, c, bpy.data.actions),
+                              frames, np.zeros((10, 3)))
+    keyframes.insert_location_keyframes(shot, frames, np.ones((10, 3)), bpy.data.actions)
+    assert len(shot.animation_data.action.fcurves) == 3
+    assert np.allclose(positions(bpy, shot, frames), 1.)
+
+
+def test_fit_keyframes_within_tolerance():
+    t = np.linspace(0., 1., 2000)
+    coords = np.column_stack((t, np.sin(6 * t), 0.3 * t ** 2))
+    fit = keyframes.fit_keyframes(np.arange(len(t)), coords, 1e-4)
+    assert fit.max_error <= 1e-4
+    assert len(fit.frames) < len(t) // 10
+
+
+def test_fitted_keyframes_free_handles():
+    t = np.linspace(0., 1., 500)
+    coords = np.column_stack((t, np.sin(6 * t), 0.3 * t ** 2))
+    fit = keyframes.fit_keyframes(np.arange(len(t)), coords, 1e-4)
+    insert = lambda bpy, shot, f, c: keyframes.insert_location_keyframes(shot, f, c, bpy.data.actions, fit.slopes)
+    bpy, shot = animated_shot(insert, fit.frames, fit.coords)
+    for fcurve in shot.animation_data.action.fcurves:
+        types = np.empty(len(fit), dtype=np.int32)
+        fcurve.keyframe_points.foreach_get("handle_right_type", types)
+        assert not types.any()
+        assert {point.handle_left_type for point in fcurve.keyframe_points} == {'FREE'}
+    assert np.allclose(positions(bpy, shot, np.arange(len(t))), coords, atol=2e-4)
+
+
+def test_default_slopes_fewest_keyframes():
+    t = np.linspace(0., 1., 2000)
+    coords = np.column_stack((t, np.sin(6 * t), 0.3 * t ** 2))
+    frames = np.arange(len(t))
+    default = keyframes.fit_keyframes(frames, coords, 1e-4)
+    assert len(default) <= len(keyframes.fit_keyframes(frames, coords, 1e-4, "lsq"))
+
+
+def test_single_fitted_keyframe():
+    bpy = bpy_standin.BpyStandin()
+    builder = scene_builder.SceneBuilder(bpy=bpy, mathutils=bpy.mathutils)
+    builder.shot_film(np.array([0.]), np.ones((1, 3)), 24., 0.1, tolerance=1e-3)
+    shot = builder.objects["shot"]
+    assert positions(bpy, shot, [0]).tolist() == [[1., 1., 1.]]
+    for fcurve in shot.animation_data.action.fcurves:
+        point = fcurve.keyframe_points[0]
+        assert point.handle_left == point.handle_right == point.co
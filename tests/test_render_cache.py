@@ -0,0 +1,57 @@
+import os
+import shutil
+from shot_lab import bpy_standin
+from shot_lab import render_cache
+
+
+def rendered(tmp_path, name="frame.png", content=b"pixels"):
+    path = tmp_path / "out" / name
+    path.parent.mkdir(exist_ok=True)
+    path.write_bytes(content)
+    return str(path)
+
+
+def test_store_keeps_an_entry_stored_meanwhile(tmp_path):
+    first = render_cache.RenderCache(str(tmp_path / "cache"))
+    second = render_cache.RenderCache(str(tmp_path / "cache"))
+    output = rendered(tmp_path)
+    first.store("ab12", [output])
+    # the second worker rendered the same scene concurrently
+    second.store("ab12", [output])
+    os.remove(output)
+    assert first.fetch("ab12", [output])
+    assert open(output, "rb").read() == b"pixels"
+    assert not [name for name in os.listdir(tmp_path / "cache" / "ab") if ".tmp" in name]
+
+
+def test_store_replaces_an_entry_of_other_outputs(tmp_path):
+    cache = render_cache.RenderCache(str(tmp_path / "cache"))
+    cache.store("ab12", [rendered(tmp_path, "a.png")])
+    output = rendered(tmp_path, "b.png")
+    cache.store("ab12", [output])
+    assert cache.fetch("ab12", [output])
+
+
+def test_entry_evicted_during_fetch_is_a_miss(tmp_path, monkeypatch):
+    cache = render_cache.RenderCache(str(tmp_path / "cache"))
+    outputs = [rendered(tmp_path, "a.png"), rendered(tmp_path, "b.png")]
+    cache.store("ab12", outputs)
+    copy = shutil.copyfile
+
+    def evicted(src, dst):
+        # another worker evicts the entry after the first file
+        result = copy(src, dst)
+        shutil.rmtree(os.path.dirname(src))
+        return result
+
+    monkeypatch.setattr(shutil, "copyfile", evicted)
+    assert not cache.fetch("ab12", outputs)
+    assert (cache.hits, cache.misses) == (0, 1)
+
+
+def test_view_transform_in_the_key():
+    bpy = bpy_standin.BpyStandin()
+    scene = bpy.context.scene
+    key = render_cache.RenderCache.key(render_cache.describe_scene(scene))
+    scene.view_settings.view_transform = 'Standard'
+    assert render_cache.RenderCache.key(render_cache.describe_scene(scene)) != key
@@ -0,0 +1,41 @@
+import os
+import sys
+from shot_lab import render_farm
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUB = [sys.executable, "-m", "shot_lab.stub_render"]
+
+
+def stub_env(monkeypatch, fail_rate="0"):
+    monkeypatch.setenv("PYTHONPATH", ROOT)
+    monkeypatch.setenv("STUB_RENDER_TIME", "0")
+    monkeypatch.setenv("STUB_FAIL_RATE", fail_rate)
+
+
+def test_anim_shards_stitched(monkeypatch, tmp_path):
+    stub_env(monkeypatch)
+    shards = render_farm.anim_shards(0, 9, 4)
+    results = render_farm.run_shards(shards, STUB, "make_shot_video.py", str(tmp_path), workers=2)
+    assert [r["status"] for r in results] == ["ok"] * len(shards)
+    for camera in render_farm.CAMERAS:
+        assert sorted(os.listdir(tmp_path / camera)) == ["%s_%04d.jpg" % (camera, i) for i in range(10)]
+    assert not os.path.exists(tmp_path / ".shards")
+
+
+def test_failed_shard_retried(monkeypatch, tmp_path):
+    stub_env(monkeypatch, fail_rate="1")
+    results = render_farm.run_shards(render_farm.calib_shards(2, 2), STUB, "make_calib_pic.py", str(tmp_path),
+                                     workers=1, retries=1)
+    assert results[0]["status"] == "failed"
+    assert results[0]["attempts"] == 2
+    assert results[0]["outputs"] == []
+
+
+def test_config_forwarded_to_workers(monkeypatch, tmp_path):
+    seen = []
+    monkeypatch.setattr(render_farm, "run_shard", lambda shard, *args: seen.append(args[-1]) or {"id": shard["id"]})
+    config = {"num_frames": 10}
+    render_farm.run_shards(render_farm.sample_shards(), STUB, "make_sample_pic.py", str(tmp_path), config=config)
+    assert seen == [config]
+    cmd = render_farm.worker_command(STUB, "make_sample_pic.py", render_farm.sample_shards()[0], 1, config)
+    assert cmd[cmd.index("--config") + 1] == '{"num_frames": 10}'
@@ -0,0 +1,54 @@
+import numpy as np
+from shot_lab import bpy_standin
+from shot_lab import scene_builder
+
+
+def make_builder():
+    bpy = bpy_standin.BpyStandin()
+    return bpy, scene_builder.SceneBuilder(bpy=bpy, mathutils=bpy.mathutils)
+
+
+def test_memory_flat_across_rebuilds():
+    # leak_check asserts itself that bpy.data and the shot_lab heap stay flat
+    res = scene_builder.leak_check(rebuilds=200, builders=8)
+    assert res["counts"][0] == res["counts"][1]
+    assert res["heap"][1] - res["heap"][0] < 16 * 1024
+
+
+def test_shared_blocks_reused_across_rebuilds():
+    bpy, builder = make_builder()
+    for i in range(5):
+        builder.clear()
+        builder.plate(2., 0.05, "chessboard.png", np.eye(4))
+        builder.camera((0., 0., 5.))
+        builder.sun((0., 0., 5.), (0., 0., 0.))
+    counts = scene_builder.count_blocks(bpy.data)
+    assert counts["images"] == 1
+    assert counts["materials"] == 1
+    assert counts["objects"] == 3
+
+
+def test_close_purges_everything():
+    bpy, builder = make_builder()
+    builder.camera((0., -5., 0.))
+    builder.sun((0., -5., 0.), (0., 0., 0.))
+    builder.shot(0.1, np.arange(10), np.zeros((10, 3)))
+    builder.plate(2., 0.05, "chessboard.png")
+    builder.close()
+    assert sum(scene_builder.count_blocks(bpy.data).values()) == 0
+
+
+def test_unchanged_trajectory_not_keyed_again():
+    _, builder = make_builder()
+    frames, coords = np.arange(20), np.random.default_rng(0).random((20, 3))
+    builder.shot(0.1, frames, coords)
+    skipped = builder.skipped
+    builder.shot(0.1, frames, coords)
+    assert builder.skipped == skipped + 1
+
+
+def test_render_settings_standard_view_transform():
+    bpy, builder = make_builder()
+    builder.render_settings(100, 80, "out_", 'JPEG', 'BW')
+    assert bpy.context.scene.view_settings.view_transform == 'Standard'
+    assert bpy.context.scene.view_settings.look == 'None'
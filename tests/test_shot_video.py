@@ -0,0 +1,8 @@
+import os
+from shot_lab import shot_video
+
+
+def test_default_out_next_to_the_checkout():
+    # the 3Drecons directory sits beside the repository, like lens_dist_calib
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    assert shot_video.parse_args(["--"]).out == os.path.join(os.path.dirname(root), "3Drecons")
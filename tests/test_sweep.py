@@ -0,0 +1,27 @@
+import numpy as np
+from shot_lab import sweep
+from shot_lab import traj_bin
+
+
+def anim_config(**settings):
+    return dict(sweep.JOBS["anim"]["defaults"], **settings)
+
+
+def shard_frames(shards):
+    return sorted({frame for shard in shards for frame in range(shard["frames"][0], shard["frames"][1] + 1)})
+
+
+def test_anim_shards_synthetic_trajectory():
+    shards = sweep.job_shards("anim", anim_config(num_frames=30, fps=60.))
+    assert shard_frames(shards) == list(range(30))
+    assert len(shards) == 2
+
+
+def test_anim_shards_follow_the_trajectory_file(tmp_path):
+    # 0.5 s sampled at 1 kHz: 13 frames at the default 24 fps, 31 at 60 fps
+    t = np.arange(501) / 1000.
+    np.savetxt(tmp_path / "traj.txt", np.column_stack((t, t, 0. * t, 0. * t)))
+    traj_bin.convert_txt(str(tmp_path / "traj.txt"), str(tmp_path / "traj.trj"), frame_rate=24.)
+    config = anim_config(num_frames=50, traj_path=str(tmp_path / "traj.trj"))
+    assert shard_frames(sweep.job_shards("anim", config)) == list(range(13))
+    assert shard_frames(sweep.job_shards("anim", dict(config, fps=60.))) == list(range(31))
@@ -0,0 +1,36 @@
+import numpy as np
+from shot_lab import shot_video
+from shot_lab import traj_bin
+from shot_lab import trajectories
+
+
+def write_capture(tmp_path, gap=slice(20, 23)):
+    t = np.arange(100) / 100.
+    traj = np.column_stack((t, t, np.sin(t), 0. * t))
+    traj[:5, 1:] = np.nan
+    traj[gap, 1:] = np.nan
+    np.savetxt(tmp_path / "traj.txt", traj)
+    return traj_bin.convert_txt(str(tmp_path / "traj.txt"), str(tmp_path / "traj.trj"), frame_rate=100.)
+
+
+def test_valid_rows_skip_interior_gaps(tmp_path):
+    traj = write_capture(tmp_path)
+    assert (traj.valid_start, traj.valid_stop) == (5, 100)
+    t, xyz = traj.valid()
+    assert len(t) == len(xyz) == 92
+    assert np.isfinite(xyz).all()
+    assert not np.isin(np.round(t * 100).astype(int), [20, 21, 22]).any()
+
+
+def test_shot_trajectory_without_gaps(tmp_path):
+    write_capture(tmp_path)
+    traj_t, positions, fps = shot_video.shot_trajectory(0, traj_path=str(tmp_path / "traj.trj"), fps=24.)
+    assert np.isfinite(positions).all()
+    _, times = trajectories.frame_times(traj_t[0], traj_t[-1], fps)
+    assert np.isfinite(trajectories.interpolate(traj_t, positions, times)).all()
+
+
+def test_valid_rows_are_views_without_gaps(tmp_path):
+    traj = write_capture(tmp_path, gap=slice(0))
+    _, xyz = traj.valid()
+    assert isinstance(xyz, np.memmap)
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+from shot_lab import traj_io
+
+
+def test_load_traj_drops_nan_rows(tmp_path):
+    path = str(tmp_path / "traj.txt")
+    with open(path, "w") as file:
+        file.write("0 nan nan nan\n0.1 1 2 3\n\n0.2 4 5 6\n")
+    assert traj_io.load_traj(path).tolist() == [[0.1, 1., 2., 3.], [0.2, 4., 5., 6.]]
+    chunks = list(traj_io.iter_traj_chunks(path, chunk_bytes=8))
+    assert np.concatenate(chunks).tolist() == [[0.1, 1., 2., 3.], [0.2, 4., 5., 6.]]
+
+
+@pytest.mark.parametrize("bad", ["0.3 7 8", "0.3 7 8 9 10", "0.3 7 x 9"])
+def test_bad_line_reported(tmp_path, bad):
+    # a short line followed by a long one keeps the total a multiple of 4 values
+    path = str(tmp_path / "traj.txt")
+    lines = ["%.1f 1 2 3" % (0.1 * i) for i in range(30)]
+    lines[20] = bad
+    lines[21] = "2.1 1 2 3 4" if bad == "0.3 7 8" else lines[21]
+    with open(path, "w") as file:
+        file.write("\n".join(lines) + "\n")
+    with pytest.raises(ValueError, match="traj.txt:21: .*%r" % bad):
+        traj_io.load_traj(path)
+    with pytest.raises(ValueError, match="traj.txt:21: "):
+        list(traj_io.iter_traj_chunks(path, chunk_bytes=64))
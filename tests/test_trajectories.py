@@ -0,0 +1,46 @@
+import math
+import numpy as np
+from shot_lab import trajectories
+
+
+def test_adaptive_flight_matches_fixed_step():
+    kwargs = dict(spin=(0., 0., 500.), spin_decay=2.)
+    fixed = trajectories.ballistic((-4., 0., 0.5), (80., 0., 3.), 0.1, 1e-5, tol=None, **kwargs)
+    flight = trajectories.ballistic((-4., 0., 0.5), (80., 0., 3.), 0.1, 1e-5, **kwargs)
+    assert len(flight) < len(fixed) // 10
+    assert flight.t[-1] == fixed.t[-1] == 0.1
+    t = trajectories.sample_times(0.1, 19000.)
+    assert np.abs(flight.sample(t) - fixed.sample(t)).max() < 1e-9
+
+
+def test_adaptive_flight_without_drag_is_a_parabola():
+    flight = trajectories.ballistic((-4., 0., 0.5), (80., 0., 3.), 0.1, drag=None)
+    t = trajectories.sample_times(0.1, 19000.)
+    assert np.abs(flight.sample(t) - trajectories.parabola(t, (-4., 0., 0.5), (80., 0., 3.))).max() < 1e-12
+
+
+def test_bounce_times():
+    flight = trajectories.ballistic((0., 0., 1.), (1., 0., 0.), 3., drag=None, ground=0., radius=0.02,
+                                    restitution=0.8)
+    g = trajectories.GRAVITY
+    first = math.sqrt(2 * 0.98 / g)
+    # each hop lasts 2 vz / g, the impact speed g first scaled by the restitution at every impact
+    expected = first + np.cumsum([2 * 0.8 ** k * first for k in range(1, 6)])
+    times = [impact[0] for impact in flight.impacts]
+    assert len(times) == 6
+    assert np.allclose(times, np.concatenate(([first], expected)), atol=1e-10)
+    assert all(impact[1][2] == 0.02 for impact in flight.impacts)
+
+
+def test_batch_matches_single_flights_with_impacts():
+    rng = np.random.default_rng(0)
+    v0 = np.array([2., 0., 3.]) + rng.normal(0., 1., (8, 3))
+    spins = rng.normal(0., 100., (8, 3))
+    kwargs = dict(spin_decay=1., ground=0., max_bounces=3)
+    batch = trajectories.ballistic_batch(np.tile((0., 0., 1.), (8, 1)), v0, 2., 1e-3, spin=spins, **kwargs)
+    for flight, launch, spin in zip(batch, v0, spins):
+        single = trajectories.ballistic((0., 0., 1.), launch, 2., 1e-3, spin=spin, **kwargs)
+        assert len(flight.impacts) == len(single.impacts) >= 2
+        assert np.allclose([i[0] for i in flight.impacts], [i[0] for i in single.impacts], atol=1e-9)
+        t = np.linspace(0., min(flight.t[-1], single.t[-1]), 500)
+        assert np.abs(flight.sample(t) - single.sample(t)).max() < 1e-8